@@ -0,0 +1,10 @@
+import asyncio
+from . import bench_pipe, bench_processor, bench_roundtrip, bench_feed, bench_schedule, bench_import, bench_streams, bench_offline
+
+
+async def main():
+    for bench in (bench_pipe, bench_processor, bench_roundtrip, bench_feed, bench_schedule, bench_import, bench_streams, bench_offline):
+        await bench.main()
+
+
+asyncio.run(main())
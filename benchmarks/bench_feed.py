@@ -0,0 +1,39 @@
+"""
+Encoding the positions fed to VASP: one f-string per value and one write per atom against a single formatting
+operation and a single write of the whole block
+"""
+import asyncio
+import numpy as np
+from interactive.vasp import format_positions
+from .common import NullWriter, Timer, report
+
+
+def feed_per_atom(positions, writer):
+    for coords in positions.tolist():
+        line = ' '.join(map(lambda x: f'{x:18.16f}', coords))
+        writer.write(f'{line}\n'.encode())
+
+
+def feed_block(positions, writer):
+    writer.write(format_positions(positions))
+
+
+def bench_feed(natoms, repeats):
+    positions = np.random.default_rng(0).random((natoms, 3))
+    writer = NullWriter()
+    for name, feed in (('per atom', feed_per_atom), ('block', feed_block)):
+        timings = []
+        for _ in range(repeats):
+            with Timer() as timer:
+                feed(positions, writer)
+            timings.append(timer.elapsed)
+        report(f'feed positions, {natoms} atoms, {name}', timings, unit='us', scale=1e6)
+
+
+async def main(repeats=200):
+    for natoms in (16, 256, 4096):
+        bench_feed(natoms, repeats)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
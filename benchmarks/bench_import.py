@@ -0,0 +1,55 @@
+"""
+Start-up cost of a driver: importing interactive.runner in a fresh interpreter and writing the input files natively
+or through pymatgen (if it is installed)
+"""
+import os
+import sys
+import asyncio
+import tempfile
+import importlib.util
+from .common import report
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WRITE_NATIVE = '''
+import numpy as np
+from interactive.inputs import write_inputs
+write_inputs({directory!r}, (4.05 * np.eye(3), ['Al'] * 4, np.zeros((4, 3))), dict(ENCUT=400), (4, 4, 4), {potcar!r})
+'''
+
+WRITE_PYMATGEN = '''
+import numpy as np
+from pymatgen.core import Structure
+from pymatgen.io.vasp import Poscar, Incar, Kpoints, Potcar
+Poscar(Structure(4.05 * np.eye(3), ['Al'] * 4, np.zeros((4, 3)))).write_file({directory!r} + '/POSCAR')
+Incar(dict(ENCUT=400)).write_file({directory!r} + '/INCAR')
+Kpoints.gamma_automatic((4, 4, 4)).write_file({directory!r} + '/KPOINTS')
+Potcar.from_file({potcar!r}).write_file({directory!r} + '/POTCAR')
+'''
+
+
+async def run_python(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (REPOSITORY, os.environ.get('PYTHONPATH')))))
+    start = asyncio.get_running_loop().time()
+    proc = await asyncio.create_subprocess_exec(sys.executable, '-c', code, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    if await proc.wait() != 0:
+        raise RuntimeError(f'{code!r} failed')
+    return asyncio.get_running_loop().time() - start
+
+
+async def bench(name, code, repeats):
+    report(name, [await run_python(code) for _ in range(repeats)], unit='ms', scale=1e3)
+
+
+async def main(repeats=10):
+    potcar = os.path.join(REPOSITORY, 'examples', 'mul-hpc', 'POTCAR')
+    await bench('interpreter start-up', 'pass', repeats)
+    await bench('import interactive.runner', 'import interactive.runner', repeats)
+    with tempfile.TemporaryDirectory() as directory:
+        await bench('import and write inputs, native', WRITE_NATIVE.format(directory=directory, potcar=potcar), repeats)
+        if importlib.util.find_spec('pymatgen') is not None:
+            await bench('import and write inputs, pymatgen', WRITE_PYMATGEN.format(directory=directory, potcar=potcar), repeats)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""
+Throughput of interactive.offline.parse_log on a recorded fake VASP log compared to feeding the same log line by
+line through VaspInteractiveProcess._main_processor
+"""
+import os
+import asyncio
+import tempfile
+from interactive.vasp import VaspInteractiveProcess
+from interactive.offline import parse_log
+from .common import Timer, NullHandle, recorded_steps, report_rate, FAKE_VASP
+
+
+async def bench_offline(steps, natoms, noise, scf_steps=12, repeats=3):
+    recorded, vasp = recorded_steps(steps, natoms=natoms, scf_steps=scf_steps, noise=noise)
+    lines = [line for step in recorded for line in step]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'vasp.out')
+        with open(path, 'wb') as h:
+            h.writelines(lines)
+        size = os.path.getsize(path) / 2 ** 20
+        live, offline = [], []
+        for _ in range(repeats):
+            proc = VaspInteractiveProcess(lambda p: vasp.reference, FAKE_VASP, stdout=(), stderr=())
+            proc._handle = NullHandle()
+            process = proc._main_processor
+            with Timer() as t:
+                with open(path, 'rb') as h:
+                    for line in h:
+                        process(line)
+            live.append(t.elapsed)
+            # the processor schedules the feed of the next structure, let it run outside of the timed section
+            await asyncio.sleep(0)
+            with Timer() as t:
+                trajectory = parse_log(path)
+            offline.append(t.elapsed)
+        assert len(trajectory) == len(proc.ionic_steps) == steps, 'not all ionic steps were parsed'
+    name = f'{natoms} atoms, noise {noise}'
+    report_rate(f'_main_processor, {name}', len(lines), min(live))
+    report_rate(f'parse_log, {name}', len(lines), min(offline))
+    report_rate(f'parse_log, {name}', size, min(offline), unit='MiB/s')
+
+
+async def main(steps=2000):
+    for natoms, noise in ((16, 0), (512, 0), (64, 100)):
+        await bench_offline(steps, natoms, noise)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Throughput of aio.forking_pipe, once for an in-memory stream and once for the stdout of the fake VASP
+"""
+import asyncio
+import tempfile
+from interactive.aio import forking_pipe, DEFAULT_CHUNK_SIZE
+from interactive.interactive import InteractiveProcess
+from .common import closed_stdin, Timer, NullWriter, recorded_steps, stream_reader, fake_vasp_command, report_rate
+
+
+async def bench_memory(steps, natoms, noise):
+    recorded, _ = recorded_steps(steps, natoms=natoms, noise=noise)
+    lines = [line for step in recorded for line in step]
+    data = b''.join(lines)
+    for name, processors in (('no processors', ()), ('one processor', (lambda line: None,))):
+        for chunk_size in (None, DEFAULT_CHUNK_SIZE):
+            reader = stream_reader(data)
+            with Timer() as t:
+                await forking_pipe(reader, (NullWriter(),), line_processors=processors, chunk_size=chunk_size)
+            mode = 'chunked' if chunk_size else 'lines'
+            report_rate(f'forking_pipe memory, {mode}, {name}', len(lines), t.elapsed)
+
+
+async def bench_process(steps, natoms, noise, chunk_size=None):
+    counter = NullWriter()
+    lines = 0
+
+    def count(_):
+        nonlocal lines
+        lines += 1
+
+    command = fake_vasp_command(natoms=natoms, noise=noise, max_steps=steps)
+    with tempfile.TemporaryDirectory() as directory, closed_stdin() as stdin:
+        with Timer() as t:
+            async with InteractiveProcess(command, directory=directory, stdin=stdin, stdout=(), stderr=(), stdout_proc=count, chunk_size=chunk_size) as proc:
+                await proc.wait()
+    report_rate(f'forking_pipe fake VASP stdout, {"chunked" if chunk_size else "lines"}', lines, t.elapsed)
+
+
+async def main(steps=200, natoms=64, noise=50):
+    await bench_memory(steps, natoms, noise)
+    # the fake VASP stops after the first step since its stdin is closed
+    for chunk_size in (None, DEFAULT_CHUNK_SIZE):
+        await bench_process(1, natoms * steps, noise * steps, chunk_size=chunk_size)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Per ionic step latency of VaspInteractiveProcess._main_processor fed with a recorded fake VASP stream
+"""
+import asyncio
+from interactive.vasp import VaspInteractiveProcess
+from .common import Timer, NullHandle, recorded_steps, report, report_rate, FAKE_VASP
+
+
+async def bench_processor(steps, natoms, noise, scf_steps=12, batched=False):
+    recorded, vasp = recorded_steps(steps, natoms=natoms, scf_steps=scf_steps, noise=noise)
+    proc = VaspInteractiveProcess(lambda p: vasp.reference, FAKE_VASP, stdout=(), stderr=())
+    proc._handle = NullHandle()
+    process = proc._main_processor
+    latencies = []
+    for lines in recorded:
+        with Timer() as t:
+            if batched:
+                # as called by forking_pipe in chunked mode
+                proc._process_lines(lines)
+            else:
+                for line in lines:
+                    process(line)
+        latencies.append(t.elapsed)
+        # let tasks scheduled by the processor run outside of the timed section
+        await asyncio.sleep(0)
+    assert len(proc.ionic_steps) == steps, 'the processor did not parse all ionic steps'
+    mode = 'batched' if batched else 'lines'
+    report(f'_main_processor step, {mode}, {natoms} atoms, noise {noise}', latencies, unit='ms', scale=1e3)
+    report_rate(f'_main_processor, {mode}, {natoms} atoms, noise {noise}', sum(map(len, recorded)), sum(latencies))
+
+
+async def main(steps=200):
+    for natoms, noise in ((16, 0), (512, 0), (64, 100)):
+        for batched in (False, True):
+            await bench_processor(steps, natoms, noise, batched=batched)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
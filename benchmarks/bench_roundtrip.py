@@ -0,0 +1,51 @@
+"""
+Round trip from the positions request of the fake VASP to the first SCF row of the next ionic step
+"""
+import time
+import asyncio
+import tempfile
+from interactive import ScfStepCompleted
+from interactive.vasp import VaspInteractiveProcess
+from .common import closed_stdin, fake_vasp_command, report
+
+POSITIONS_REQUEST = b'POSITIONS: reading from stdin'
+
+
+async def bench_roundtrip(steps, natoms):
+    requested = None
+    roundtrips = []
+
+    def timestamp(line):
+        nonlocal requested
+        if line.startswith(POSITIONS_REQUEST):
+            requested = time.perf_counter()
+
+    def first_scf_row(ionic_step, scf_step, data=None):
+        nonlocal requested
+        if scf_step == 1 and requested is not None:
+            roundtrips.append(time.perf_counter() - requested)
+            requested = None
+
+    structures = iter(range(steps))
+
+    def next_structure(process):
+        next(structures)
+        return reference
+
+    from interactive.fake import reference_positions
+    reference = reference_positions(natoms)
+    with tempfile.TemporaryDirectory() as directory, closed_stdin() as stdin:
+        proc = VaspInteractiveProcess(next_structure, fake_vasp_command(natoms=natoms), directory=directory, stdin=stdin, stdout=(), stderr=(), stdout_proc=timestamp)
+        proc.register_callback(ScfStepCompleted, first_scf_row)
+        async with proc:
+            await proc.wait()
+    report(f'positions request to first SCF row, {natoms} atoms', roundtrips, unit='ms', scale=1e3)
+
+
+async def main(steps=200):
+    for natoms in (16, 512):
+        await bench_roundtrip(steps, natoms)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
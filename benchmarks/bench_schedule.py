@@ -0,0 +1,51 @@
+"""
+SCF iterations of a shuffled batch of displaced structures (a few displacement patterns scanned over a range of
+amplitudes) fed in input order and in the scheduled order.
+The fake VASP is run with --scf-threshold, it needs fewer SCF iterations the closer a structure is to the previous one
+"""
+import asyncio
+import tempfile
+import numpy as np
+from interactive import IonicStepFinished
+from interactive.vasp import VaspInteractiveProcess
+from interactive.fake import reference_positions
+from interactive.schedule import schedule_order
+from .common import closed_stdin, fake_vasp_command, Timer
+
+SCF_STEPS = 16
+
+
+async def total_scf_iterations(structures, natoms):
+    nscf = []
+
+    def ionic_step_finished(ionic_step, data=None, scf_steps=None):
+        nscf.append(scf_steps)
+
+    with tempfile.TemporaryDirectory() as directory, closed_stdin() as stdin:
+        proc = VaspInteractiveProcess(iter(structures), fake_vasp_command(natoms=natoms, scf_steps=SCF_STEPS, scf_threshold=0.05), directory=directory, stdin=stdin, stdout=(), stderr=())
+        proc.register_callback(IonicStepFinished, ionic_step_finished)
+        async with proc:
+            await proc.wait()
+    # the first step is the reference structure, the last one is repeated after the STOPCAR
+    return sum(nscf[1:len(structures) + 1])
+
+
+async def main(nstructures=200, natoms=16, patterns=4, amplitude=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    reference = np.array(reference_positions(natoms))
+    modes = rng.uniform(-1.0, 1.0, (patterns,) + reference.shape)
+    amplitudes = np.linspace(-amplitude, amplitude, nstructures // patterns)
+    structures = [reference + a * mode for mode in modes for a in amplitudes]
+    structures = [structures[i] for i in rng.permutation(len(structures))]
+    nstructures = len(structures)
+    with Timer() as timer:
+        order = schedule_order(structures)
+    scheduled = [structures[i] for i in order]
+    unordered = await total_scf_iterations(structures, natoms)
+    ordered = await total_scf_iterations(scheduled, natoms)
+    print(f'{"SCF iterations, " + str(nstructures) + " structures, input order":56s} {unordered:14d} ({unordered / nstructures:.2f} per step)')
+    print(f'{"SCF iterations, scheduled order":56s} {ordered:14d} ({ordered / nstructures:.2f} per step, scheduled in {timer.elapsed:.3f} s)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
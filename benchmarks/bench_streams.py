@@ -0,0 +1,41 @@
+"""
+forking_pipe in line mode into a regular file and out of an in-memory stream, with the per-call NonFile* streams
+and with the buffered streams used by create_standard_streams
+"""
+import io
+import asyncio
+import tempfile
+from interactive.aio import forking_pipe, NonFileStreamReader, NonFileStreamWriter, BufferedStreamReader, BufferedStreamWriter
+from .common import Timer, NullWriter, recorded_steps, stream_reader, report_rate
+
+
+async def bench_writers(data, nlines):
+    for name, writer_type in (('NonFileStreamWriter', NonFileStreamWriter), ('BufferedStreamWriter', BufferedStreamWriter)):
+        with tempfile.TemporaryFile('w') as target:
+            writer = writer_type(target)
+            with Timer() as t:
+                # drained as often as in a run with the default high water mark
+                await forking_pipe(stream_reader(data), (writer,), high_water=2 ** 18)
+                if hasattr(writer, 'aclose'):
+                    await writer.aclose()
+            report_rate(f'forking_pipe to a file, {name}', nlines, t.elapsed)
+
+
+async def bench_readers(data, nlines):
+    for name, reader_type in (('NonFileStreamReader', NonFileStreamReader), ('BufferedStreamReader', BufferedStreamReader)):
+        reader = reader_type(io.BytesIO(data))
+        with Timer() as t:
+            await forking_pipe(reader, (NullWriter(),))
+        report_rate(f'forking_pipe from BytesIO, {name}', nlines, t.elapsed)
+
+
+async def main(steps=100, natoms=64, noise=50):
+    recorded, _ = recorded_steps(steps, natoms=natoms, noise=noise)
+    lines = [line for step in recorded for line in step]
+    data = b''.join(lines)
+    await bench_writers(data, len(lines))
+    await bench_readers(data, len(lines))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
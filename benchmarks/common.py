@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import shlex
+import asyncio
+import statistics
+from interactive import fake
+
+FAKE_VASP = f'{shlex.quote(sys.executable)} {shlex.quote(os.path.abspath(fake.__file__))}'
+
+
+def fake_vasp_command(**options):
+    # True stands for a flag without a value
+    flags = ' '.join(f'--{k.replace("_", "-")}' + ('' if v is True else f' {v}') for k, v in options.items() if v is not None and v is not False)
+    return f'{FAKE_VASP} {flags}'.strip()
+
+
+def recorded_steps(steps, natoms=32, scf_steps=12, noise=0):
+    """
+    Records the stdout of the fake VASP as a list of ionic steps, each item is a list of lines (bytes)
+    including the positions request which follows the step
+    """
+    vasp = fake.FakeVasp(natoms=natoms, scf_steps=scf_steps, noise=noise)
+    recorded = []
+    for step in range(steps):
+        lines = list(vasp.preamble()) if step == 0 else []
+        lines.extend(vasp.ionic_step(vasp.reference))
+        lines.extend(('POSITIONS: reading from stdin', 'POSITIONS: read from stdin'))
+        recorded.append([f'{line}\n'.encode() for line in lines])
+    return recorded, vasp
+
+
+class NullWriter(object):
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    async def drain(self):
+        pass
+
+
+class NullHandle(object):
+    """
+    Takes the place of the process handle if the stdout processor is benchmarked without a process
+    """
+
+    def __init__(self):
+        self.stdin = NullWriter()
+        self.returncode = None
+
+
+def closed_stdin():
+    """
+    A pipe at EOF, used as the stdin of the driver. /dev/null cannot be registered with epoll
+    """
+    read, write = os.pipe()
+    os.close(write)
+    return os.fdopen(read, 'rb')
+
+
+def stream_reader(data):
+    reader = asyncio.StreamReader(limit=2 ** 20)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class Timer(object):
+
+    def __init__(self):
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(name, values, unit='s', scale=1.0):
+    values = sorted(v * scale for v in values)
+    if not values:
+        print(f'{name:56s} no samples')
+        return
+    p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+    print(f'{name:56s} median {statistics.median(values):12.3f} {unit:6s} mean {statistics.fmean(values):12.3f} {unit:6s} p95 {p95:12.3f} {unit}')
+
+
+def report_rate(name, count, elapsed, unit='lines/s'):
+    # a float count is an amount in the unit of the rate, e.g. 12.5 for MiB/s
+    if isinstance(count, float):
+        print(f'{name:56s} {count / elapsed:14.1f} {unit} ({count:.1f} {unit.split("/")[0]} in {elapsed:.3f} s)')
+    else:
+        print(f'{name:56s} {count / elapsed:14.0f} {unit} ({count} in {elapsed:.3f} s)')
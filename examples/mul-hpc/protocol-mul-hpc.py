@@ -68,6 +68,10 @@ def ionic_step_finished(*args, **kwargs):
     pass
 
 if __name__ == '__main__':
+    logging.basicConfig(
+        format = '▸ %(asctime)s.%(msecs)03d %(filename)s:%(lineno)d %(levelname)s %(message)s',
+        level = logging.INFO,
+        datefmt = '%H:%M:%S')
     execute_coro(
         run_vasp_calculation(
             next_structure, 
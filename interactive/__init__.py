@@ -2,6 +2,8 @@
 from .utils import ensure_iterable_of_type
 from .vasp import VaspInteractiveProcess
 from .interactive import InteractiveProcess
+from .trajectory import Trajectory, Retention
+from .structures import StructureSource
 
 Callbacks = VaspInteractiveProcess.Callback
 MainLoopStarted = VaspInteractiveProcess.Callback.MainLoopStarted
@@ -10,6 +12,7 @@ IonicStepFinished = VaspInteractiveProcess.Callback.IonicStepFinished
 ScfStepCompleted = VaspInteractiveProcess.Callback.ScfStepCompleted
 NextStructure = VaspInteractiveProcess.Callback.NextStructure
 IonForceRead = VaspInteractiveProcess.Callback.IonForceRead
+ForcesRead = VaspInteractiveProcess.Callback.ForcesRead
 FeedPositionsStarted = VaspInteractiveProcess.Callback.FeedPositionsStarted
 FeedPositionsFinished = VaspInteractiveProcess.Callback.FeedPositionsFinished
 Exit = VaspInteractiveProcess.Callback.Exit
@@ -1,12 +1,19 @@
 import os
 import sys
 import stat
+import queue
+import codecs
+import inspect
 import logging
 import asyncio
+import threading
 
 PY37 = sys.version_info >= (3, 7)
 platform = sys.platform
 
+DEFAULT_CHUNK_SIZE = 2 ** 16
+DEFAULT_HIGH_WATER = 2 ** 18
+
 def is_pipe_transport_compatible(pipe):
     if platform == "win32":
         return False
@@ -126,7 +133,8 @@ class NonFileStreamWriter:
         self.stream = stream
 
     def write(self, data):
-        if isinstance(data, bytes):
+        # streams flagged as binary accept bytes, e.g. the sinks in interactive.sinks
+        if isinstance(data, bytes) and not getattr(self.stream, 'binary', False):
             data = data.decode()
         self.stream.write(data)
 
@@ -139,13 +147,191 @@ class NonFileStreamWriter:
             await self.loop.run_in_executor(None, flush)
 
 
+def block_reader(stream):
+    # read1 returns what is available instead of waiting for a full block. For a text stream the binary buffer below
+    # it is read, what the text layer already buffered (e.g. after a readline() or input() on it) is skipped
+    raw = getattr(stream, 'buffer', stream)
+    return getattr(raw, 'read1', None) or stream.read
+
+
+class BufferedStreamReader:
+    """
+    Reads a stream which cannot be attached to the event loop in blocks, one executor round trip per block
+    instead of per line. A text stream, e.g. sys.stdin, is read through its binary buffer, lines which were read
+    through the text stream before are not seen and the text stream must not be read while this reader is in use
+    """
+
+    def __init__(self, stream, *, loop=None, block_size=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.stream = stream
+        self._read_block = block_reader(stream)
+        self._block_size = block_size or DEFAULT_CHUNK_SIZE
+        self._buffer = bytearray()
+        self._eof = False
+
+    def at_eof(self):
+        return self._eof and not self._buffer
+
+    async def _fill(self):
+        data = await self.loop.run_in_executor(None, self._read_block, self._block_size)
+        if isinstance(data, str):
+            data = data.encode()
+        if data:
+            self._buffer += data
+        else:
+            self._eof = True
+
+    async def readline(self):
+        end = self._buffer.find(b'\n') + 1
+        while not end and not self._eof:
+            start = len(self._buffer)
+            await self._fill()
+            end = self._buffer.find(b'\n', start) + 1
+        end = end or len(self._buffer)
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    async def read(self, n=-1):
+        if n < 0:
+            while not self._eof:
+                await self._fill()
+            n = len(self._buffer)
+        elif not self._buffer and not self._eof:
+            await self._fill()
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        val = await self.readline()
+        if val == b"":
+            raise StopAsyncIteration
+        return val
+
+
+class BufferedStreamWriter:
+    """
+    Writes to a stream which cannot be attached to the event loop (a regular file, StringIO, a Jupyter stream).
+    Writes are coalesced into blocks of block_size bytes which a dedicated thread writes and flushes, a partial
+    block is handed over after flush_interval seconds. drain() waits until everything written so far is flushed
+    """
+
+    def __init__(self, stream, *, loop=None, block_size=None, flush_interval=0.1):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.stream = stream
+        # streams flagged as binary accept bytes, e.g. the sinks in interactive.sinks
+        self._decoder = None if getattr(stream, 'binary', False) else codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._block_size = block_size or DEFAULT_CHUNK_SIZE
+        self._flush_interval = flush_interval
+        self._flush_handle = None
+        self._buffer = []
+        self._buffered = 0
+        self._queue = queue.SimpleQueue()
+        self._submitted = 0
+        self._written = 0
+        self._waiters = []
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f'BufferedStreamWriter({getattr(stream, "name", type(stream).__name__)})', daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        if self._error is not None:
+            raise self._error
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._block_size:
+            self._submit()
+        elif self._flush_handle is None and self._flush_interval is not None:
+            self._flush_handle = self.loop.call_later(self._flush_interval, self._submit)
+
+    def _submit(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer:
+            return
+        block = b''.join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+        self._submitted += 1
+        self._queue.put(block)
+
+    def _run(self):
+        done = False
+        while not done:
+            blocks = [self._queue.get()]
+            # coalesce whatever is waiting into a single write
+            while blocks[-1] is not None:
+                try:
+                    blocks.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = blocks[-1] is None
+            if done:
+                blocks.pop()
+            try:
+                if self._error is None and blocks:
+                    data = b''.join(blocks)
+                    self.stream.write(data if self._decoder is None else self._decoder.decode(data))
+                    flush = getattr(self.stream, 'flush', None)
+                    if flush is not None:
+                        flush()
+            except Exception as e:
+                self._error = e
+            self._written += len(blocks)
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # the loop is closed already
+                pass
+
+    def _wake(self):
+        waiting = []
+        for count, future in self._waiters:
+            if self._written >= count or self._error is not None:
+                if not future.done():
+                    future.set_result(None)
+            else:
+                waiting.append((count, future))
+        self._waiters = waiting
+
+    async def drain(self):
+        self._submit()
+        if self._written < self._submitted and self._error is None:
+            future = self.loop.create_future()
+            self._waiters.append((self._submitted, future))
+            await future
+        if self._error is not None:
+            raise self._error
+
+    async def aclose(self):
+        if self._closed:
+            return
+        await self.drain()
+        self._closed = True
+        self._queue.put(None)
+        await self.loop.run_in_executor(None, self._thread.join)
+
+
 async def open_standard_pipe_connection(pipe_in, pipes_out, pipes_err, *, loop=None):
     if loop is None:
         loop = asyncio.get_event_loop()
     # Reader
     in_reader = StandardStreamReader(loop=loop)
     protocol = StandardStreamReaderProtocol(in_reader, loop=loop)
-    await loop.connect_read_pipe(lambda: protocol, pipe_in)
+    if pipe_in is not None:
+        await loop.connect_read_pipe(lambda: protocol, pipe_in)
     # Out writer
 
     async def make_out_pipe(pipe_out):
@@ -171,11 +357,12 @@ async def open_standard_pipe_connection(pipe_in, pipes_out, pipes_err, *, loop=N
         writer = await make_err_pipe(pipe)
         error_writers.append(writer)
 
-    return in_reader, tuple(output_writers), tuple(error_writers)
+    return in_reader if pipe_in is not None else None, tuple(output_writers), tuple(error_writers)
 
 def flatten_streams(*streams):
     stdin, stdout, stderr = streams
-    yield stdin
+    if stdin is not None:
+        yield stdin
     for stdout_ in (stdout or ()):
         yield stdout_
     for stderr_ in (stderr or ()):
@@ -185,31 +372,141 @@ async def create_standard_streams(stdin, stdout, stderr, *, loop=None):
     if all(map(is_pipe_transport_compatible, tuple(flatten_streams(stdin, stdout, stderr)))):
         return await open_standard_pipe_connection(stdin, stdout, stderr, loop=loop)
     return (
-        NonFileStreamReader(stdin, loop=loop) if stdin is not None else stdin,
-        list(NonFileStreamWriter(stdout_stream, loop=loop) for stdout_stream in stdout),
-        list(NonFileStreamWriter(stderr_stream, loop=loop) for stderr_stream in stderr)
+        BufferedStreamReader(stdin, loop=loop) if stdin is not None else stdin,
+        list(BufferedStreamWriter(stdout_stream, loop=loop) for stdout_stream in stdout),
+        list(BufferedStreamWriter(stderr_stream, loop=loop) for stderr_stream in stderr)
     )
 
-async def forking_pipe(reader, writers, line_processors = None):
+
+async def close_standard_streams(streams):
+    # only the buffered writers are closed, the pipe writers wrap our own stdout and stderr
+    _, stdout, stderr = streams
+    for writer in (*stdout, *stderr):
+        if hasattr(writer, 'aclose'):
+            await writer.aclose()
+
+
+class BatchProcessor(object):
+    """
+    A line processor which can also consume a list of lines at once, used by forking_pipe in chunked mode
+    """
+
+    def __init__(self, process_line, process_batch):
+        self.process_line = process_line
+        self.process_batch = process_batch
+
+    def __call__(self, line):
+        return self.process_line(line)
+
+
+class Deferred(object):
+    """
+    Calls the coroutine function f only once it is awaited, a processor returns it to hold the pipe without
+    leaving a coroutine behind which is never awaited if its result is dropped
+    """
+
+    def __init__(self, f, *args):
+        self._f = f
+        self._args = args
+
+    def __await__(self):
+        return self._f(*self._args).__await__()
+
+
+def awaitable_result(result):
+    # a processor returns an awaitable to hold the pipe until it resolves, e.g. a full callback queue
+    return result if result is not None and inspect.isawaitable(result) else None
+
+
+def process_lines(line_processors, lines):
+    """
+    :return: (list) the awaitables returned by the processors
+    """
+    waits = []
+    for processor in line_processors:
+        process_batch = getattr(processor, 'process_batch', None)
+        if process_batch is not None:
+            results = (process_batch(lines),)
+        else:
+            results = [processor(line) for line in lines]
+        waits.extend(filter(None, map(awaitable_result, results)))
+    return waits
+
+
+async def drain_writers(writers):
+    for writer in writers:
+        if hasattr(writer, 'drain'):
+            await writer.drain()
+
+
+async def forking_pipe(reader, writers, line_processors = None, chunk_size=None, high_water=None):
+    """
+    Forwards everything read from reader to the writers and calls the line processors for each line.
+    If chunk_size is given, blocks of at most chunk_size bytes are read and written at once, the processors
+    get the complete lines of a block in a batch. Writers are drained whenever more than high_water bytes
+    were written since the last drain
+    """
     line_processors = () if line_processors is None else line_processors
+    if chunk_size:
+        return await forking_pipe_chunked(reader, writers, line_processors, chunk_size, high_water or DEFAULT_HIGH_WATER)
+    pending = 0
     while not reader.at_eof():
         msg = await reader.readline()
         # finally forward the msg to the writer
         for processor in line_processors:
-            processor(msg)
+            wait = awaitable_result(processor(msg))
+            if wait is not None:
+                await wait
         for writer in writers:
             writer.write(msg)
-    for writer in writers: 
-        if hasattr(writer, 'drain'):
-            await writer.drain()
+        if high_water is not None:
+            pending += len(msg)
+            if pending >= high_water:
+                await drain_writers(writers)
+                pending = 0
+    await drain_writers(writers)
+
+
+async def forking_pipe_chunked(reader, writers, line_processors, chunk_size, high_water):
+    remainder = b''
+    pending = 0
+    while True:
+        chunk = await reader.read(chunk_size)
+        if not chunk:
+            break
+        if remainder:
+            chunk = remainder + chunk
+        end = chunk.rfind(b'\n') + 1
+        # only complete lines are forwarded, an incomplete one is kept until the next chunk
+        data, remainder = chunk[:end], chunk[end:]
+        if not data:
+            continue
+        waits = process_lines(line_processors, data.splitlines(keepends=True))
+        for writer in writers:
+            writer.write(data)
+        for wait in waits:
+            await wait
+        pending += len(data)
+        if pending >= high_water:
+            await drain_writers(writers)
+            pending = 0
+    if remainder:
+        waits = process_lines(line_processors, (remainder,))
+        for writer in writers:
+            writer.write(remainder)
+        for wait in waits:
+            await wait
+    await drain_writers(writers)
 
 
 def execute_coro(coro):
     loop = asyncio.get_event_loop()
     logging.debug('Creating the problem task')
     logging.debug('Running the loop')
+    result = None
     try:
-        loop.run_until_complete(coro)
+        result = loop.run_until_complete(coro)
     except KeyboardInterrupt:
         logging.info('Closing the loop')
-    logging.info('Shutting down')
\ No newline at end of file
+    logging.info('Shutting down')
+    return result
\ No newline at end of file
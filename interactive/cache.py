@@ -0,0 +1,177 @@
+"""
+Persistent cache of ionic step results. A result is keyed by the positions rounded to a tolerance and by a
+digest of the input set (INCAR, KPOINTS, POTCAR and the lattice and species part of the POSCAR), it is
+stored in a SQLite database and the least recently used entries are evicted once the database grows
+beyond max_size bytes. The total size is kept up to date by triggers in a one-row table, the access times of
+hits are written in batches
+
+    cache = ResultCache('results.sqlite', max_size=2**30)
+    await run_vasp_calculation(gen_structure, incar, kpoints, potcar, cache=cache)
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import numpy as np
+
+INPUT_FILES = ('INCAR', 'KPOINTS', 'POTCAR', 'POSCAR')
+# comment line, scaling factor, three lattice vectors, species and counts
+POSCAR_HEADER_LINES = slice(1, 7)
+
+
+def input_set_digest(directory, names=INPUT_FILES):
+    """
+    Hashes the input files written to directory. Only the lattice and species of the POSCAR are taken into
+    account since the positions are part of each cache key
+    """
+    digest = hashlib.sha256()
+    for name in names:
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as h:
+            content = h.read()
+        if name == 'POSCAR':
+            content = b'\n'.join(line.strip() for line in content.splitlines()[POSCAR_HEADER_LINES])
+        digest.update(name.encode())
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    On-disk LRU cache mapping (input set, positions) to the summary and forces of an ionic step
+    """
+
+    def __init__(self, path, max_size=2**30, tolerance=1e-6, access_batch=64):
+        """
+        :param path: (str) the SQLite database
+        :param max_size: (int) the size in bytes of the stored results above which entries are evicted (default: 1 GiB)
+        :param tolerance: (float) positions are rounded to multiples of tolerance in fractional coordinates (default: 1e-6)
+        :param access_batch: (int) hits whose access times are collected before they are written (default: 64)
+        """
+        self._path = path
+        self._max_size = max_size
+        self._tolerance = tolerance
+        self._access_batch = access_batch
+        self._accessed = {}
+        self._hits = 0
+        self._misses = 0
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, summary TEXT, forces BLOB, nscf INTEGER, size INTEGER, accessed REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+            # the total size, a database written before the table existed is summed up once
+            self._connection.execute('CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)')
+            self._connection.execute('INSERT OR IGNORE INTO meta (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM results')
+            self._connection.executescript('''
+                CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results
+                    BEGIN UPDATE meta SET total = total + NEW.size; END;
+                CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results
+                    BEGIN UPDATE meta SET total = total - OLD.size; END;
+                CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results
+                    BEGIN UPDATE meta SET total = total + NEW.size - OLD.size; END;
+            ''')
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def key(self, inputs, positions):
+        positions = np.asarray(positions, dtype=np.float64)
+        # wrapped into the unit cell, such that 0.9999999 and 0.0 map to the same grid point
+        steps = round(1.0 / self._tolerance)
+        grid = np.rint(np.mod(positions, 1.0) * steps).astype(np.int64) % steps
+        digest = hashlib.sha256(inputs.encode())
+        digest.update(np.ascontiguousarray(grid).tobytes())
+        return digest.hexdigest()
+
+    def get(self, inputs, positions):
+        """
+        :return: (dict) the summary, forces and nscf of the cached step or None
+        """
+        key = self.key(inputs, positions)
+        row = self._connection.execute('SELECT summary, forces, nscf FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._accessed[key] = time.time()
+        if len(self._accessed) >= self._access_batch:
+            self.flush()
+        summary, forces, nscf = row
+        forces = None if forces is None else np.frombuffer(forces, dtype=np.float64).reshape(-1, 3)
+        return dict(summary=json.loads(summary), forces=forces, nscf=nscf)
+
+    def put(self, inputs, positions, summary, forces=None, nscf=None):
+        key = self.key(inputs, positions)
+        summary = json.dumps(summary)
+        forces = None if forces is None else np.ascontiguousarray(forces, dtype=np.float64).tobytes()
+        size = len(key) + len(summary) + (0 if forces is None else len(forces))
+        # an upsert rather than a replace, the triggers see the old size as an update
+        self._connection.execute(
+            'INSERT INTO results (key, summary, forces, nscf, size, accessed) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET summary = excluded.summary, forces = excluded.forces, nscf = excluded.nscf, '
+            'size = excluded.size, accessed = excluded.accessed',
+            (key, summary, forces, nscf, size, time.time()))
+        self._evict()
+        self._connection.commit()
+
+    def flush(self):
+        """
+        Writes the access times of the hits collected so far
+        """
+        if not self._accessed:
+            return
+        self._write_accessed()
+        self._connection.commit()
+
+    def _write_accessed(self):
+        accessed, self._accessed = self._accessed, {}
+        self._connection.executemany('UPDATE results SET accessed = ? WHERE key = ?', [(t, key) for key, t in accessed.items()])
+
+    def _evict(self):
+        total = self.size
+        if total <= self._max_size:
+            return
+        # the least recently used entries are chosen with the latest access times
+        self._write_accessed()
+        evicted = []
+        for key, size in self._connection.execute('SELECT key, size FROM results ORDER BY accessed'):
+            if total <= self._max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+    @property
+    def size(self):
+        return self._connection.execute('SELECT total FROM meta').fetchone()[0]
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        self._connection.execute('DELETE FROM results')
+        self._connection.commit()
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,80 @@
+"""
+An ASE calculator backed by a ComputeSession. The interactive VASP process is started with the first calculation
+and reused as long as only the positions change, a new cell or new species restart it
+
+    atoms.calc = VaspInteractiveCalculator(dict(ENCUT=400, ISMEAR=0), (4, 4, 4), 'POTCAR', directory='calc')
+    BFGS(atoms).run(fmax=0.01)
+    atoms.calc.close()
+
+The session runs on an event loop in a background thread, hence the calculator also works where a loop is
+already running, e.g. in Jupyter
+"""
+import os
+import asyncio
+import threading
+import numpy as np
+from ase.calculators.calculator import Calculator, all_changes
+from .compute import ComputeSession
+
+# changes which require a new POSCAR and therefore a new VASP process
+RESTART_CHANGES = ('cell', 'pbc', 'numbers')
+
+
+class VaspInteractiveCalculator(Calculator):
+
+    implemented_properties = ['energy', 'free_energy', 'forces']
+
+    def __init__(self, incar, kpoints, potcar, directory=os.getcwd(), session_options=None, **kwargs):
+        """
+        :param incar, kpoints, potcar: the inputs as accepted by run_vasp_calculation
+        :param directory: (str) the calculation directory (default: os.getcwd())
+        :param session_options: (dict) passed on to ComputeSession, e.g. executable or stdout (default: None)
+        """
+        super().__init__(**kwargs)
+        self._inputs = (incar, kpoints, potcar)
+        self._vasp_directory = directory
+        self._session_options = session_options or {}
+        self._session = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def session(self):
+        return self._session
+
+    def _run(self, coro):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='vasp-interactive', daemon=True)
+            self._thread.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def calculate(self, atoms=None, properties=('energy',), system_changes=all_changes):
+        super().calculate(atoms, properties, system_changes)
+        if self._session is not None and any(change in system_changes for change in RESTART_CHANGES):
+            self._run(self._session.close())
+            self._session = None
+        # unwrapped like the later positions, the POSCAR and the fed positions agree for atoms outside the cell
+        positions = self.atoms.get_scaled_positions(wrap=False)
+        if self._session is None or not self._session.running:
+            structure = (np.array(self.atoms.get_cell()), self.atoms.get_chemical_symbols(), positions)
+            self._session = ComputeSession(structure, *self._inputs, directory=self._vasp_directory, **self._session_options)
+            # the first structure is the POSCAR, VASP computes it on start
+            data = self._run(self._session.start())
+        else:
+            data = self._run(self._session.compute_step(positions))
+        summary = data['summary']
+        self.results = dict(energy=summary['E0'], free_energy=summary['F'], forces=np.array(data['forces'], dtype=np.float64))
+
+    def close(self):
+        """
+        Stops VASP and the event loop thread
+        """
+        if self._session is not None:
+            self._run(self._session.close())
+            self._session = None
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop, self._thread = None, None
@@ -0,0 +1,177 @@
+"""
+Request/response use of a persistent interactive VASP process. Instead of VASP pulling structures through
+next_structure, the caller pushes positions and awaits the result, VASP stays alive between the calls
+
+    async with ComputeSession(structure, incar, kpoints, potcar, directory='calc') as session:
+        initial = await session.initial          # the step VASP computed for the POSCAR
+        energy, forces = await session.compute(positions)
+
+Requests are queued and computed in the order they were made, each one is resolved when its ionic step is
+finished. The structure given to the session is the POSCAR, it fixes the lattice and the species. Positions are
+fractional coordinates, anything run_vasp_calculation accepts as structure works as well
+"""
+import os
+import asyncio
+import collections
+from .vasp import VaspInteractiveProcess
+from .runner import run_vasp_calculation, to_positions, merge_callbacks
+
+
+class SessionClosed(RuntimeError):
+    pass
+
+
+def resolve(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class ComputeSession(object):
+
+    def __init__(self, structure, incar, kpoints, potcar, directory=os.getcwd(), callbacks=None, **kwargs):
+        """
+        :param structure: (object) the structure written as POSCAR and computed when the session starts
+        :param callbacks: (dict) callbacks registered with the process (default: None)
+        :param kwargs: passed on to run_vasp_calculation
+        """
+        self._structure = structure
+        self._natoms = len(to_positions(structure))
+        self._inputs = (incar, kpoints, potcar)
+        self._directory = directory
+        self._callbacks = callbacks or {}
+        # the session must not forward our stdin to VASP
+        kwargs.setdefault('stdin', None)
+        self._kwargs = kwargs
+        self._requests = None
+        self._in_flight = collections.deque()
+        self._initial = None
+        self._task = None
+        self._loop = None
+        self._process = None
+        self._started = False
+        self._closing = False
+
+    @property
+    def process(self):
+        """
+        (VaspInteractiveProcess) the process, None until VASP asked for its first structure
+        """
+        return self._process
+
+    @property
+    def initial(self):
+        """
+        (asyncio.Future) resolved with the ionic step record of the structure given to the session
+        """
+        return self._initial
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self):
+        """
+        Number of requests not resolved yet
+        """
+        return len(self._in_flight) + (self._requests.qsize() if self._requests is not None else 0)
+
+    def _ionic_step_finished(self, ionic_step, data=None, **_):
+        # the step VASP repeats after the STOPCAR was written answers no request
+        if not self._in_flight:
+            return
+        future = self._in_flight.popleft()
+        # registered inline it runs on the loop, the futures are resolved through the loop nevertheless
+        self._loop.call_soon_threadsafe(resolve, future, data)
+
+    async def _next_structure(self, process):
+        self._process = process
+        if not self._started:
+            self._started = True
+            return self._structure
+        positions, future = await self._requests.get()
+        if future is None:
+            raise StopAsyncIteration
+        self._in_flight.append(future)
+        return positions
+
+    def _finished(self, task):
+        error = task.exception() if not task.cancelled() else None
+        returncode = self._process.returncode if self._process is not None else None
+        reason = SessionClosed(f'VASP exited with return code {returncode}') if error is None else error
+        pending = list(self._in_flight)
+        while self._requests is not None and not self._requests.empty():
+            pending.append(self._requests.get_nowait()[1])
+        self._in_flight.clear()
+        for future in filter(None, pending):
+            if not future.done():
+                future.set_exception(reason)
+        if not self._initial.done():
+            self._initial.set_exception(reason)
+
+    async def start(self):
+        """
+        Starts VASP, the POSCAR is computed first
+        :return: (dict) the ionic step record of the structure given to the session
+        """
+        if self._task is None:
+            loop = self._loop = asyncio.get_running_loop()
+            self._requests = asyncio.Queue()
+            self._initial = loop.create_future()
+            self._in_flight.append(self._initial)
+            # resolved inline on the loop and first, the other callbacks see a consistent session
+            kwargs = dict(self._kwargs, inline_callbacks=merge_callbacks(self._kwargs.get('inline_callbacks'), {VaspInteractiveProcess.Callback.IonicStepFinished: self._ionic_step_finished}, first=True))
+            self._task = asyncio.ensure_future(run_vasp_calculation(self._next_structure, *self._inputs, directory=self._directory, callbacks=self._callbacks, **kwargs))
+            self._task.add_done_callback(self._finished)
+        return await asyncio.shield(self._initial)
+
+    def submit(self, positions):
+        """
+        Queues a request without waiting for it
+        :return: (asyncio.Future) resolved with the ionic step record
+        """
+        if self._closing or (self._task is not None and self._task.done()):
+            raise SessionClosed('The session is closed')
+        if self._requests is None:
+            raise RuntimeError('The session was not started')
+        # checked here, invalid positions fed to VASP would end the process
+        positions = to_positions(positions)
+        if positions.shape != (self._natoms, 3):
+            raise ValueError(f'Expected positions of shape ({self._natoms}, 3), got {positions.shape}')
+        future = asyncio.get_running_loop().create_future()
+        self._requests.put_nowait((positions, future))
+        return future
+
+    async def compute_step(self, positions):
+        """
+        :return: (dict) the ionic step record with the keys "summary", "forces", "scf" and "positions"
+        """
+        await self.start()
+        return await self.submit(positions)
+
+    async def compute(self, positions):
+        """
+        :return: (tuple) the free energy F, which is consistent with the forces, and the forces of shape (natoms, 3)
+        """
+        data = await self.compute_step(positions)
+        return data['summary']['F'], data.get('forces')
+
+    async def close(self):
+        """
+        Lets VASP finish the queued requests and stop through the STOPCAR
+        """
+        if self._task is None or self._closing:
+            return
+        self._closing = True
+        self._requests.put_nowait((None, None))
+        try:
+            await self._task
+        except Exception:
+            pass
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,198 @@
+"""
+Runs the callbacks of VaspInteractiveProcess off the stdout parser. Events are put onto one bounded queue per
+callback type and consumed in order by one task per type, coroutine functions are awaited and other callbacks run
+in an executor. When a queue is full the overflow policy decides
+
+    - Overflow.Block: stdout is not read any further until the queue has room, VASP stalls once the pipe is full.
+      The bound is soft: the queues are checked after each line, or after each chunk if stdout is read in chunks
+      (chunk_size), so a queue can exceed maxsize by the events of one line or one chunk
+    - Overflow.DropOldest: the oldest queued event is discarded
+    - Overflow.Coalesce: the newest queued event is replaced, only the latest state is delivered
+
+    dispatcher = CallbackDispatcher(maxsize=256, overflow=Overflow.DropOldest)
+    await run_vasp_calculation(..., dispatcher=dispatcher)
+    dispatcher.stats()
+
+Callbacks run after the parser moved on, they must use the arguments they get rather than the current state of
+the process. Callbacks registered with inline=True, the bookkeeping of the journal, the trajectory writer, the OUTCAR
+tailer, pools and sessions, are not dispatched but run in the parser in order
+"""
+import enum
+import asyncio
+import inspect
+import functools
+import traceback
+import collections
+
+
+class Overflow(enum.Enum):
+
+    Block = 'block'
+    DropOldest = 'drop_oldest'
+    Coalesce = 'coalesce'
+
+
+class LatencyStats(object):
+    """
+    Queueing delay and run time of a callback in seconds
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+        self.errors = 0
+
+    def observe(self, wait, run):
+        self.count += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += run
+        self.run_max = max(self.run_max, run)
+
+    def as_dict(self):
+        return dict(
+            count=self.count,
+            errors=self.errors,
+            wait_mean=self.wait_total / self.count if self.count else 0.0,
+            wait_max=self.wait_max,
+            run_mean=self.run_total / self.count if self.count else 0.0,
+            run_max=self.run_max
+        )
+
+
+class CallbackDispatcher(object):
+
+    def __init__(self, maxsize=1024, overflow=Overflow.Block, executor=None):
+        """
+        :param maxsize: (int) events queued per callback type before the overflow policy applies (default: 1024)
+        :param overflow: (Overflow, str) "block", "drop_oldest" or "coalesce" (default: Overflow.Block)
+        :param executor: (concurrent.futures.Executor) runs the callbacks which are not coroutine functions, the
+            default executor of the loop if None (default: None)
+        """
+        self._maxsize = maxsize
+        self._overflow = Overflow(overflow)
+        self._executor = executor
+        self._queues = {}
+        self._ready = {}
+        self._consumers = {}
+        self._unfinished = 0
+        self._finished = None
+        self._room = None
+        self._latency = collections.defaultdict(LatencyStats)
+        self._dropped = collections.Counter()
+        self._coalesced = collections.Counter()
+        self._depth = collections.Counter()
+
+    def _loop(self):
+        return asyncio.get_running_loop()
+
+    def _queue(self, cb):
+        queue = self._queues.get(cb)
+        if queue is None:
+            queue = self._queues[cb] = collections.deque()
+            self._ready[cb] = asyncio.Event()
+            self._consumers[cb] = asyncio.ensure_future(self._consume(cb, queue, self._ready[cb]))
+        return queue
+
+    def dispatch(self, cb, callbacks, args=(), kwargs=None):
+        """
+        Queues an event, called by the parser
+        """
+        if not callbacks:
+            return
+        queue = self._queue(cb)
+        event = (tuple(callbacks), args, kwargs or {}, self._loop().time())
+        if len(queue) >= self._maxsize and self._overflow is Overflow.DropOldest:
+            queue.popleft()
+            self._dropped[cb] += 1
+            self._task_done()
+        elif len(queue) >= self._maxsize and self._overflow is Overflow.Coalesce:
+            queue.pop()
+            self._coalesced[cb] += 1
+            self._task_done()
+        queue.append(event)
+        self._unfinished += 1
+        self._depth[cb] = max(self._depth[cb], len(queue))
+        self._ready[cb].set()
+
+    def backpressure(self):
+        """
+        :return: an awaitable resolved once every queue has room again if the policy is Overflow.Block and a
+            queue is full, None otherwise. Asked after a line or a chunk was parsed, the events dispatched meanwhile
+            are queued in any case
+        """
+        if self._overflow is not Overflow.Block or not any(len(q) >= self._maxsize for q in self._queues.values()):
+            return None
+        if self._room is None or self._room.done():
+            self._room = self._loop().create_future()
+        return self._room
+
+    def _task_done(self):
+        self._unfinished -= 1
+        if self._unfinished == 0 and self._finished is not None and not self._finished.done():
+            self._finished.set_result(None)
+
+    def _release(self):
+        if self._room is not None and not self._room.done() and all(len(q) < self._maxsize for q in self._queues.values()):
+            self._room.set_result(None)
+
+    async def _run(self, f, args, kwargs):
+        if inspect.iscoroutinefunction(f):
+            await f(*args, **kwargs)
+        else:
+            result = await self._loop().run_in_executor(self._executor, functools.partial(f, *args, **kwargs))
+            if inspect.isawaitable(result):
+                await result
+
+    async def _consume(self, cb, queue, ready):
+        loop = self._loop()
+        while True:
+            if not queue:
+                ready.clear()
+                await ready.wait()
+                continue
+            callbacks, args, kwargs, enqueued = queue.popleft()
+            self._release()
+            try:
+                for f in callbacks:
+                    start = loop.time()
+                    stats = self._latency[getattr(f, '__qualname__', repr(f))]
+                    try:
+                        await self._run(f, args, kwargs)
+                    except Exception:
+                        stats.errors += 1
+                        traceback.print_exc()
+                    stats.observe(start - enqueued, loop.time() - start)
+            finally:
+                self._task_done()
+
+    async def join(self):
+        """
+        Waits until all queued events are delivered
+        """
+        if self._unfinished:
+            # processes sharing the dispatcher wait for the same future
+            if self._finished is None or self._finished.done():
+                self._finished = self._loop().create_future()
+            await asyncio.shield(self._finished)
+
+    async def close(self):
+        await self.join()
+        for consumer in self._consumers.values():
+            consumer.cancel()
+        await asyncio.gather(*self._consumers.values(), return_exceptions=True)
+        self._queues.clear()
+        self._ready.clear()
+        self._consumers.clear()
+
+    def stats(self):
+        """
+        :return: (dict) latency stats per callback and queue stats per callback type
+        """
+        return dict(
+            callbacks={name: stats.as_dict() for name, stats in self._latency.items()},
+            queues={getattr(cb, 'value', cb): dict(queued=len(self._queues.get(cb, ())), max_depth=self._depth[cb], dropped=self._dropped[cb], coalesced=self._coalesced[cb]) for cb in self._depth}
+        )
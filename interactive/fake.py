@@ -0,0 +1,265 @@
+"""
+A stand-in for an interactive VASP executable. It speaks the stdout/stdin protocol parsed by
+:class:`interactive.vasp.VaspInteractiveProcess` and can be used to benchmark and test the driver
+without a VASP licence or an MPI installation:
+
+    python /path/to/interactive/fake.py --natoms 64 --scf-steps 12 --rate 0
+
+As a command of VaspInteractiveProcess it is run in the calculation directory, hence it is given by its absolute path
+like benchmarks.common.fake_vasp_command does, "python -m interactive.fake" only works where the package is importable.
+With "launch" as first argument it acts as a fake mpirun/srun which executes the command after the launcher options
+
+    python /path/to/interactive/fake.py launch -np 4 -bind-to user:0,1,2,3 python /path/to/interactive/fake.py --natoms 64
+
+The energy model is a harmonic well around the reference positions, hence energies and forces
+are deterministic functions of the positions fed through stdin.
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+
+SCF_TABLE_HEADER = '       N       E                     dE             d eps       ncg     rms          rms(c)'
+
+PREAMBLE = (
+    ' vasp.6.2.1 fake-interactive (build Jan 01 2021)',
+    ' running on    1 total cores',
+    ' POSCAR found :  1 types and {natoms} ions',
+    ' LDA part: xc-table for Pade appr. of Perdew',
+    ' POSCAR, INCAR and KPOINTS ok, starting setup',
+    ' FFT: planning ...',
+    ' WAVECAR not read',
+    ' entering main loop',
+)
+
+NOISE_LINE = '   bond charge predicted   {index:6d}'
+
+
+def read_poscar_positions(path):
+    with open(path) as h:
+        lines = [line.split() for line in h.read().splitlines()]
+    # skip comment, scaling factor and lattice vectors, the counts line is the first line of integers
+    for index, tokens in enumerate(lines[5:], start=5):
+        if tokens and all(t.isdigit() for t in tokens):
+            natoms = sum(map(int, tokens))
+            break
+    else:
+        raise ValueError(f'Cannot find the ion counts in {path}')
+    index += 1
+    if lines[index] and lines[index][0][0] in 'sS':
+        index += 1
+    index += 1
+    return [list(map(float, tokens[:3])) for tokens in lines[index:index + natoms]]
+
+
+def reference_positions(natoms):
+    return [[(i * 0.618033988749895) % 1.0, (i * 0.414213562373095) % 1.0, (i * 0.732050807568877) % 1.0] for i in range(natoms)]
+
+
+def minimum_image(d):
+    return d - round(d)
+
+
+class FakeVasp(object):
+
+    def __init__(self, natoms=None, scf_steps=8, noise=0, spring=1.5, reference=None, scf_threshold=None, outcar=None):
+        if reference is None:
+            reference = reference_positions(natoms or 4)
+        self._reference = reference
+        self._natoms = len(reference)
+        self._scf_steps = scf_steps
+        self._noise = noise
+        self._spring = spring
+        self._scf_threshold = scf_threshold
+        self._outcar = outcar
+        self._step = 0
+        self._previous_positions = None
+
+    @property
+    def natoms(self):
+        return self._natoms
+
+    @property
+    def reference(self):
+        return self._reference
+
+    @property
+    def step(self):
+        """
+        (int) number of ionic steps emitted so far
+        """
+        return self._step
+
+    def evaluate(self, positions):
+        energy = -3.7 * self._natoms
+        forces = []
+        for position, reference in zip(positions, self._reference):
+            d = [minimum_image(p - r) for p, r in zip(position, reference)]
+            energy += self._spring * sum(x * x for x in d)
+            forces.append([-2.0 * self._spring * x for x in d])
+        return energy, forces
+
+    def scf_iterations(self, positions):
+        if self._scf_threshold is None or self._previous_positions is None:
+            return self._scf_steps
+        # emulate the wavefunction extrapolation: similar structures converge faster
+        distance = max(abs(minimum_image(p - q)) for a, b in zip(positions, self._previous_positions) for p, q in zip(a, b))
+        return max(2, min(self._scf_steps, int(round(self._scf_steps * distance / self._scf_threshold))))
+
+    def preamble(self):
+        for line in PREAMBLE:
+            yield line.format(natoms=self._natoms)
+
+    def ionic_step(self, positions):
+        self._step += 1
+        energy, forces = self.evaluate(positions)
+        nscf = self.scf_iterations(positions)
+        self._previous_positions = positions
+        yield SCF_TABLE_HEADER
+        previous = 0.0
+        for n in range(1, nscf + 1):
+            e = energy + 10.0 ** (2 - n)
+            algo = 'DAV' if n < 5 else 'RMM'
+            rmsc = f'    {10.0 ** (-n):.3E}' if n > 1 else ''
+            yield f'{algo}:  {n:2d}    {e: .12E}   {e - previous: .5E}   {-10.0 ** (1 - n): .5E}   {120 * self._natoms:5d}   {10.0 ** (1 - n):.3E}{rmsc}'
+            previous = e
+            for index in range(self._noise):
+                yield NOISE_LINE.format(index=index)
+        yield 'FORCES:'
+        for force in forces:
+            yield '  ' + ' '.join(f'{f: .8E}' for f in force)
+        if self._outcar is not None:
+            # like VASP the OUTCAR section of a step is complete before its summary appears on stdout
+            self._outcar.writelines(f'{line}\n' for line in self.outcar_section(positions, energy, forces, nscf))
+            self._outcar.flush()
+        yield f' {self._step:4d} F= {energy:.8E} E0= {energy:.8E}  d E ={energy - self._natoms * -3.7:.6E}'
+
+    def outcar_section(self, positions, energy, forces, nscf):
+        dashes = ' ' + '-' * 83
+        for _ in range(nscf):
+            yield '      LOOP:  cpu time      0.0010: real time      0.0010'
+        moments = [0.1 * (i % 3) for i in range(self._natoms)]
+        yield ' number of electron      {:.7f} magnetization      {:.7f}'.format(3.0 * self._natoms, sum(moments))
+        yield ' magnetization (x)'
+        yield ' '
+        yield '# of ion       s       p       d       tot'
+        yield '-' * 42
+        for index, moment in enumerate(moments, start=1):
+            yield f'{index:5d}        0.000   0.000 {moment:7.3f} {moment:7.3f}'
+        yield '-' * 50
+        yield f'tot          0.000   0.000 {sum(moments):7.3f} {sum(moments):7.3f}'
+        # the stress of the harmonic well, in kB
+        stress = [energy - self._natoms * -3.7] * 3 + [0.0] * 3
+        yield '  FORCE on cell =-STRESS in cart. coord.  units (eV):'
+        yield '  in kB   ' + ''.join(f'{s:12.5f}' for s in stress)
+        yield f'  external pressure = {sum(stress[:3]) / 3:11.2f} kB  Pullay stress =        0.00 kB'
+        yield ' POSITION                                       TOTAL-FORCE (eV/Angst)'
+        yield dashes
+        for position, force in zip(positions, forces):
+            yield ' ' + ''.join(f'{x:13.5f}' for x in position) + '   ' + ''.join(f'{f:14.6f}' for f in force)
+        yield dashes
+        yield f'  free  energy   TOTEN  = {energy:18.8f} eV'
+        yield '     LOOP+:  cpu time      0.0100: real time      0.0100'
+
+
+def parse_positions(lines):
+    return [list(map(float, line.split()[:3])) for line in lines]
+
+
+def stop_requested(directory=os.curdir):
+    path = os.path.join(directory, 'STOPCAR')
+    if not os.path.exists(path):
+        return False
+    with open(path) as h:
+        return 'LSTOP' in h.read().upper()
+
+
+# options of mpirun/srun which take a value, used by the fake launcher to find the start of the command
+LAUNCHER_OPTIONS_WITH_VALUE = {'-np', '-n', '-N', '-hosts', '-host', '--host', '-bind-to', '--bind-to', '--cpu-set', '-ppn', '--nodes', '--ntasks', '--nodelist', '--cpu-bind'}
+
+
+def launcher_command(args):
+    index = 0
+    while index < len(args) and args[index].startswith('-'):
+        index += 2 if args[index] in LAUNCHER_OPTIONS_WITH_VALUE else 1
+    return args[:index], args[index:]
+
+
+def launch(argv):
+    """
+    A fake mpirun/srun: drops the launcher options, logs them to $FAKE_LAUNCHER_LOG and executes the command
+    """
+    options, command = launcher_command(argv)
+    if not command:
+        sys.stderr.write('fake launcher: no command given\n')
+        return 2
+    log = os.environ.get('FAKE_LAUNCHER_LOG')
+    if log:
+        with open(log, 'a') as h:
+            h.write(' '.join(options) + '\n')
+    os.execvp(command[0], command)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['launch']:
+        return launch(argv[1:])
+    parser = argparse.ArgumentParser(prog='python -m interactive.fake', description='Emulates an interactive VASP run')
+    parser.add_argument('--natoms', type=int, default=None, help='number of ions, read from POSCAR if not given')
+    parser.add_argument('--scf-steps', type=int, default=8, help='SCF rows printed per ionic step')
+    parser.add_argument('--rate', type=float, default=0.0, help='lines per second written to stdout, 0 means unlimited')
+    parser.add_argument('--noise', type=int, default=0, help='verbose lines printed after each SCF row')
+    parser.add_argument('--max-steps', type=int, default=None, help='exit after this many ionic steps')
+    parser.add_argument('--scf-threshold', type=float, default=None, help='scale SCF rows with the distance to the previous structure')
+    parser.add_argument('--exit-code', type=int, default=0, help='exit code reported after the last step')
+    parser.add_argument('--outcar', action='store_true', help='write stress, magnetization, TOTAL-FORCE and timing sections to OUTCAR')
+    parser.add_argument('--crash-after', type=int, default=None, help='die with exit code 1 while computing this ionic step')
+    parser.add_argument('--hang-after', type=int, default=None, help='stop printing in the middle of the SCF of this ionic step, like a hung MPI rank')
+    args = parser.parse_args(argv)
+
+    # the first ionic step is computed for the POSCAR, which is the reference unless --natoms is given
+    initial = read_poscar_positions('POSCAR') if os.path.exists('POSCAR') else None
+    reference = initial if args.natoms is None else None
+    outcar = open('OUTCAR', 'w') if args.outcar else None
+    vasp = FakeVasp(natoms=args.natoms, scf_steps=args.scf_steps, noise=args.noise, reference=reference, scf_threshold=args.scf_threshold, outcar=outcar)
+
+    delay = 1.0 / args.rate if args.rate > 0 else 0.0
+    out = sys.stdout
+
+    def emit(lines):
+        for line in lines:
+            out.write(line)
+            out.write('\n')
+            if delay:
+                out.flush()
+                time.sleep(delay)
+
+    emit(vasp.preamble())
+    positions = initial if initial is not None and len(initial) == vasp.natoms else vasp.reference
+    while True:
+        if args.crash_after is not None and vasp.step + 1 >= args.crash_after:
+            emit(('BAD TERMINATION OF ONE OF YOUR APPLICATION PROCESSES',))
+            out.flush()
+            return 1
+        if args.hang_after is not None and vasp.step + 1 >= args.hang_after:
+            emit(itertools.islice(vasp.ionic_step(positions), 3))
+            out.flush()
+            while True:
+                time.sleep(3600)
+        emit(vasp.ionic_step(positions))
+        if stop_requested() or (args.max_steps is not None and vasp.step >= args.max_steps):
+            break
+        emit(('POSITIONS: reading from stdin',))
+        out.flush()
+        lines = [sys.stdin.readline() for _ in range(vasp.natoms)]
+        if not all(lines):
+            break
+        positions = parse_positions(lines)
+        emit(('POSITIONS: read from stdin',))
+    out.flush()
+    return args.exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
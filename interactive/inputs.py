@@ -0,0 +1,192 @@
+"""
+Writes the VASP input files without pymatgen. Structures can be pymatgen Structures, ase Atoms or a
+(lattice, symbols, fractional positions) tuple, INCARs are dicts, KPOINTS a mesh. File names are copied as they are,
+objects with a write_file method (e.g. pymatgen's Incar, Kpoints or Potcar) write themselves
+"""
+import os
+import shutil
+import itertools
+import numpy as np
+
+
+def structure_arrays(structure):
+    """
+    :return: (tuple) lattice vectors as rows, chemical symbols and fractional coordinates of structure
+    """
+    if hasattr(structure, 'get_scaled_positions'):
+        return np.asarray(structure.get_cell(), dtype=np.float64), list(structure.get_chemical_symbols()), structure.get_scaled_positions()
+    elif hasattr(structure, 'frac_coords') and hasattr(structure, 'lattice'):
+        return np.asarray(structure.lattice.matrix, dtype=np.float64), [site.specie.symbol for site in structure], structure.frac_coords
+    elif isinstance(structure, (tuple, list)) and len(structure) == 3:
+        lattice, symbols, positions = structure
+        return np.asarray(lattice, dtype=np.float64), list(symbols), np.asarray(positions, dtype=np.float64)
+    raise TypeError(f'Cannot write {type(structure).__name__} as POSCAR')
+
+
+def format_poscar(lattice, symbols, positions, comment=None):
+    # consecutive atoms of the same species form one group, like pymatgen does
+    groups = [(symbol, len(list(atoms))) for symbol, atoms in itertools.groupby(symbols)]
+    lines = [
+        comment or ' '.join(f'{symbol}{count}' for symbol, count in groups),
+        '1.0',
+        *(' '.join(f'{x:21.16f}' for x in vector) for vector in lattice),
+        ' '.join(symbol for symbol, _ in groups),
+        ' '.join(str(count) for _, count in groups),
+        'direct',
+        *(' '.join(f'{x:.16f}' for x in coords) for coords in np.asarray(positions, dtype=np.float64).tolist())
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def format_incar_value(value):
+    if isinstance(value, bool) or isinstance(value, np.bool_):
+        return '.TRUE.' if value else '.FALSE.'
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return ' '.join(map(format_incar_value, value))
+    return str(value)
+
+
+def format_incar(incar):
+    return ''.join(f'{tag.upper()} = {format_incar_value(value)}\n' for tag, value in incar.items())
+
+
+def parse_incar_value(value):
+    lowered = value.lower()
+    if lowered in ('.true.', 't', 'true', '.t.'):
+        return True
+    elif lowered in ('.false.', 'f', 'false', '.f.'):
+        return False
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_incar(path):
+    incar = {}
+    with open(path) as h:
+        for line in h:
+            line = line.split('#', 1)[0].split('!', 1)[0]
+            for statement in line.split(';'):
+                tag, sep, value = statement.partition('=')
+                if sep:
+                    incar[tag.strip().upper()] = parse_incar_value(value.strip())
+    return incar
+
+
+def format_kpoints(mesh, style='Gamma', shift=(0, 0, 0)):
+    return '\n'.join((
+        'Automatic mesh',
+        '0',
+        style,
+        ' '.join(map(str, mesh)),
+        ' '.join(map(str, shift)),
+    )) + '\n'
+
+
+def write_bytes(path, data):
+    # written next to the destination and moved over it, this never writes through a link into a shared file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as h:
+        h.write(data)
+    os.replace(temporary, path)
+
+
+def place(path, data=None, source=None, staging=None):
+    """
+    Puts either data (bytes) or the content of the file source at path, through the staging area if one is given
+    """
+    if staging is not None:
+        if data is not None:
+            staging.place_bytes(data, path)
+        else:
+            staging.place_file(source, path)
+    elif data is not None:
+        write_bytes(path, data)
+    elif os.path.abspath(source) != os.path.abspath(path):
+        temporary = f'{path}.{os.getpid()}.tmp'
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, path)
+
+
+def place_written(path, obj, staging=None):
+    """
+    Places the file written by obj.write_file, e.g. a pymatgen object
+    """
+    temporary = f'{path}.{os.getpid()}.tmp'
+    obj.write_file(temporary)
+    if staging is None:
+        os.replace(temporary, path)
+    else:
+        with open(temporary, 'rb') as h:
+            data = h.read()
+        os.remove(temporary)
+        staging.place_bytes(data, path)
+
+
+def write_poscar(path, structure, staging=None):
+    if isinstance(structure, str):
+        return place(path, source=structure, staging=staging)
+    try:
+        arrays = structure_arrays(structure)
+    except TypeError:
+        # an object we do not know, pymatgen is the last resort
+        from pymatgen.io.vasp import Poscar
+        place_written(path, Poscar(structure), staging=staging)
+    else:
+        place(path, data=format_poscar(*arrays).encode(), staging=staging)
+
+
+def write_incar(path, incar, transform=None, staging=None):
+    """
+    :param incar: (str, dict) a file name or the tags
+    :param transform: (callable) applied to the tags before they are written (default: None)
+    """
+    if isinstance(incar, str):
+        incar = read_incar(incar)
+    incar = dict(incar)
+    place(path, data=format_incar(transform(incar) if transform is not None else incar).encode(), staging=staging)
+
+
+def write_kpoints(path, kpoints, staging=None):
+    """
+    :param kpoints: (str, tuple, dict) a file name, a Gamma centered mesh (n1, n2, n3),
+        a dict with the keys mesh, style and shift, or an object with a write_file method
+    """
+    if isinstance(kpoints, str):
+        place(path, source=kpoints, staging=staging)
+    elif isinstance(kpoints, dict):
+        place(path, data=format_kpoints(**kpoints).encode(), staging=staging)
+    elif hasattr(kpoints, 'write_file'):
+        place_written(path, kpoints, staging=staging)
+    else:
+        place(path, data=format_kpoints(kpoints).encode(), staging=staging)
+
+
+def write_potcar(path, potcar, staging=None):
+    """
+    :param potcar: (str, sequence of str) a POTCAR file or the POTCAR files of the species to concatenate,
+        or an object with a write_file method
+    """
+    if isinstance(potcar, str):
+        place(path, source=potcar, staging=staging)
+    elif hasattr(potcar, 'write_file'):
+        place_written(path, potcar, staging=staging)
+    else:
+        data = b''
+        for name in potcar:
+            with open(name, 'rb') as h:
+                data += h.read()
+        place(path, data=data, staging=staging)
+
+
+def write_inputs(directory, structure, incar, kpoints, potcar, incar_transform=None, staging=None):
+    """
+    :param staging: (StagingArea) files are linked from this content-addressed store instead of written (default: None)
+    """
+    write_poscar(os.path.join(directory, 'POSCAR'), structure, staging=staging)
+    write_incar(os.path.join(directory, 'INCAR'), incar, transform=incar_transform, staging=staging)
+    write_kpoints(os.path.join(directory, 'KPOINTS'), kpoints, staging=staging)
+    write_potcar(os.path.join(directory, 'POTCAR'), potcar, staging=staging)
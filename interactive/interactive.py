@@ -1,36 +1,46 @@
 import os
 import sys
 import shlex
+import signal
 import asyncio
 import functools
 from .utils import ensure_iterable_of_type
-from .aio import forking_pipe, create_standard_streams 
+from .aio import forking_pipe, create_standard_streams, close_standard_streams
 
 class InteractiveProcess(object):
 
-    def __init__(self, command, directory=os.getcwd(), stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None):
+    def __init__(self, command, directory=os.getcwd(), stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None, chunk_size=None, high_water=None, start_new_session=False):
         ensure_tuple = functools.partial(ensure_iterable_of_type, tuple)
         self._command = command
         self._directory = directory
         self._pipes = None
         self._handle = None
+        self._returncode = None
         self._wrapped_streams = None
         self._streams = (stdin, ensure_tuple(stdout), ensure_tuple(stderr))
         self._processors = (stdin_proc, ensure_tuple(stdout_proc), ensure_tuple(stderr_proc))
         self._loop = asyncio.get_event_loop() if loop is None else loop 
+        self._chunk_size = chunk_size
+        self._high_water = high_water
+        # in a session of its own the process and everything it started, e.g. all MPI ranks, form one process group
+        self._start_new_session = start_new_session
 
     async def create_process_handle(self):
         PIPE = asyncio.subprocess.PIPE
-        handle = await asyncio.create_subprocess_exec(*shlex.split(self._command), stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=self._directory)
+        handle = await asyncio.create_subprocess_exec(*shlex.split(self._command), stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=self._directory, start_new_session=self._start_new_session)
         return handle
 
     def create_pipes(self, proc_handle, stdin, stdout, stderr):
         proc_stdin, proc_stdout, proc_stderr = self._processors
-        return dict(
-            stdout=asyncio.create_task(forking_pipe(proc_handle.stdout, stdout, line_processors=proc_stdout)),
-            stderr=asyncio.create_task(forking_pipe(proc_handle.stderr, stderr, line_processors=proc_stderr)),
-            stdin=asyncio.create_task(forking_pipe(stdin, (proc_handle.stdin,), line_processors=proc_stdin))
+        forking_pipe_ = functools.partial(forking_pipe, chunk_size=self._chunk_size, high_water=self._high_water)
+        pipes = dict(
+            stdout=asyncio.create_task(forking_pipe_(proc_handle.stdout, stdout, line_processors=proc_stdout)),
+            stderr=asyncio.create_task(forking_pipe_(proc_handle.stderr, stderr, line_processors=proc_stderr))
         )
+        # without stdin nothing is forwarded to the process except what we write ourselves
+        if stdin is not None:
+            pipes['stdin'] = asyncio.create_task(forking_pipe(stdin, (proc_handle.stdin,), line_processors=proc_stdin))
+        return pipes
 
     def close_pipes(self, pipes):
         for forkers in pipes.values():
@@ -46,11 +56,30 @@ class InteractiveProcess(object):
         
         if self._handle.returncode is None:
             self._handle.terminate()
-        await self._handle.wait()
+        self._returncode = await self._handle.wait()
         self.close_pipes(self._pipes)
+        await close_standard_streams(self._wrapped_streams)
         self._handle, self._pipes = None, None
 
+    def signal_group(self, sig=signal.SIGTERM):
+        """
+        Sends sig to the process group of the process if it was started in a new session, to the process otherwise
+        """
+        if self._handle is None or self._handle.returncode is not None:
+            return
+        try:
+            if self._start_new_session:
+                os.killpg(self._handle.pid, sig)
+            else:
+                self._handle.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
     async def wait(self):
         if self._handle:
-            await self._handle.wait()
+            self._returncode = await self._handle.wait()
+
+    @property
+    def returncode(self):
+        return self._returncode if self._handle is None else self._handle.returncode
 
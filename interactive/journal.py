@@ -0,0 +1,117 @@
+"""
+Journal of a run, one JSON object per line. A "structure" entry is written when a structure is handed out
+to VASP, a "step" entry when its ionic step is completed
+
+    {"event": "structure", "index": 3}
+    {"event": "step", "index": 3, "ionic_step": 4, "summary": {"step": 4, "F": ..., "E0": ..., "dE": ...}, "nscf": 12, "cached": false}
+
+A run resumed from its journal skips the structures which were completed and restarts VASP from the
+WAVECAR/CHGCAR left in the directory
+"""
+import os
+import json
+import collections
+from .vasp import VaspInteractiveProcess
+
+
+def restart_incar(incar: dict, directory):
+    """
+    Points ISTART/ICHARG at the wavefunctions or the charge density left in directory by a previous run
+    """
+    incar = incar.copy()
+
+    def usable(name):
+        path = os.path.join(directory, name)
+        return os.path.exists(path) and os.path.getsize(path) > 0
+
+    if usable('WAVECAR'):
+        incar['ISTART'] = 1
+    elif usable('CHGCAR'):
+        incar['ICHARG'] = 1
+    return incar
+
+
+class StepJournal(object):
+    """
+    Records the structures handed out and the ionic steps completed. Register it with a process through
+    register(). With resume=True an existing journal is read and continued, otherwise it is truncated.
+    Each line is flushed and synced, the journal survives a node failure
+    """
+
+    def __init__(self, path, resume=False, sync=True):
+        self._path = path
+        self._sync = sync
+        self._completed = {}
+        self._in_flight = collections.deque()
+        if resume and os.path.exists(path):
+            self._read()
+        self._handle = open(path, 'a' if resume else 'w')
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def completed(self):
+        """
+        (dict) the step entries of the completed structures by index
+        """
+        return self._completed
+
+    @property
+    def in_flight(self):
+        return tuple(self._in_flight)
+
+    @property
+    def resume_index(self):
+        """
+        The index of the first structure which was not completed
+        """
+        index = 0
+        while index in self._completed:
+            index += 1
+        return index
+
+    def _read(self):
+        with open(self._path) as h:
+            for line in h:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line may have been cut off by the crash
+                    continue
+                if entry.get('event') == 'step':
+                    self._completed[entry['index']] = entry
+
+    def _write(self, entry):
+        self._handle.write(json.dumps(entry) + '\n')
+        self._handle.flush()
+        if self._sync:
+            os.fsync(self._handle.fileno())
+
+    def structure(self, index, positions=None):
+        self._in_flight.append(index)
+        self._write(dict(event='structure', index=index))
+
+    def step(self, ionic_step, data=None, scf_steps=None, **_):
+        # the step VASP repeats after the STOPCAR was written has no structure in flight
+        if not self._in_flight:
+            return
+        data = data or {}
+        entry = dict(event='step', index=self._in_flight.popleft(), ionic_step=ionic_step, summary=data.get('summary'), nscf=scf_steps, cached=data.get('cached', False))
+        self._completed[entry['index']] = entry
+        self._write(entry)
+
+    def register(self, process):
+        process.register_callback(VaspInteractiveProcess.Callback.NextStructure, self.structure, inline=True)
+        process.register_callback(VaspInteractiveProcess.Callback.IonicStepFinished, self.step, inline=True)
+
+    def close(self):
+        if not self._handle.closed:
+            self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
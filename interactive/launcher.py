@@ -0,0 +1,188 @@
+"""
+Splits an allocation (e.g. a SLURM job) into k interactive VASP workers with m MPI ranks each and generates
+the launch command of each worker
+
+    allocation = Allocation.from_environment()
+    commands = worker_commands('vasp_std', allocation, workers=4, ranks=12, launcher=Launcher('srun'))
+    results = await run_vasp_pool(structures, incar, kpoints, potcar, workers=4, executable=commands)
+"""
+import os
+import re
+import time
+import socket
+import logging
+import collections
+from .pool import run_vasp_pool
+
+Slot = collections.namedtuple('Slot', ('worker', 'nodes', 'cores', 'ranks'))
+
+
+def expand_hostlist(hostlist):
+    """
+    Expands a SLURM hostlist such as "node[01-03,07],login1"
+    """
+    hosts = []
+    for item in re.findall(r'[^,\[]+(?:\[[^\]]*\])?[^,]*', hostlist):
+        m = re.match(r'^(.*?)\[([^\]]+)\](.*)$', item)
+        if m is None:
+            hosts.append(item)
+            continue
+        prefix, ranges, suffix = m.groups()
+        for part in ranges.split(','):
+            start, _, stop = part.partition('-')
+            for number in range(int(start), int(stop or start) + 1):
+                hosts.append(f'{prefix}{number:0{len(start)}d}{suffix}')
+    return hosts
+
+
+class Allocation(collections.namedtuple('Allocation', ('nodes', 'cores_per_node'))):
+
+    @property
+    def cores(self):
+        return len(self.nodes) * self.cores_per_node
+
+    @classmethod
+    def from_environment(cls, environ=None):
+        """
+        Reads the allocation from the SLURM environment variables, outside of SLURM the local machine is used
+        """
+        environ = os.environ if environ is None else environ
+        nodelist = environ.get('SLURM_JOB_NODELIST') or environ.get('SLURM_NODELIST')
+        nodes = tuple(expand_hostlist(nodelist)) if nodelist else (socket.gethostname(),)
+        if 'SLURM_CPUS_ON_NODE' in environ:
+            cores = int(environ['SLURM_CPUS_ON_NODE'])
+        elif 'SLURM_NTASKS_PER_NODE' in environ:
+            cores = int(environ['SLURM_NTASKS_PER_NODE'].split('(')[0])
+        elif 'SLURM_NTASKS' in environ:
+            cores = int(environ['SLURM_NTASKS']) // len(nodes)
+        else:
+            cores = os.cpu_count()
+        return cls(nodes, cores)
+
+
+def partition(allocation, workers, ranks):
+    """
+    Places workers with ranks MPI ranks each on the allocation. A worker fits on one node or spans whole nodes
+    :return: (list of Slot)
+    """
+    per_node = allocation.cores_per_node
+    if workers * ranks > allocation.cores:
+        raise ValueError(f'{workers} workers with {ranks} ranks do not fit into {allocation.cores} cores')
+    slots = []
+    if ranks <= per_node:
+        per_node_workers = per_node // ranks
+        if workers > per_node_workers * len(allocation.nodes):
+            raise ValueError(f'{workers} workers with {ranks} ranks do not fit on {len(allocation.nodes)} nodes with {per_node} cores')
+        for worker in range(workers):
+            node, offset = divmod(worker, per_node_workers)
+            cores = tuple(range(offset * ranks, (offset + 1) * ranks))
+            slots.append(Slot(worker, (allocation.nodes[node],), cores, ranks))
+    else:
+        if ranks % per_node:
+            raise ValueError(f'A worker spanning several nodes needs a multiple of {per_node} ranks')
+        span = ranks // per_node
+        for worker in range(workers):
+            nodes = allocation.nodes[worker * span:(worker + 1) * span]
+            slots.append(Slot(worker, tuple(nodes), tuple(range(per_node)), ranks))
+    return slots
+
+
+LAUNCH_TEMPLATES = dict(
+    srun='{binary} --nodes={nnodes} --ntasks={ranks} --nodelist={hosts} --cpu-bind=map_cpu:{cores} --exact {executable}',
+    mpich='{binary} -np {ranks} -hosts {hosts} -bind-to user:{cores} {executable}',
+    openmpi='{binary} -np {ranks} --host {hosts_slots} --cpu-set {cores} --bind-to core {executable}',
+    local='{executable}'
+)
+
+LAUNCH_BINARIES = dict(srun='srun', mpich='mpirun', openmpi='mpirun', local='')
+
+
+class Launcher(object):
+    """
+    Formats the launch command of a worker. kind is "srun", "mpich", "openmpi", "local" or a template
+    using the fields {binary} {ranks} {nnodes} {hosts} {hosts_slots} {cores} and {executable}.
+    Pass binary to use a different launcher executable, e.g. a fake one for testing
+    """
+
+    def __init__(self, kind='srun', binary=None):
+        self._template = LAUNCH_TEMPLATES.get(kind, kind)
+        self._binary = LAUNCH_BINARIES.get(kind, '') if binary is None else binary
+
+    def command(self, slot, executable):
+        return self._template.format(
+            binary=self._binary,
+            ranks=slot.ranks,
+            nnodes=len(slot.nodes),
+            hosts=','.join(slot.nodes),
+            hosts_slots=','.join(f'{node}:{slot.ranks // len(slot.nodes)}' for node in slot.nodes),
+            cores=','.join(map(str, slot.cores)),
+            executable=executable
+        ).strip()
+
+
+def worker_commands(executable, allocation, workers, ranks, launcher=None):
+    launcher = Launcher() if launcher is None else launcher
+    return [launcher.command(slot, executable) for slot in partition(allocation, workers, ranks)]
+
+
+def candidate_splits(allocation, limit=4):
+    """
+    (workers, ranks) splits using the whole allocation, at most limit of them spread from few large to many small workers
+    """
+    splits = []
+    for ranks in range(allocation.cores, 0, -1):
+        workers = allocation.cores // ranks
+        if workers * ranks != allocation.cores:
+            continue
+        try:
+            partition(allocation, workers, ranks)
+        except ValueError:
+            continue
+        splits.append((workers, ranks))
+    if len(splits) > limit:
+        splits = [splits[round(i * (len(splits) - 1) / (limit - 1))] for i in range(limit)]
+    return splits
+
+
+async def autotune(structures, incar, kpoints, potcar, executable, allocation=None, launcher=None, splits=None, per_worker=2, directory=os.getcwd(), **kwargs):
+    """
+    Runs the first structures with each (workers, ranks) split and picks the one with the best throughput
+    :param per_worker: (int) structures computed by each worker of a split (default: 2)
+    :return: (tuple) the best (workers, ranks), a dict mapping the splits to structures per second and the results of the probed structures
+    """
+    allocation = Allocation.from_environment() if allocation is None else allocation
+    splits = candidate_splits(allocation) if splits is None else splits
+    structures = list(structures)
+    throughput, results, offset = {}, {}, 0
+    for workers, ranks in splits:
+        probe = structures[offset:offset + workers * per_worker]
+        if not probe:
+            break
+        commands = worker_commands(executable, allocation, workers, ranks, launcher=launcher)
+        start = time.perf_counter()
+        probed = await run_vasp_pool(probe, incar, kpoints, potcar, workers=workers, executable=commands, directory=os.path.join(directory, f'autotune-{workers}x{ranks}'), **kwargs)
+        throughput[(workers, ranks)] = sum(r is not None for r in probed) / (time.perf_counter() - start)
+        results.update((offset + i, r) for i, r in enumerate(probed))
+        logging.info(f'autotune: {workers} workers x {ranks} ranks, {throughput[(workers, ranks)]:.3f} structures/s')
+        offset += len(probe)
+    if not throughput:
+        raise ValueError('No split could be probed')
+    best = max(throughput, key=throughput.get)
+    return best, throughput, results
+
+
+async def run_vasp_allocation(structures, incar, kpoints, potcar, executable, allocation=None, launcher=None, workers=None, ranks=None, directory=os.getcwd(), **kwargs):
+    """
+    Runs the structures on the allocation. If workers and ranks are not given the split is autotuned on the first structures
+    :return: (list) the results in input order
+    """
+    allocation = Allocation.from_environment() if allocation is None else allocation
+    structures = list(structures)
+    results = {}
+    if workers is None or ranks is None:
+        (workers, ranks), _, results = await autotune(structures, incar, kpoints, potcar, executable, allocation=allocation, launcher=launcher, directory=directory, **kwargs)
+    remaining = [i for i in range(len(structures)) if results.get(i) is None]
+    commands = worker_commands(executable, allocation, workers, ranks, launcher=launcher)
+    computed = await run_vasp_pool([structures[i] for i in remaining], incar, kpoints, potcar, workers=workers, executable=commands, directory=directory, **kwargs)
+    results.update(zip(remaining, computed))
+    return [results.get(i) for i in range(len(structures))]
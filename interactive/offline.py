@@ -0,0 +1,108 @@
+"""
+Parses recorded stdout logs of interactive VASP runs into a Trajectory, without a process and without a Python
+call per line. The log is memory-mapped and searched for the tokens of the parser states of interactive.vasp in bulk,
+only the lines containing a token are matched against the regexes. The ionic step summaries split the log into
+steps, each step is searched for its SCF table and force block
+
+    trajectory = parse_log('vasp.out')
+    trajectory.F, trajectory.nscf, trajectory.forces
+
+The positions are not part of stdout, they are NaN unless passed on
+"""
+import re
+import os
+import mmap
+from .trajectory import Trajectory
+from .vasp import regex_scf_table_header, regex_scf_table_row, regex_forces_begin, regex_ionic_step_complete, parse_force_block, convert_scf_row, convert_summary
+
+
+def buffer_regex(regex):
+    # with re.MULTILINE ^ also matches at the start of a line in the middle of the buffer
+    return re.compile(regex.pattern.encode(), re.MULTILINE)
+
+
+# the tokens are those of the parser states of VaspInteractiveProcess
+header_trigger = buffer_regex(regex_scf_table_header), b'rms(c)'
+row_trigger = buffer_regex(regex_scf_table_row), b':'
+forces_trigger = buffer_regex(regex_forces_begin), b'FORCES:'
+summary_trigger = buffer_regex(regex_ionic_step_complete), b'F='
+
+
+def line_end(buffer, position):
+    end = buffer.find(b'\n', position)
+    return len(buffer) if end < 0 else end + 1
+
+
+def find_lines(buffer, trigger, start, end):
+    """
+    Yields the matches of the lines in buffer[start:end] which contain the token and match the regex. The token
+    is searched for in bulk, the regex is only tried on the lines containing it
+    """
+    regex, token = trigger
+    while True:
+        position = buffer.find(token, start, end)
+        if position < 0:
+            return
+        line_start = buffer.rfind(b'\n', start, position) + 1 or start
+        start = line_end(buffer, position)
+        m = regex.match(buffer, line_start, min(start, end))
+        if m:
+            yield m
+
+
+def find_line(buffer, trigger, start, end):
+    return next(find_lines(buffer, trigger, start, end), None)
+
+
+def parse_steps(buffer, start=0, end=None):
+    """
+    Yields the ionic steps of buffer as dicts with the keys "summary", "scf" and "forces", like the records
+    VaspInteractiveProcess appends to its trajectory
+    """
+    end = len(buffer) if end is None else end
+    natoms = None
+    for summary in find_lines(buffer, summary_trigger, start, end):
+        step_end = summary.start()
+        # the last table header before the summary starts the step
+        header = None
+        for header in find_lines(buffer, header_trigger, start, step_end):
+            pass
+        record = dict(summary=convert_summary(summary.groupdict()))
+        if header is not None:
+            table_start = line_end(buffer, header.start())
+            forces = find_line(buffer, forces_trigger, table_start, step_end)
+            table_end = step_end if forces is None else forces.start()
+            record['scf'] = [convert_scf_row(m.groupdict()) for m in find_lines(buffer, row_trigger, table_start, table_end)]
+            if forces is not None:
+                block = buffer[line_end(buffer, forces.start()):step_end]
+                record['forces'] = parse_force_block(block.splitlines(), natoms=natoms)
+                natoms = len(record['forces'])
+        start = line_end(buffer, summary.start())
+        yield record
+
+
+def parse_buffer(buffer, trajectory=None, positions=None):
+    """
+    :param buffer: (bytes, mmap) the recorded stdout
+    :param trajectory: (Trajectory) the steps are appended to it, a new one is created if None (default: None)
+    :param positions: (sequence) the positions fed for each ionic step (default: None)
+    :return: (Trajectory) the trajectory
+    """
+    trajectory = Trajectory() if trajectory is None else trajectory
+    for index, record in enumerate(parse_steps(buffer)):
+        if positions is not None and index < len(positions):
+            record['positions'] = positions[index]
+        trajectory.append(record)
+    return trajectory
+
+
+def parse_log(path, trajectory=None, positions=None):
+    """
+    Parses the stdout log at path, the file is memory-mapped rather than read
+    """
+    if os.path.getsize(path) == 0:
+        return Trajectory() if trajectory is None else trajectory
+    with open(path, 'rb') as h, mmap.mmap(h.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        if hasattr(buffer, 'madvise'):
+            buffer.madvise(mmap.MADV_SEQUENTIAL)
+        return parse_buffer(buffer, trajectory=trajectory, positions=positions)
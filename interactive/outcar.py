@@ -0,0 +1,219 @@
+"""
+Follows the OUTCAR of a running calculation for the data stdout does not carry: stress, magnetic moments, timings
+and the TOTAL-FORCE block. The file is read from the byte offset reached before, only when an ionic step finished
+and when VASP asks for the next positions, and the section of each step is attached to its ionic step record
+as data['outcar'], and kept in the trajectory of the process (process.ionic_steps[i]['outcar']) unless its
+retention drops the arrays. The dict is empty if VASP did not flush the OUTCAR yet, it is filled in place once the section
+is complete
+
+    tailer = OutcarTailer(directory)
+    tailer.register(process)  # or run_vasp_calculation(..., outcar=True)
+
+    def ionic_step_finished(ionic_step, data=None, **_):
+        data['outcar']['stress'], data['outcar']['magnetization']
+"""
+import os
+import re
+import collections
+import numpy as np
+from .vasp import VaspInteractiveProcess
+
+regex_loop = re.compile(r'^[ \t]*LOOP:[ \t]+cpu time[ \t]+(\S+):[ \t]+real time[ \t]+(\S+)', re.MULTILINE)
+regex_loop_plus = re.compile(r'^[ \t]*LOOP\+:[ \t]+cpu time[ \t]+(\S+):[ \t]+real time[ \t]+(\S+)', re.MULTILINE)
+regex_stress = re.compile(r'^[ \t]*in kB((?:[ \t]+\S+){6})', re.MULTILINE)
+regex_pressure = re.compile(r'external pressure[ \t]*=[ \t]*(\S+)[ \t]*kB[ \t]*Pullay stress[ \t]*=[ \t]*(\S+)')
+regex_toten = re.compile(r'free[ \t]+energy[ \t]+TOTEN[ \t]*=[ \t]*(\S+)')
+regex_electrons = re.compile(r'number of electron[ \t]+(\S+)[ \t]+magnetization[ \t]+(\S+)')
+regex_dashes = re.compile(r'^[ \t]*-{10,}[ \t]*$', re.MULTILINE)
+
+TOTAL_FORCE = 'TOTAL-FORCE'
+MAGNETIZATION = 'magnetization (x)'
+
+
+def to_float(value):
+    # VASP prints stars for values which do not fit into the field
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def last_match(regex, text):
+    m = None
+    for m in regex.finditer(text):
+        pass
+    return m
+
+
+def dashed_table(text, position):
+    """
+    :return: (tuple) the rows between the two dashed lines following position as array and the end of the table,
+        (None, None) if the table is not complete yet
+    """
+    first = regex_dashes.search(text, position)
+    second = first and regex_dashes.search(text, first.end())
+    if second is None:
+        return None, None
+    block = text[first.end():second.start()]
+    rows = [line for line in block.splitlines() if line.strip()]
+    values = np.array([to_float(v) for v in block.split()], dtype=np.float64)
+    return values.reshape(len(rows), -1) if rows else values.reshape(0, 0), second.end()
+
+
+def line_end(text, position):
+    end = text.find('\n', position)
+    return len(text) if end < 0 else end + 1
+
+
+def split_steps(text):
+    """
+    :return: (tuple) the complete sections of the ionic steps in text, each one ends with its LOOP+ line, and the
+        incomplete rest
+    """
+    sections, start = [], 0
+    for m in regex_loop_plus.finditer(text):
+        end = line_end(text, m.end())
+        sections.append(text[start:end])
+        start = end
+    return sections, text[start:]
+
+
+def parse_section(text):
+    """
+    :return: (dict) the data found in the OUTCAR section of an ionic step
+    """
+    data = {}
+    for header in (TOTAL_FORCE, MAGNETIZATION):
+        position = text.rfind(header)
+        if position < 0:
+            continue
+        table, _ = dashed_table(text, position)
+        if table is None or not table.size:
+            continue
+        elif header == TOTAL_FORCE:
+            data['positions'], data['forces'] = table[:, :3], table[:, 3:6]
+        else:
+            # the first column is the ion, the last the total moment
+            data['magnetization'] = table[:, -1]
+    scf_timing = [(to_float(cpu), to_float(real)) for cpu, real in regex_loop.findall(text)]
+    if scf_timing:
+        data['scf_timing'] = scf_timing
+    m = last_match(regex_loop_plus, text)
+    if m:
+        data['timing'] = dict(cpu=to_float(m.group(1)), real=to_float(m.group(2)))
+    m = last_match(regex_stress, text)
+    if m:
+        data['stress'] = np.array([to_float(v) for v in m.group(1).split()], dtype=np.float64)
+    m = last_match(regex_pressure, text)
+    if m:
+        data['pressure'], data['pullay_stress'] = to_float(m.group(1)), to_float(m.group(2))
+    m = last_match(regex_toten, text)
+    if m:
+        data['energy'] = to_float(m.group(1))
+    m = last_match(regex_electrons, text)
+    if m:
+        data['electrons'], data['total_magnetization'] = to_float(m.group(1)), to_float(m.group(2))
+    return data
+
+
+class OutcarTailer(object):
+    """
+    Reads OUTCAR incrementally. The text is cut into the sections of the ionic steps at the LOOP+ lines and the
+    sections are handed to the finished ionic steps in order, hence a step gets its own section even if the
+    callbacks run late, e.g. through a CallbackDispatcher. A truncated or replaced file, as left by a restarted
+    VASP, is read from the start
+    """
+
+    def __init__(self, directory=os.getcwd(), filename='OUTCAR', encoding='latin-1'):
+        self._path = os.path.join(directory, filename)
+        self._encoding = encoding
+        self._handle = None
+        self._inode = None
+        self._offset = 0
+        self._remainder = b''
+        self._pending = ''
+        self._sections = collections.deque()
+        self._waiting = collections.deque()
+        self._bytes_read = 0
+        self._trajectory = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def bytes_read(self):
+        return self._bytes_read
+
+    def _reopen(self, stat):
+        self.close()
+        self._handle = open(self._path, 'rb')
+        self._inode = stat.st_ino
+        self._offset = 0
+        self._remainder = b''
+        self._pending = ''
+
+    def read(self):
+        """
+        :return: (str) the complete lines appended since the last call
+        """
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return ''
+        if self._handle is None or stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._reopen(stat)
+        if stat.st_size == self._offset:
+            return ''
+        self._handle.seek(self._offset)
+        data = self._handle.read(stat.st_size - self._offset)
+        self._offset += len(data)
+        self._bytes_read += len(data)
+        data = self._remainder + data
+        end = data.rfind(b'\n') + 1
+        self._remainder = data[end:]
+        return data[:end].decode(self._encoding)
+
+    def update(self):
+        """
+        Parses the ionic steps completed since the last call and fills the records waiting for them
+        """
+        sections, self._pending = split_steps(self._pending + self.read())
+        self._sections.extend(map(parse_section, sections))
+        while self._waiting and self._sections:
+            self._waiting.popleft().update(self._sections.popleft())
+
+    def step_finished(self, ionic_step, data=None, **_):
+        # a step answered from the result cache was not computed by VASP
+        if data is None or data.get('cached'):
+            return
+        section = data.setdefault('outcar', {})
+        self._waiting.append(section)
+        if self._trajectory is not None:
+            # the step was appended to the trajectory before its callbacks run
+            self._trajectory.set_outcar(section)
+        self.update()
+
+    def positions_requested(self, *_):
+        # VASP waits for positions once it wrote the step, a section which was late is complete by now
+        self.update()
+
+    def register(self, process):
+        self._trajectory = process.ionic_steps
+        process.register_callback(VaspInteractiveProcess.Callback.IonicStepFinished, self.step_finished, inline=True)
+        process.register_callback(VaspInteractiveProcess.Callback.FeedPositionsStarted, self.positions_requested, inline=True)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,172 @@
+import os
+import asyncio
+import logging
+import collections
+from .vasp import VaspInteractiveProcess
+from .runner import run_vasp_calculation, merge_callbacks
+from .schedule import schedule_order, restore_order
+
+
+class WorkQueue(object):
+    """
+    Distributes item indices over the workers. Each worker owns a deque initially holding a contiguous block
+    of items, it takes from the front of its own deque and steals from the back of the fullest one once its
+    own is empty
+    """
+
+    def __init__(self, nitems, nworkers):
+        self._queues = [collections.deque() for _ in range(nworkers)]
+        bounds = [round(i * nitems / nworkers) for i in range(nworkers + 1)]
+        for worker, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+            self._queues[worker].extend(range(start, stop))
+
+    def take(self, worker):
+        own = self._queues[worker]
+        if own:
+            return own.popleft()
+        victim = max(self._queues, key=len)
+        return victim.pop() if victim else None
+
+    def requeue(self, worker, index):
+        # appended to the back, thus an idle worker steals it first
+        self._queues[worker].append(index)
+
+    def __len__(self):
+        return sum(map(len, self._queues))
+
+
+def ionic_step_result(data, scf_steps=None, worker=None):
+    return dict(summary=data.get('summary'), forces=data.get('forces'), nscf=scf_steps, worker=worker)
+
+
+class VaspPool(object):
+    """
+    Runs many interactive VASP processes against one list of independent structures. Each worker runs in its
+    own directory (directory/worker-<i>), pulls structures from a shared work-stealing queue and is stopped
+    through the STOPCAR once the queue is drained. If a worker dies, the structures it did not finish are
+    re-queued and the worker is restarted at most max_restarts times. With schedule=True the structures are
+    ordered into a short path first, the contiguous blocks of the workers then hold similar structures.
+    With a VaspServer the workers are remote, each one runs on a worker which connected to the server.
+    All structures must share the lattice and the species of the first one, only positions are fed to VASP
+    """
+
+    def __init__(self, structures, incar, kpoints, potcar, workers=2, directory=os.getcwd(), executable=None, max_restarts=1, callbacks=None, on_result=None, schedule=False, server=None, **kwargs):
+        """
+        :param structures: (sequence) the structures to compute, anything run_vasp_calculation can write as POSCAR
+        :param workers: (int) number of VASP processes (default: 2)
+        :param executable: (str or sequence of str) the command, or one command per worker (default: None)
+        :param max_restarts: (int) how often a crashed worker is restarted (default: 1)
+        :param callbacks: (dict) callbacks registered with each worker process (default: None)
+        :param on_result: (callable) called as on_result(index, result) whenever a structure is finished (default: None)
+        :param schedule: (bool) whether to order the structures by similarity to save SCF iterations (default: False)
+        :param server: (VaspServer) runs VASP on the workers connecting to it instead of locally (default: None)
+        :param kwargs: passed on to run_vasp_calculation
+        """
+        commands = None if executable is None or isinstance(executable, str) else tuple(executable)
+        if commands is not None and len(commands) != workers:
+            raise ValueError(f'Got {len(commands)} commands for {workers} workers')
+        self._structures = list(structures)
+        # position in the scheduled order -> index of the structure
+        self._order = schedule_order(self._structures) if schedule else list(range(len(self._structures)))
+        self._structures = [self._structures[i] for i in self._order]
+        self._inputs = (incar, kpoints, potcar)
+        self._workers = workers
+        self._directory = directory
+        self._commands = commands if commands is not None else (executable,) * workers
+        self._max_restarts = max_restarts
+        self._callbacks = callbacks or {}
+        self._on_result = on_result
+        self._server = server
+        # the workers must not compete for our stdin
+        kwargs.setdefault('stdin', None)
+        self._kwargs = kwargs
+        self._queue = WorkQueue(len(self._structures), workers)
+        self._results = [None] * len(self._structures)
+        self._restarts = [0] * workers
+        self._processes = [None] * workers
+
+    @property
+    def results(self):
+        return restore_order(self._results, self._order)
+
+    @property
+    def order(self):
+        return self._order
+
+    @property
+    def processes(self):
+        return self._processes
+
+    def worker_directory(self, worker):
+        return os.path.join(self._directory, f'worker-{worker}')
+
+    def _worker_callbacks(self, worker, in_flight, inline_callbacks=None):
+        """
+        :return: (dict) the bookkeeping of the worker merged into inline_callbacks, it runs inline in the parser
+        """
+
+        def ionic_step_finished(ionic_step, data=None, scf_steps=None, **_):
+            # the step computed after the STOPCAR was written is a repetition and has no structure in flight
+            if not in_flight:
+                return
+            index = in_flight.popleft()
+            self._results[index] = result = ionic_step_result(data or {}, scf_steps=scf_steps, worker=worker)
+            if self._on_result is not None:
+                self._on_result(self._order[index], result)
+
+        return merge_callbacks(inline_callbacks, {VaspInteractiveProcess.Callback.IonicStepFinished: ionic_step_finished})
+
+    async def _run_worker(self, worker):
+        connection = None
+        while len(self._queue):
+            if self._server is not None and (connection is None or connection.closed):
+                # a lost worker is replaced by the next one which connects
+                connection = await self._server.accept()
+            in_flight = collections.deque()
+
+            def next_structure(_):
+                index = self._queue.take(worker)
+                if index is None:
+                    raise StopIteration
+                in_flight.append(index)
+                return self._structures[index]
+
+            kwargs = dict(self._kwargs)
+            if kwargs.get('watchdog') is not None:
+                # a watchdog follows one process, a stalled worker is restarted like a crashed one
+                kwargs['watchdog'] = kwargs['watchdog'].copy()
+            kwargs['inline_callbacks'] = self._worker_callbacks(worker, in_flight, kwargs.get('inline_callbacks'))
+            try:
+                self._processes[worker] = await run_vasp_calculation(
+                    next_structure, *self._inputs, directory=self.worker_directory(worker),
+                    executable=self._commands[worker], callbacks=self._callbacks, worker=connection, **kwargs)
+            except Exception:
+                logging.exception(f'Worker {worker} failed')
+            if not in_flight:
+                continue
+            # the worker died, hand its unfinished structures back
+            for index in in_flight:
+                self._queue.requeue(worker, index)
+            self._restarts[worker] += 1
+            if self._restarts[worker] > self._max_restarts:
+                logging.error(f'Worker {worker} crashed {self._restarts[worker]} times, giving up')
+                return
+            logging.warning(f'Worker {worker} crashed, restarting it and re-queuing {len(in_flight)} structure(s)')
+        if connection is not None:
+            self._server.release(connection)
+
+    async def run(self):
+        while len(self._queue):
+            pending = len(self._queue)
+            live = [w for w in range(self._workers) if self._restarts[w] <= self._max_restarts]
+            if not live:
+                break
+            await asyncio.gather(*(self._run_worker(w) for w in live))
+            if len(self._queue) == pending:
+                break
+        return self.results
+
+
+async def run_vasp_pool(structures, incar, kpoints, potcar, workers=2, directory=os.getcwd(), executable=None, max_restarts=1, callbacks=None, on_result=None, schedule=False, server=None, **kwargs):
+    pool = VaspPool(structures, incar, kpoints, potcar, workers=workers, directory=directory, executable=executable, max_restarts=max_restarts, callbacks=callbacks, on_result=on_result, schedule=schedule, server=server, **kwargs)
+    return await pool.run()
@@ -0,0 +1,500 @@
+"""
+Runs interactive VASP on other nodes while the structures, the parsing and the callbacks stay with one driver.
+A worker shim next to VASP connects to the driver over TCP or a Unix socket, receives the input files, starts VASP
+and forwards its stdin and stdout. The driver accepts any number of workers and runs a RemoteVaspProcess on each
+connection, the same parser and callbacks as for a local process
+
+    # on the compute nodes, with the port of the driver forwarded to them
+    INTERACTIVE_VASP_TOKEN=... python -m interactive.remote --connect 127.0.0.1:31415 --directory /scratch/vasp -- mpirun vasp_std
+
+    # on the driver
+    async with VaspServer('127.0.0.1:31415', token=...) as server:
+        results = await run_vasp_pool(structures, incar, kpoints, potcar, workers=4, server=server)
+
+Frames are a kind byte and the length of the payload, followed by the payload. The protocol is not the one of
+i-PI: i-PI exchanges binary cells, positions, energies and forces, which would move the parsing of the VASP output
+to the worker
+
+The driver trusts its workers with the energies and forces it receives, they end up in the callbacks, the cache and
+the journal. With a token the server sends a random challenge to each connection and only accepts workers which
+answer it with the HMAC of the token, without one it accepts whoever connects. Frames are not encrypted, across
+networks which are not trusted the connection should go through an SSH tunnel or a Unix socket
+"""
+import os
+import sys
+import hmac
+import json
+import shlex
+import socket
+import signal
+import hashlib
+import struct
+import asyncio
+import logging
+import argparse
+from .vasp import VaspInteractiveProcess
+from .inputs import write_bytes
+
+FRAME = struct.Struct('!cI')
+
+CHALLENGE = b'A'
+HELLO = b'H'
+FILE = b'F'
+RUN = b'R'
+STDIN = b'I'
+CLOSE_STDIN = b'C'
+STOP = b'S'
+TERMINATE = b'T'
+STARTED = b'P'
+STDOUT = b'O'
+STDERR = b'E'
+EXIT = b'X'
+
+INPUT_FILES = ('INCAR', 'KPOINTS', 'POTCAR', 'POSCAR')
+BLOCK_SIZE = 2 ** 16
+# the return code reported if the connection to the worker was lost
+CONNECTION_LOST = 255
+# the return code reported if the worker could not start the command
+NOT_STARTED = 127
+# the shared secret of the driver and its workers, if it is not given explicitly
+TOKEN_VARIABLE = 'INTERACTIVE_VASP_TOKEN'
+
+
+def answer_challenge(token, challenge):
+    return hmac.new(token.encode(), challenge, hashlib.sha256).hexdigest()
+
+
+def parse_address(address):
+    """
+    :param address: (str, tuple) "unix:/path/to/socket", "host:port" or (host, port)
+    :return: (tuple) ("unix", path) or ("tcp", host, port)
+    """
+    if isinstance(address, (tuple, list)):
+        return ('tcp', address[0], int(address[1]))
+    if address.startswith('unix:'):
+        return ('unix', address[len('unix:'):])
+    host, _, port = address.rpartition(':')
+    return ('tcp', host or '127.0.0.1', int(port))
+
+
+async def open_connection(address):
+    kind, *where = parse_address(address)
+    if kind == 'unix':
+        return await asyncio.open_unix_connection(*where)
+    return await asyncio.open_connection(*where)
+
+
+def frame(kind, payload=b''):
+    return FRAME.pack(kind, len(payload)) + payload
+
+
+async def read_frame(reader):
+    """
+    :return: (tuple) kind and payload of the next frame, (None, None) once the peer closed the connection
+    """
+    try:
+        header = await reader.readexactly(FRAME.size)
+        kind, length = FRAME.unpack(header)
+        return kind, await reader.readexactly(length) if length else b''
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        return None, None
+
+
+class RemoteStdin(object):
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def write(self, data):
+        self._connection.send(STDIN, data)
+
+    async def drain(self):
+        await self._connection.drain()
+
+    def close(self):
+        self._connection.send(CLOSE_STDIN)
+
+
+class RemoteHandle(object):
+    """
+    Takes the place of the asyncio.subprocess.Process of a local VASP
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.stdin = RemoteStdin(connection)
+        self.stdout = asyncio.StreamReader()
+        self.stderr = asyncio.StreamReader()
+        self.returncode = None
+        self._pid = None
+        self._started = asyncio.get_event_loop().create_future()
+        self._exit = asyncio.get_event_loop().create_future()
+
+    @property
+    def pid(self):
+        """
+        (int) the pid of VASP on the host of the worker, not a process of this host
+        """
+        return self._pid
+
+    def started(self, pid):
+        self._pid = pid
+        if not self._started.done():
+            self._started.set_result(pid)
+
+    def exited(self, returncode):
+        if self.returncode is not None:
+            return
+        self.returncode = returncode
+        self.stdout.feed_eof()
+        self.stderr.feed_eof()
+        if not self._started.done():
+            self._started.set_result(None)
+        self._exit.set_result(returncode)
+
+    async def wait_started(self):
+        return await asyncio.shield(self._started)
+
+    def send_signal(self, sig):
+        # the worker sends the signal to the process group of VASP
+        self._connection.send(TERMINATE, str(int(sig)).encode())
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    async def wait(self):
+        return await asyncio.shield(self._exit)
+
+
+class WorkerConnection(object):
+    """
+    The driver side of a worker. Runs one VASP process after the other on the worker
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._info = {}
+        self._handle = None
+        self._receiver = None
+        self._closed = False
+
+    @property
+    def info(self):
+        """
+        (dict) name, host, directory, pid and command of the worker as announced by it
+        """
+        return self._info
+
+    @property
+    def name(self):
+        return self._info.get('name')
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def handshake(self, token=None):
+        """
+        :param token: (str) the shared secret the worker has to prove it knows, any worker is accepted if None
+        """
+        challenge = os.urandom(32)
+        self._writer.write(frame(CHALLENGE, challenge))
+        await self._writer.drain()
+        kind, payload = await read_frame(self._reader)
+        if kind != HELLO:
+            raise ConnectionError(f'Expected a hello from the worker, got {kind!r}')
+        info = json.loads(payload)
+        auth = info.pop('auth', None)
+        if token is not None and not hmac.compare_digest(str(auth).encode(), answer_challenge(token, challenge).encode()):
+            raise ConnectionError(f'Worker {info.get("name")} failed to authenticate')
+        self._info = info
+        self._receiver = asyncio.ensure_future(self._receive())
+        return self._info
+
+    async def _receive(self):
+        while True:
+            kind, payload = await read_frame(self._reader)
+            handle = self._handle
+            if kind is None:
+                break
+            elif handle is None:
+                continue
+            elif kind == STARTED:
+                handle.started(int(payload))
+            elif kind == STDOUT:
+                handle.stdout.feed_data(payload)
+            elif kind == STDERR:
+                handle.stderr.feed_data(payload)
+            elif kind == EXIT:
+                handle.exited(int(payload))
+        self._closed = True
+        if self._handle is not None:
+            self._handle.exited(CONNECTION_LOST)
+
+    def send(self, kind, payload=b''):
+        if self._closed:
+            raise ConnectionResetError(f'The connection to worker {self.name} is closed')
+        self._writer.write(frame(kind, payload))
+
+    async def drain(self):
+        await self._writer.drain()
+
+    async def send_file(self, name, data):
+        self.send(FILE, name.encode() + b'\0' + data)
+        await self.drain()
+
+    async def send_inputs(self, directory, names=INPUT_FILES):
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as h:
+                await self.send_file(name, h.read())
+
+    async def start(self):
+        """
+        Starts VASP on the worker
+        :return: (RemoteHandle) the handle of the process
+        """
+        self._handle = RemoteHandle(self)
+        self.send(RUN)
+        await self.drain()
+        # the worker reports the pid of VASP, or its exit if the command could not be started
+        await self._handle.wait_started()
+        return self._handle
+
+    def stop(self):
+        self.send(STOP)
+
+    async def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._closed = True
+
+
+class RemoteVaspProcess(VaspInteractiveProcess):
+    """
+    A VaspInteractiveProcess whose VASP runs on a worker, the STOPCAR is written on the worker as well
+    """
+
+    def __init__(self, next_structure, connection, **kwargs):
+        # the command is run by the worker, it is known here as the worker announced it
+        super().__init__(next_structure, connection.info.get('command'), **kwargs)
+        self._connection = connection
+
+    @property
+    def connection(self):
+        return self._connection
+
+    async def create_process_handle(self):
+        return await self._connection.start()
+
+    def abort(self):
+        self._fire_callback(VaspInteractiveProcess.Callback.Exit)
+        if not self._connection.closed:
+            self._connection.stop()
+        self._abort = True
+
+    def cancel_abort(self):
+        # the worker removes a stale STOPCAR before it starts VASP
+        self._abort = False
+
+    def signal_group(self, sig=signal.SIGTERM):
+        # the worker signals the process group of VASP
+        if self._handle is not None and self._handle.returncode is None and not self._connection.closed:
+            self._handle.send_signal(sig)
+
+
+class VaspServer(object):
+    """
+    Accepts worker connections, accept() hands them out in the order they arrived
+    """
+
+    def __init__(self, address='127.0.0.1:0', token=None):
+        """
+        :param address: (str, tuple) "host:port" or "unix:/path", port 0 picks a free port (default: "127.0.0.1:0")
+        :param token: (str) the shared secret of the workers, taken from the environment variable
+            INTERACTIVE_VASP_TOKEN if None, every worker is accepted if neither is set (default: None)
+        """
+        self._address = parse_address(address)
+        self._token = token if token is not None else os.environ.get(TOKEN_VARIABLE)
+        self._server = None
+        self._connections = asyncio.Queue()
+
+    @property
+    def address(self):
+        """
+        (str) the address the workers connect to
+        """
+        if self._address[0] == 'unix':
+            return f'unix:{self._address[1]}'
+        host, port = self._server.sockets[0].getsockname()[:2] if self._server is not None else self._address[1:]
+        return f'{host}:{port}'
+
+    async def start(self):
+        kind, *where = self._address
+        if kind == 'unix':
+            self._server = await asyncio.start_unix_server(self._connected, *where)
+        else:
+            self._server = await asyncio.start_server(self._connected, *where)
+        return self
+
+    async def _connected(self, reader, writer):
+        connection = WorkerConnection(reader, writer)
+        try:
+            info = await connection.handshake(self._token)
+        except (ConnectionError, ValueError):
+            logging.exception('Rejected a worker')
+            writer.close()
+            return
+        logging.info(f'Worker {info.get("name")} connected from {info.get("host")}')
+        await self._connections.put(connection)
+
+    async def accept(self):
+        """
+        :return: (WorkerConnection) the next worker which connected
+        """
+        while True:
+            connection = await self._connections.get()
+            if not connection.closed:
+                return connection
+
+    def release(self, connection):
+        """
+        Hands a connection back, e.g. after a pool finished, the next accept() returns it again
+        """
+        if not connection.closed:
+            self._connections.put_nowait(connection)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        while not self._connections.empty():
+            await self._connections.get_nowait().close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+async def forward(stream, writer, kind):
+    while True:
+        data = await stream.read(BLOCK_SIZE)
+        if not data:
+            break
+        writer.write(frame(kind, data))
+        await writer.drain()
+
+
+def terminate_group(process, sig=signal.SIGTERM):
+    # VASP runs in a session of its own, the signal reaches all ranks started by mpirun
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def run_process(command, directory, writer):
+    stopcar = os.path.join(directory, 'STOPCAR')
+    if os.path.exists(stopcar):
+        os.remove(stopcar)
+    PIPE = asyncio.subprocess.PIPE
+    process = await asyncio.create_subprocess_exec(*shlex.split(command), stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=directory, start_new_session=True)
+    writer.write(frame(STARTED, str(process.pid).encode()))
+
+    async def pump():
+        await asyncio.gather(forward(process.stdout, writer, STDOUT), forward(process.stderr, writer, STDERR))
+        returncode = await process.wait()
+        writer.write(frame(EXIT, str(returncode).encode()))
+        await writer.drain()
+
+    return process, asyncio.ensure_future(pump())
+
+
+async def run_worker(address, command, directory=os.getcwd(), name=None, token=None):
+    """
+    The worker shim: connects to the driver at address and runs command in directory whenever it is told to
+    :param token: (str) the shared secret of the driver, taken from INTERACTIVE_VASP_TOKEN if None (default: None)
+    """
+    os.makedirs(directory, exist_ok=True)
+    token = token if token is not None else os.environ.get(TOKEN_VARIABLE)
+    reader, writer = await open_connection(address)
+    kind, challenge = await read_frame(reader)
+    if kind != CHALLENGE:
+        writer.close()
+        raise ConnectionError(f'Expected a challenge from the driver, got {kind!r}')
+    hello = dict(name=name or f'{socket.gethostname()}:{os.getpid()}', host=socket.gethostname(), directory=os.path.abspath(directory), pid=os.getpid(), command=command,
+                 auth=None if token is None else answer_challenge(token, challenge))
+    writer.write(frame(HELLO, json.dumps(hello).encode()))
+    await writer.drain()
+    process, pump = None, None
+    try:
+        while True:
+            kind, payload = await read_frame(reader)
+            if kind is None:
+                break
+            elif kind == FILE:
+                file_name, _, data = payload.partition(b'\0')
+                write_bytes(os.path.join(directory, os.path.basename(file_name.decode())), data)
+            elif kind == RUN:
+                try:
+                    process, pump = await run_process(command, directory, writer)
+                except OSError:
+                    logging.exception(f'Cannot run {command}')
+                    writer.write(frame(EXIT, str(NOT_STARTED).encode()))
+                    await writer.drain()
+            elif kind == STDIN and process is not None:
+                try:
+                    process.stdin.write(payload)
+                    await process.stdin.drain()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+            elif kind == CLOSE_STDIN and process is not None:
+                process.stdin.close()
+            elif kind == STOP:
+                with open(os.path.join(directory, 'STOPCAR'), 'w') as h:
+                    h.write('LSTOP = .TRUE.\n')
+            elif kind == TERMINATE and process is not None and process.returncode is None:
+                # the payload is the signal number, SIGTERM if it is empty
+                terminate_group(process, int(payload) if payload else signal.SIGTERM)
+    finally:
+        # the driver is gone, VASP must not run on unattended
+        if process is not None and process.returncode is None:
+            terminate_group(process)
+            await process.wait()
+        if pump is not None:
+            pump.cancel()
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m interactive.remote', description='Connects a local interactive VASP to a remote driver')
+    parser.add_argument('--connect', required=True, help='address of the driver, host:port or unix:/path')
+    parser.add_argument('--directory', default=os.getcwd(), help='where the input files are written and VASP runs')
+    parser.add_argument('--name', default=None, help='name of the worker reported to the driver')
+    parser.add_argument('--token-file', default=None, help=f'file holding the shared secret of the driver, ${TOKEN_VARIABLE} is used if not given')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='the VASP command, after --')
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error('no VASP command given')
+    token = None
+    if args.token_file is not None:
+        with open(args.token_file) as h:
+            token = h.read().strip()
+    asyncio.run(run_worker(args.connect, shlex.join(command), directory=args.directory, name=args.name, token=token))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,27 +1,16 @@
-
 import os
 import sys
 import shutil
 import logging
 import asyncio
 import warnings
-import functools
 import numpy as np
 from .aio import execute_coro
 from .vasp import VaspInteractiveProcess
+from .inputs import write_inputs, write_incar
+from .structures import StructureSource, SourceExhausted
 from .utils import ensure_iterable_of_type
 
-try:
-    import pymatgen
-except ImportError:
-    warnings.warn('Cannot import pymatgen')
-
-
-logging.basicConfig(
-    format = '▸ %(asctime)s.%(msecs)03d %(filename)s:%(lineno)d %(levelname)s %(message)s',
-    level = logging.INFO,
-    datefmt = '%H:%M:%S')
-
 
 def complete_incar(incar: dict):
     incar = incar.copy()
@@ -40,33 +29,59 @@ def complete_incar(incar: dict):
     return incar
 
 
-def generate_structure_wrapper(f):
-    
-    def _wrapper(process):
-        positions = f(process)
-        # if it is ase.Atoms
-        if hasattr(positions, 'get_scaled_positions'):
-            positions = positions.get_scaled_positions()
-        elif hasattr(positions, 'frac_coords'):
-            positions = positions.frac_coords
-        
-        if isinstance(positions, np.ndarray):
-            positions = positions.tolist()
+def to_positions(positions):
+    # if it is ase.Atoms
+    if hasattr(positions, 'get_scaled_positions'):
+        positions = positions.get_scaled_positions()
+    elif hasattr(positions, 'frac_coords'):
+        positions = positions.frac_coords
+    # a (lattice, symbols, positions) tuple or list as accepted by interactive.inputs
+    elif isinstance(positions, (tuple, list)) and len(positions) == 3 and len(positions[1]) and isinstance(positions[1][0], str):
+        positions = positions[2]
 
-        return positions
+    return np.asarray(positions, dtype=np.float64)
 
-    return _wrapper
 
+def generate_structure_wrapper(f, executor=None, prefetch=False, skip=0):
+    return StructureSource(f, transform=to_positions, executor=executor, prefetch=prefetch, skip=skip)
 
-def construct_proc_handle(gen_structure, executeable, directory=os.getcwd(), stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None, callbacks=None):
+
+def merge_callbacks(callbacks, extra, first=False):
+    """
+    :param callbacks: (dict) callbacks by Callback or its value, a function or a sequence of functions each
+    :param extra: (dict) callbacks added to those of the same type
+    :param first: (bool) whether the extra callbacks run before the given ones (default: False)
+    :return: (dict) the merged callbacks as tuples by Callback
+    """
+    merged = {VaspInteractiveProcess.Callback(cb): ensure_iterable_of_type(tuple, funcs) for cb, funcs in (callbacks or {}).items()}
+    for cb, funcs in extra.items():
+        cb, funcs = VaspInteractiveProcess.Callback(cb), ensure_iterable_of_type(tuple, funcs)
+        merged[cb] = funcs + merged.get(cb, ()) if first else merged.get(cb, ()) + funcs
+    return merged
+
+
+def construct_proc_handle(gen_structure, executeable, directory=os.getcwd(), stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None, callbacks=None, trajectory=None, structure_executor=None, prefetch=False, chunk_size=None, high_water=None, cache=None, skip=0, tracer=None, dispatcher=None, outcar=None, worker=None, watchdog=None, inline_callbacks=None):
     
-    structure_generator = generate_structure_wrapper(gen_structure)
+    structure_generator = generate_structure_wrapper(gen_structure, executor=structure_executor, prefetch=prefetch, skip=skip)
 
-    proc_handle = VaspInteractiveProcess(
-        structure_generator, executeable, directory=directory, 
-        stdin=stdin, stdout=stdout, stderr=stderr,
+    options = dict(
+        directory=directory, stdin=stdin, stdout=stdout, stderr=stderr,
         stdin_proc=stdin_proc, stdout_proc=stdout_proc, stderr_proc=stderr_proc,
-        loop=loop)
+        loop=loop, trajectory=trajectory, chunk_size=chunk_size, high_water=high_water, cache=cache, tracer=tracer, dispatcher=dispatcher, watchdog=watchdog)
+    if worker is None:
+        proc_handle = VaspInteractiveProcess(structure_generator, executeable, **options)
+    else:
+        # a remote VASP is reached through the connection of its worker instead of a command
+        from .remote import RemoteVaspProcess
+        proc_handle = RemoteVaspProcess(structure_generator, worker, **options)
+
+    # registered first, the callbacks find the OUTCAR data in the ionic step record
+    if outcar is not None:
+        outcar.register(proc_handle)
+
+    for cb, funcs in (inline_callbacks or {}).items():
+        for f in ensure_iterable_of_type(tuple, funcs):
+            proc_handle.register_callback(cb, f, inline=True)
 
     for cb, funcs in (callbacks or {}).items():
         for f in ensure_iterable_of_type(tuple, funcs):
@@ -75,28 +90,12 @@ def construct_proc_handle(gen_structure, executeable, directory=os.getcwd(), std
     return proc_handle
 
 
-def copy_or_write(fname, clasz, transform=None, directory=os.getcwd()):
-
-    if isinstance(fname, str):
-        # the we copy just the file to out new directory
-        obj = clasz.from_file(fname)
-    elif isinstance(fname, clasz):
-        obj = fname
-    else:
-        # finally we try to throw it into the constructore of the corresponding type
-        obj = clasz(fname)
-
-    obj = transform(obj) if transform is not None else obj
-
-    obj.write_file(os.path.join(directory, clasz.__name__.upper()))
-
-
-async def run_vasp_calculation(gen_structure, incar, kpoints, potcar, directory=os.getcwd(), executable=None, stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None, callbacks=None):
+async def run_vasp_calculation(gen_structure, incar, kpoints, potcar, directory=os.getcwd(), executable=None, stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None, callbacks=None, trajectory=None, trajectory_file=None, structure_executor=None, prefetch=False, chunk_size=None, high_water=None, cache=None, journal_file=None, resume=False, tracer=None, staging=None, dispatcher=None, outcar=False, worker=None, watchdog=None, inline_callbacks=None):
 
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    if executable is None:
+    if executable is None and worker is None:
         for binary_name in 'vasp', 'vasp_std', 'vasp_gam', 'vasp_ncl':
             executable = shutil.which(binary_name)
             if executable is not None: 
@@ -106,18 +105,72 @@ async def run_vasp_calculation(gen_structure, incar, kpoints, potcar, directory=
 
     loop = loop or asyncio.get_event_loop()
 
-    proc_handle = construct_proc_handle(gen_structure, executable, directory=directory, stdout=stdout, stderr=stderr, stdin=stdin, stdout_proc=stdout_proc, stderr_proc=stderr_proc, stdin_proc=stdin_proc, loop=loop, callbacks=callbacks)
-
-    first_structure = gen_structure(proc_handle)
-    # do imports
-    from pymatgen.io.vasp import Poscar, Incar, Kpoints, Potcar
-    copy_or_write_ = functools.partial(copy_or_write, directory=directory)
-    copy_or_write_(first_structure, Poscar)
-    copy_or_write_(incar, Incar, transform=lambda inc: Incar(complete_incar(inc)))
-    copy_or_write_(kpoints, Kpoints)
-    copy_or_write_(potcar, Potcar)
-
-    async with proc_handle:
-        await proc_handle.wait()
+    # the subsystems are imported once they are used, a plain run starts without sqlite3, sockets and the like
+    own_cache = isinstance(cache, str)
+    if own_cache:
+        from .cache import ResultCache
+        cache = ResultCache(cache)
+
+    journal, skip = None, 0
+    if journal_file is not None:
+        from .journal import StepJournal
+        journal = StepJournal(os.path.join(directory, journal_file), resume=resume)
+        # the structure stream continues from the first unfinished item
+        skip = journal.resume_index
+
+    tailer = None
+    if outcar:
+        from .outcar import OutcarTailer
+        tailer = OutcarTailer(directory)
+    proc_handle = construct_proc_handle(gen_structure, executable, directory=directory, stdout=stdout, stderr=stderr, stdin=stdin, stdout_proc=stdout_proc, stderr_proc=stderr_proc, stdin_proc=stdin_proc, loop=loop, callbacks=callbacks, trajectory=trajectory, structure_executor=structure_executor, prefetch=prefetch, chunk_size=chunk_size, high_water=high_water, cache=cache, skip=skip, tracer=tracer, dispatcher=dispatcher, outcar=tailer, worker=worker, watchdog=watchdog, inline_callbacks=inline_callbacks)
+    if journal is not None:
+        journal.register(proc_handle)
+
+    try:
+        first_structure = await proc_handle.first_structure()
+    except SourceExhausted:
+        if journal is None or not journal.completed:
+            raise
+        logging.info(f'All structures of {journal.path} are completed')
+        journal.close()
+        if own_cache:
+            cache.close()
+        return proc_handle
+    if isinstance(staging, str):
+        from .staging import StagingArea
+        staging = StagingArea(staging)
+    write_inputs(directory, first_structure, incar, kpoints, potcar, staging=staging, incar_transform=complete_incar)
+    # hashed before the restart tags are set, a resumed run finds the results of the run it continues
+    if cache is not None:
+        from .cache import input_set_digest
+        proc_handle.cache_inputs = input_set_digest(directory)
+    if resume:
+        from .journal import restart_incar
+        incar_path = os.path.join(directory, 'INCAR')
+        write_incar(incar_path, incar_path, transform=lambda inc: restart_incar(inc, directory), staging=staging)
+    if worker is not None:
+        await worker.send_inputs(directory)
+
+    writer = None
+    if trajectory_file is not None:
+        from .storage import TrajectoryWriter
+        writer = TrajectoryWriter(os.path.join(directory, trajectory_file))
+        proc_handle.register_callback(VaspInteractiveProcess.Callback.IonicStepFinished, writer, inline=True)
+
+    # a STOPCAR left over from a previous run would stop VASP right away
+    proc_handle.cancel_abort()
+
+    try:
+        async with proc_handle:
+            await proc_handle.wait()
+    finally:
+        if writer is not None:
+            writer.close()
+        if own_cache:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if tailer is not None:
+            tailer.close()
 
     return proc_handle
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Orders a finite batch of structures into a short path, such that each structure fed to VASP is close to the
+previous one and the wavefunction extrapolation saves SCF iterations. Distances are minimum image
+displacements of the fractional coordinates, converted to Cartesian if the lattice is known
+
+    order = schedule_order(structures)
+    results = await run_scheduled(structures, incar, kpoints, potcar)  # in the original order
+    scf_report(results)
+"""
+import logging
+import numpy as np
+from .runner import to_positions, run_vasp_calculation, merge_callbacks
+from .vasp import VaspInteractiveProcess
+
+
+def lattice_matrix(structure):
+    if hasattr(structure, 'get_cell'):
+        return np.asarray(structure.get_cell(), dtype=np.float64)
+    elif hasattr(structure, 'lattice'):
+        return np.asarray(structure.lattice.matrix, dtype=np.float64)
+    return None
+
+
+def distance_matrix(positions, lattice=None):
+    """
+    :param positions: (array) fractional coordinates of shape (nstructures, natoms, 3)
+    :param lattice: (array) the lattice vectors as rows, fractional distances are used if None (default: None)
+    :return: (array) the (nstructures, nstructures) matrix of the Euclidean norms of the displacements
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    distances = np.empty((len(positions), len(positions)))
+    # one row at a time, the full (n, n, natoms, 3) displacement tensor does not fit into memory for large batches
+    for i, p in enumerate(positions):
+        d = positions - p
+        d -= np.rint(d)
+        if lattice is not None:
+            d = d @ lattice
+        distances[i] = np.sqrt(np.einsum('sij,sij->s', d, d))
+    return distances
+
+
+def nearest_neighbour_path(distances, start=0):
+    n = len(distances)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, distances[order[-1]])
+        nearest = int(np.argmin(row))
+        order.append(nearest)
+        visited[nearest] = True
+    return order
+
+
+def path_length(distances, order):
+    return float(sum(distances[a, b] for a, b in zip(order, order[1:])))
+
+
+def two_opt(distances, order, max_passes=10):
+    """
+    Improves an open path by reversing segments as long as this shortens it. The start is kept
+    """
+    order = np.array(order)
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 2):
+            a, b = order[i], order[i + 1]
+            c = order[i + 2:]
+            # reversing order[i + 1:j + 1] replaces the edges (a, b) and (c, d) by (a, c) and (b, d)
+            d = np.append(order[i + 3:], -1)
+            gain = distances[a, b] - distances[a, c] + np.where(d >= 0, distances[c, d] - distances[b, d], 0.0)
+            j = int(np.argmax(gain))
+            if gain[j] > 1e-12:
+                order[i + 1:i + j + 3] = order[i + 1:i + j + 3][::-1]
+                improved = True
+        if not improved:
+            break
+    return order.tolist()
+
+
+def schedule_order(structures, lattice=None, start=0, improve=True):
+    """
+    :param structures: (sequence) structures sharing one lattice and the species, or fractional coordinates
+    :param lattice: (array) the lattice vectors, taken from the first structure if None (default: None)
+    :param start: (int) index of the structure fed first (default: 0)
+    :param improve: (bool) whether the nearest-neighbour path is improved with 2-opt (default: True)
+    :return: (list) the order in which the structures should be computed
+    """
+    structures = list(structures)
+    if len(structures) < 3:
+        return list(range(len(structures)))
+    lattice = lattice_matrix(structures[0]) if lattice is None else np.asarray(lattice, dtype=np.float64)
+    distances = distance_matrix([to_positions(s) for s in structures], lattice=lattice)
+    order = nearest_neighbour_path(distances, start=start)
+    if improve:
+        order = two_opt(distances, order)
+    logging.info(f'schedule: path length {path_length(distances, range(len(structures))):.3f} -> {path_length(distances, order):.3f}')
+    return order
+
+
+def inverse_order(order):
+    inverse = [None] * len(order)
+    for position, index in enumerate(order):
+        inverse[index] = position
+    return inverse
+
+
+def restore_order(results, order):
+    """
+    Maps results computed in the scheduled order back to the original order of the structures
+    """
+    return [results[position] for position in inverse_order(order)]
+
+
+def scf_report(results):
+    """
+    Logs and returns the SCF iterations per ionic step of results as returned by run_scheduled or run_vasp_pool
+    """
+    nscf = np.array([r['nscf'] if r is not None and r.get('nscf') is not None else -1 for r in results])
+    computed = nscf[nscf >= 0]
+    if len(computed):
+        logging.info(f'SCF iterations: total {computed.sum()}, mean {computed.mean():.2f} per ionic step over {len(computed)} steps')
+    return nscf
+
+
+async def run_scheduled(structures, incar, kpoints, potcar, lattice=None, improve=True, **kwargs):
+    """
+    Computes a batch of structures in a single interactive VASP process in the scheduled order
+    :param kwargs: passed on to run_vasp_calculation
+    :return: (list) summary, forces and nscf of each structure in the original order
+    """
+    structures = list(structures)
+    order = schedule_order(structures, lattice=lattice, improve=improve)
+    scheduled = iter([structures[i] for i in order])
+    results = []
+
+    def next_structure(_):
+        return next(scheduled)
+
+    def ionic_step_finished(ionic_step, data=None, scf_steps=None, **_):
+        # VASP repeats the last structure after the STOPCAR was written
+        if len(results) < len(structures):
+            data = data or {}
+            results.append(dict(summary=data.get('summary'), forces=data.get('forces'), nscf=scf_steps))
+
+    inline_callbacks = merge_callbacks(kwargs.pop('inline_callbacks', None), {VaspInteractiveProcess.Callback.IonicStepFinished: ionic_step_finished})
+    await run_vasp_calculation(next_structure, incar, kpoints, potcar, inline_callbacks=inline_callbacks, **kwargs)
+    results.extend([None] * (len(structures) - len(results)))
+    return restore_order(results, order)
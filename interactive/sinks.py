@@ -0,0 +1,200 @@
+"""
+Output targets which can be passed as stdout/stderr to InteractiveProcess
+
+    with CompressedLogSink('vasp.log.gz') as log:
+        run_vasp_calculation(..., stdout=(log, LineFilter(sys.stdout, ('summary', 'error'))))
+"""
+import io
+import gzip
+import queue
+import threading
+from .vasp import as_bytes, regex_scf_table_header, regex_scf_table_row, regex_ionic_step_complete, regex_ion_forces
+
+try:
+    from compression import zstd
+
+    def open_zstd(path, level=None):
+        return zstd.open(path, 'wb', level=level)
+except ImportError:
+    try:
+        import zstandard
+
+        def open_zstd(path, level=None):
+            return zstandard.open(path, 'wb', cctx=zstandard.ZstdCompressor(level=3 if level is None else level))
+    except ImportError:
+        open_zstd = None
+
+
+def open_compressed(path, compression=None, level=None):
+    if compression is None:
+        compression = 'zstd' if path.endswith('.zst') or (open_zstd is not None and not path.endswith('.gz')) else 'gzip'
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6 if level is None else level)
+    elif compression == 'zstd':
+        if open_zstd is None:
+            raise ImportError('zstd compression requires Python 3.14 or the zstandard package')
+        return open_zstd(path, level=level)
+    raise ValueError(f'Unknown compression {compression!r}')
+
+
+class CompressedLogSink(object):
+    """
+    A write-only stream which compresses everything written to it on a background thread. At most
+    max_pending blocks are buffered, write blocks if the compression cannot keep up
+    """
+
+    # tells NonFileStreamWriter to pass the data as it is
+    binary = True
+
+    def __init__(self, path, compression=None, level=None, max_pending=256):
+        """
+        :param path: (str) the file to write
+        :param compression: (str) "gzip" or "zstd", zstd is used if available and path does not end with .gz (default: None)
+        :param level: (int) compression level (default: None)
+        :param max_pending: (int) number of blocks buffered before write blocks (default: 256)
+        """
+        self._path = path
+        self._handle = open_compressed(path, compression=compression, level=level)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f'CompressedLogSink({path})', daemon=True)
+        self._thread.start()
+
+    @property
+    def path(self):
+        return self._path
+
+    def fileno(self):
+        raise io.UnsupportedOperation('fileno')
+
+    def _run(self):
+        while True:
+            block = self._queue.get()
+            blocks = [block]
+            # coalesce whatever is waiting into a single write
+            while block is not None:
+                try:
+                    block = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                blocks.append(block)
+            done = blocks[-1] is None
+            try:
+                if self._error is None:
+                    self._handle.write(b''.join(blocks[:-1] if done else blocks))
+            except Exception as e:
+                self._error = e
+            for _ in blocks:
+                self._queue.task_done()
+            if done:
+                break
+
+    def write(self, data):
+        if self._closed:
+            raise ValueError('write to closed sink')
+        if self._error is not None:
+            raise self._error
+        if isinstance(data, str):
+            data = data.encode()
+        if data:
+            self._queue.put(data)
+        return len(data)
+
+    def flush(self):
+        self._queue.join()
+        if not self._closed:
+            self._handle.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._handle.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+regex_scf_table_header_bytes = as_bytes(regex_scf_table_header)
+regex_scf_table_row_bytes = as_bytes(regex_scf_table_row)
+regex_ionic_step_complete_bytes = as_bytes(regex_ionic_step_complete)
+regex_ion_forces_bytes = as_bytes(regex_ion_forces)
+
+error_tokens = (b'ERROR', b'Error', b'error', b'BAD TERMINATION', b'abort')
+warning_tokens = (b'WARNING', b'Warning', b'W    W')
+
+LINE_CLASSES = ('main_loop', 'scf_header', 'scf', 'forces', 'summary', 'positions', 'error', 'warning', 'other')
+
+
+def classify_line(line):
+    if b'F=' in line and regex_ionic_step_complete_bytes.match(line):
+        return 'summary'
+    elif line.startswith(b'POSITIONS:'):
+        return 'positions'
+    elif any(token in line for token in error_tokens):
+        return 'error'
+    elif any(token in line for token in warning_tokens):
+        return 'warning'
+    elif b':' in line and regex_scf_table_row_bytes.match(line):
+        return 'scf'
+    elif b'rms(c)' in line and regex_scf_table_header_bytes.match(line):
+        return 'scf_header'
+    elif line.startswith(b'FORCES:') or regex_ion_forces_bytes.match(line):
+        return 'forces'
+    elif b'entering' in line and b'main' in line:
+        return 'main_loop'
+    return 'other'
+
+
+class LineFilter(object):
+    """
+    Passes only lines of the selected classes on to target, e.g. LineFilter(sys.stdout, ('summary', 'error')).
+    The classes are listed in LINE_CLASSES
+    """
+
+    binary = True
+
+    def __init__(self, target, classes=('summary', 'error'), classify=classify_line):
+        unknown = set(classes) - set(LINE_CLASSES)
+        if unknown and classify is classify_line:
+            raise ValueError(f'Unknown line classes: {", ".join(sorted(unknown))}')
+        self._target = target
+        self._classes = frozenset(classes)
+        self._classify = classify
+        self._remainder = b''
+        self._text = not getattr(target, 'binary', False) and isinstance(target, io.TextIOBase)
+
+    def fileno(self):
+        raise io.UnsupportedOperation('fileno')
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._remainder:
+            data = self._remainder + data
+        end = data.rfind(b'\n') + 1
+        data, self._remainder = data[:end], data[end:]
+        selected = b''.join(line for line in data.splitlines(keepends=True) if self._classify(line) in self._classes)
+        if selected:
+            self._target.write(selected.decode() if self._text else selected)
+        return len(data)
+
+    def flush(self):
+        flush = getattr(self._target, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        # an unterminated last line is only passed on when the filter is closed
+        if self._remainder:
+            remainder, self._remainder = self._remainder, b''
+            self.write(remainder + b'\n')
+        self.flush()
@@ -0,0 +1,177 @@
+"""
+Content-addressed store for input files. Each input is hashed once and stored under its SHA-256 digest, calculation
+directories get a hard link to the stored file, or a symbolic link if the store is on another file system, or a copy
+as last resort. Only the large files nobody edits (the POTCAR) are linked, the stored files are read-only and a link
+shares that, the others are copied from the store. A file which already has the right content is left alone
+
+    staging = StagingArea('/tmp/vasp-staging')
+    await run_vasp_pool(structures, incar, kpoints, 'POTCAR', workers=8, staging=staging)
+"""
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+
+METHODS = ('hardlink', 'symlink', 'copy')
+# INCAR, KPOINTS and POSCAR are small and edited in place by users and tools, they are copied
+LINKED = ('POTCAR',)
+BLOCK_SIZE = 2 ** 20
+
+
+def default_root():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.environ.get('INTERACTIVE_VASP_STAGING') or os.path.join(cache, 'interactive-vasp', 'staging')
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as h:
+        for block in iter(lambda: h.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StagingArea(object):
+    """
+    The store keeps blobs/<digest> and an index of the digests of source files by path, size, inode and modification
+    time, hence a source file is read again only if it changed, also across processes
+    """
+
+    def __init__(self, root=None, methods=METHODS, linked=LINKED):
+        """
+        :param root: (str) directory of the store, $INTERACTIVE_VASP_STAGING or ~/.cache/interactive-vasp/staging if None (default: None)
+        :param methods: (tuple) the ways to materialize a file, tried in order (default: ('hardlink', 'symlink', 'copy'))
+        :param linked: (tuple) names of the files materialized with methods, all others are copied (default: ('POTCAR',))
+        """
+        unknown = set(methods) - set(METHODS)
+        if unknown:
+            raise ValueError(f'Unknown staging methods: {", ".join(sorted(unknown))}')
+        self._root = os.path.abspath(default_root() if root is None else root)
+        self._methods = tuple(methods)
+        self._linked = frozenset(linked)
+        self._digests = {}
+        self._stats = dict.fromkeys(('hashed', 'stored', 'skipped', *METHODS), 0)
+        for name in ('blobs', 'index'):
+            os.makedirs(os.path.join(self._root, name), exist_ok=True)
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def stats(self):
+        """
+        (dict) number of files hashed, stored, skipped because they were up to date and materialized per method
+        """
+        return self._stats
+
+    def blob(self, digest):
+        return os.path.join(self._root, 'blobs', digest[:2], digest)
+
+    def _index_path(self, path, stat):
+        key = f'{os.path.realpath(path)}\0{stat.st_size}\0{stat.st_ino}\0{stat.st_mtime_ns}'
+        return os.path.join(self._root, 'index', hashlib.sha256(key.encode()).hexdigest())
+
+    def digest(self, path):
+        """
+        The SHA-256 digest of the file at path, computed at most once per version of the file
+        """
+        stat = os.stat(path)
+        index = self._index_path(path, stat)
+        digest = self._digests.get(index)
+        if digest is None:
+            try:
+                with open(index) as h:
+                    digest = h.read().strip()
+            except FileNotFoundError:
+                digest = hash_file(path)
+                self._stats['hashed'] += 1
+                self._write_atomically(index, digest.encode())
+            self._digests[index] = digest
+        return digest
+
+    def _write_atomically(self, path, data):
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(handle, 'wb') as h:
+            h.write(data)
+        os.replace(temporary, path)
+        return path
+
+    def _store(self, digest, write):
+        blob = self.blob(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=os.path.dirname(blob), prefix='.tmp-')
+            os.close(handle)
+            write(temporary)
+            # read-only, a program writing into a materialized file must not change the stored one
+            os.chmod(temporary, 0o444)
+            os.replace(temporary, blob)
+            self._stats['stored'] += 1
+        return blob
+
+    def store_bytes(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+
+        def write(path):
+            with open(path, 'wb') as h:
+                h.write(data)
+
+        self._store(digest, write)
+        return digest
+
+    def store_file(self, path):
+        digest = self.digest(path)
+        self._store(digest, lambda temporary: shutil.copyfile(path, temporary))
+        return digest
+
+    def _up_to_date(self, digest, destination, linked=True):
+        blob = self.blob(digest)
+        try:
+            if os.path.samefile(blob, destination):
+                # a file which must be a copy is replaced, e.g. one linked by an older version
+                return linked
+            if os.path.getsize(blob) != os.path.getsize(destination):
+                return False
+        except FileNotFoundError:
+            return False
+        return hash_file(destination) == digest
+
+    def materialize(self, digest, destination):
+        """
+        Links or copies the stored content to destination, unless it is already there
+        :return: (str) the method used or "skipped"
+        """
+        linked = os.path.basename(destination) in self._linked
+        if self._up_to_date(digest, destination, linked=linked):
+            self._stats['skipped'] += 1
+            return 'skipped'
+        blob = self.blob(digest)
+        temporary = os.path.join(os.path.dirname(os.path.abspath(destination)), f'.{os.path.basename(destination)}.{os.getpid()}.tmp')
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        methods = self._methods if linked else ('copy',)
+        for method in methods:
+            try:
+                if method == 'hardlink':
+                    os.link(blob, temporary)
+                elif method == 'symlink':
+                    os.symlink(blob, temporary)
+                else:
+                    shutil.copyfile(blob, temporary)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+                    raise
+                continue
+            # replacing the destination never writes through an existing link
+            os.replace(temporary, destination)
+            self._stats[method] += 1
+            return method
+        raise OSError(f'Cannot materialize {blob} at {destination} with {", ".join(methods)}')
+
+    def place_bytes(self, data, destination):
+        return self.materialize(self.store_bytes(data), destination)
+
+    def place_file(self, source, destination):
+        return self.materialize(self.store_file(source), destination)
@@ -0,0 +1,198 @@
+"""
+Append-only trajectory file. The file starts with a small header followed by fixed size records,
+one per ionic step. Records are appended and flushed as soon as an ionic step finishes, hence the
+file can be memory-mapped and read while the calculation is still running
+
+    header: MAGIC | version (uint32) | header length (uint32) | JSON encoded metadata padded with spaces
+    record: step, F, E0, dE, nscf, E, rms (last SCF row), positions (natoms, 3), forces (natoms, 3)
+"""
+import os
+import json
+import struct
+import numpy as np
+
+MAGIC = b'IVASPTRJ'
+VERSION = 1
+HEADER_ALIGNMENT = 64
+HEADER_PREFIX = struct.Struct('<8sII')
+
+
+def record_dtype(natoms):
+    return np.dtype([
+        ('step', '<i8'),
+        ('F', '<f8'),
+        ('E0', '<f8'),
+        ('dE', '<f8'),
+        ('nscf', '<i8'),
+        ('scf_E', '<f8'),
+        ('scf_rms', '<f8'),
+        ('positions', '<f8', (natoms, 3)),
+        ('forces', '<f8', (natoms, 3))
+    ])
+
+
+def encode_header(natoms, **metadata):
+    metadata = json.dumps(dict(natoms=natoms, fields=record_dtype(natoms).descr, **metadata)).encode()
+    length = HEADER_PREFIX.size + len(metadata) + 1
+    length += -length % HEADER_ALIGNMENT
+    return HEADER_PREFIX.pack(MAGIC, VERSION, length) + metadata.ljust(length - HEADER_PREFIX.size - 1) + b'\n'
+
+
+def read_header(handle):
+    """
+    :return: (tuple) the header length and the metadata, (None, None) if the header is not complete yet
+    """
+    name = getattr(handle, 'name', handle)
+    prefix = handle.read(HEADER_PREFIX.size)
+    if len(prefix) < HEADER_PREFIX.size:
+        return None, None
+    magic, version, length = HEADER_PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError(f'{name} is not a trajectory file')
+    if version != VERSION:
+        raise ValueError(f'Unsupported trajectory file version {version}')
+    data = handle.read(length - HEADER_PREFIX.size)
+    if len(data) < length - HEADER_PREFIX.size:
+        return None, None
+    try:
+        metadata = json.loads(data)
+    except ValueError:
+        raise ValueError(f'The header of {name} is corrupt') from None
+    return length, metadata
+
+
+class TrajectoryWriter(object):
+    """
+    Streams finished ionic steps to an append-only file. Instances can be registered as
+    IonicStepFinished callback. An existing file is continued, a partially written record is discarded and a
+    partially written header is written again
+    """
+
+    def __init__(self, path, natoms=None, **metadata):
+        self._path = path
+        self._natoms = natoms
+        self._metadata = metadata
+        self._dtype = None
+        self._handle = None
+        self._record = None
+        if natoms is not None:
+            self._open(natoms)
+
+    @property
+    def path(self):
+        return self._path
+
+    def _open(self, natoms):
+        self._natoms = natoms
+        self._dtype = record_dtype(natoms)
+        self._record = np.zeros(1, dtype=self._dtype)
+        length, metadata = None, None
+        if os.path.exists(self._path) and os.path.getsize(self._path):
+            with open(self._path, 'rb') as h:
+                length, metadata = read_header(h)
+        if metadata is not None:
+            if metadata['natoms'] != natoms:
+                raise ValueError(f'{self._path} was written for {metadata["natoms"]} atoms, not {natoms}')
+            self._handle = open(self._path, 'r+b')
+            size = os.path.getsize(self._path) - length
+            self._handle.truncate(length + size - size % self._dtype.itemsize)
+            self._handle.seek(0, os.SEEK_END)
+        else:
+            # a new file, or one whose header was cut short by a crash and which therefore holds no records.
+            # The header is written next to it and moved over it, such that it is complete once the file exists
+            temporary = f'{self._path}.{os.getpid()}.tmp'
+            with open(temporary, 'wb') as h:
+                h.write(encode_header(natoms, **self._metadata))
+            os.replace(temporary, self._path)
+            self._handle = open(self._path, 'r+b')
+            self._handle.seek(0, os.SEEK_END)
+
+    def write(self, step, summary, scf=None, positions=None, forces=None):
+        if self._handle is None:
+            shaped = forces if forces is not None else positions
+            if shaped is None:
+                raise ValueError('Cannot determine the number of atoms')
+            self._open(len(shaped))
+        record = self._record[0]
+        record['step'] = step
+        for name in ('F', 'E0', 'dE'):
+            record[name] = summary.get(name, np.nan)
+        record['nscf'] = len(scf) if scf else 0
+        record['scf_E'] = scf[-1]['E'] if scf else np.nan
+        record['scf_rms'] = scf[-1]['rms'] if scf else np.nan
+        record['positions'] = np.nan if positions is None else positions
+        record['forces'] = np.nan if forces is None else forces
+        self._handle.write(self._record.tobytes())
+        self._handle.flush()
+
+    def __call__(self, ionic_step, data=None, **_):
+        data = data or {}
+        self.write(ionic_step, data.get('summary', {}), scf=data.get('scf'), positions=data.get('positions'), forces=data.get('forces'))
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TrajectoryReader(object):
+    """
+    Zero-copy, memory-mapped view of a trajectory file. Call refresh() to pick up records appended since
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._records = None
+        self._header_length = None
+        self._metadata = None
+        self.refresh()
+
+    @property
+    def metadata(self):
+        return self._metadata
+
+    @property
+    def natoms(self):
+        return None if self._metadata is None else self._metadata['natoms']
+
+    def refresh(self):
+        if self._metadata is None:
+            with open(self._path, 'rb') as h:
+                self._header_length, self._metadata = read_header(h)
+            if self._metadata is None:
+                return 0
+        dtype = record_dtype(self.natoms)
+        count = (os.path.getsize(self._path) - self._header_length) // dtype.itemsize
+        if self._records is not None and len(self._records) == count:
+            return count
+        if count:
+            self._records = np.memmap(self._path, dtype=dtype, mode='r', offset=self._header_length, shape=(count,))
+        else:
+            self._records = np.empty(0, dtype=dtype)
+        return count
+
+    @property
+    def records(self):
+        return np.empty(0, dtype=np.uint8) if self._records is None else self._records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, item):
+        return self.records[item]
+
+    def __getattr__(self, item):
+        # expose the record fields as columns, e.g. reader.F or reader.forces
+        if item.startswith('_') or self._records is None or item not in self._records.dtype.names:
+            raise AttributeError(item)
+        return self._records[item]
+
+
+def open_trajectory(path):
+    return TrajectoryReader(path)
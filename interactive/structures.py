@@ -0,0 +1,175 @@
+import asyncio
+import inspect
+import concurrent.futures
+
+class Exhausted(object):
+
+    def __reduce__(self):
+        # pickled by reference, the result of a process pool worker is this very object
+        return 'EXHAUSTED'
+
+    def __repr__(self):
+        return 'EXHAUSTED'
+
+
+# returned instead of raising StopIteration, since it cannot be raised into a future
+EXHAUSTED = Exhausted()
+
+
+class SourceExhausted(RuntimeError):
+    pass
+
+
+def call_until_exhausted(f, *args):
+    try:
+        return f(*args)
+    except StopIteration:
+        return EXHAUSTED
+
+
+def make_executor(executor):
+    if executor == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    elif executor == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=1)
+    return executor
+
+
+class StructureSource(object):
+    """
+    Produces the structures fed to VASP. next_structure can be
+
+        - a function next_structure(process), raising StopIteration once exhausted
+        - a coroutine function next_structure(process), raising StopAsyncIteration once exhausted
+        - an async generator function next_structure(process) or an async generator object
+        - an iterator
+
+    Functions and iterators are executed inline unless an executor is given ('thread', 'process' or a
+    concurrent.futures.Executor). A function run in a process pool is called without the process argument.
+    With prefetch=True the next structure is computed while VASP still iterates the current ionic step, this
+    must only be used if next_structure does not depend on the latest results. The first skip structures are
+    produced and discarded, e.g. to continue a reproducible stream after a restart. An executor created from
+    'thread' or 'process' is owned by the source and shut down by cancel()
+    """
+
+    def __init__(self, next_structure, transform=None, executor=None, prefetch=False, skip=0):
+        self._next_structure = next_structure
+        self._transform = transform
+        self._executor = make_executor(executor)
+        self._owns_executor = self._executor is not executor
+        self._prefetch = prefetch
+        self._pending = None
+        self._agen = None
+        self._skip = skip
+        self._index = -1
+        if inspect.isasyncgen(next_structure):
+            self._kind, self._agen = 'asyncgen', next_structure
+        elif inspect.isasyncgenfunction(next_structure):
+            self._kind = 'asyncgen'
+        elif inspect.iscoroutinefunction(next_structure):
+            self._kind = 'coroutine'
+        elif not callable(next_structure) and hasattr(next_structure, '__next__'):
+            self._kind = 'iterator'
+        elif callable(next_structure):
+            self._kind = 'function'
+        else:
+            raise TypeError(f'Cannot produce structures from {next_structure!r}')
+
+    @property
+    def synchronous(self):
+        return self._kind in ('function', 'iterator') and self._executor is None and not self._prefetch
+
+    @property
+    def prefetching(self):
+        return self._prefetch
+
+    @property
+    def index(self):
+        """
+        The index of the last structure returned, skipped structures included
+        """
+        return self._index
+
+    def transform(self, structure):
+        return structure if self._transform is None else self._transform(structure)
+
+    def _skipping(self, result):
+        if result is EXHAUSTED:
+            return False
+        self._index += 1
+        return self._index < self._skip
+
+    def _produce_sync(self, process):
+        if self._kind == 'iterator':
+            return next(self._next_structure, EXHAUSTED)
+        return call_until_exhausted(self._next_structure, process)
+
+    async def _produce(self, process):
+        try:
+            if self._kind == 'asyncgen':
+                if self._agen is None:
+                    self._agen = self._next_structure(process)
+                return await self._agen.__anext__()
+            elif self._kind == 'coroutine':
+                return await self._next_structure(process)
+            elif self._executor is None and not self._prefetch:
+                result = self._produce_sync(process)
+            elif isinstance(self._executor, concurrent.futures.ProcessPoolExecutor):
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, call_until_exhausted, self._next_structure)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, self._produce_sync, process)
+            return (await result) if inspect.isawaitable(result) else result
+        except StopAsyncIteration:
+            return EXHAUSTED
+
+    def _finish(self, result):
+        if result is EXHAUSTED:
+            return None, True
+        return self.transform(result), False
+
+    def next_sync(self, process):
+        """
+        :return: (tuple) the transformed structure and whether the source is exhausted
+        """
+        result = self._produce_sync(process)
+        while self._skipping(result):
+            result = self._produce_sync(process)
+        return self._finish(result)
+
+    async def next_async(self, process):
+        """
+        :return: (tuple) the transformed structure and whether the source is exhausted
+        """
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            result = await pending
+        else:
+            result = await self._produce(process)
+        while self._skipping(result):
+            result = await self._produce(process)
+        return self._finish(result)
+
+    async def first(self, process):
+        """
+        :return: the first structure as it was produced, without applying the transformation
+        """
+        while True:
+            result = self._produce_sync(process) if self.synchronous else await self._produce(process)
+            if not self._skipping(result):
+                break
+        if result is EXHAUSTED:
+            raise SourceExhausted('The structure source did not produce any structure')
+        return result
+
+    def prefetch(self, process):
+        if self._prefetch and self._pending is None:
+            self._pending = asyncio.ensure_future(self._produce(process))
+
+    def cancel(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._owns_executor:
+            # the worker thread or process of the pool must not outlive the run
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor, self._owns_executor = None, False
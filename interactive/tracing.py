@@ -0,0 +1,281 @@
+"""
+Timing instrumentation of VaspInteractiveProcess. A Tracer passed as tracer= records
+
+    - a timeline in the Chrome trace event format (open it in chrome://tracing or https://ui.perfetto.dev) with
+      a "vasp" track (setup, ionic steps, SCF iterations, forces, waiting for the next structure, reading the
+      positions) and a "driver" track (callbacks, next_structure)
+    - metrics in the Prometheus text format (ionic step durations, SCF iteration histogram, time spent per phase
+      and driver CPU time), rewritten every metrics_interval seconds, e.g. for the node exporter textfile collector
+
+    with Tracer(trace_path='trace.json', metrics_path='vasp.prom') as tracer:
+        await run_vasp_calculation(..., tracer=tracer)
+"""
+import os
+import json
+import time
+import contextlib
+from .vasp import VaspInteractiveProcess
+
+Callback = VaspInteractiveProcess.Callback
+
+VASP_TRACK = 1
+DRIVER_TRACK = 2
+
+STEP_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+SCF_BUCKETS = (1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64, 128)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}'
+        yield f'{name}_sum{format_labels(labels)} {self.sum}'
+        yield f'{name}_count{format_labels(labels)} {self.count}'
+
+
+def format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+class TimedWriter(object):
+    """
+    Wraps a stream writer of InteractiveProcess and accounts the time spent forwarding the output
+    """
+
+    def __init__(self, writer, tracer):
+        self._writer = writer
+        self._tracer = tracer
+
+    def write(self, data):
+        start = time.perf_counter()
+        self._writer.write(data)
+        self._tracer.accumulate('forward', time.perf_counter() - start)
+
+    async def drain(self):
+        if hasattr(self._writer, 'drain'):
+            start = time.perf_counter()
+            await self._writer.drain()
+            self._tracer.accumulate('forward', time.perf_counter() - start)
+
+
+class Tracer(object):
+
+    def __init__(self, trace_path=None, metrics_path=None, metrics_interval=10.0, labels=None):
+        """
+        :param trace_path: (str) the Chrome trace event JSON file, no timeline is recorded if None (default: None)
+        :param metrics_path: (str) the Prometheus textfile, no metrics are written if None (default: None)
+        :param metrics_interval: (float) seconds between two updates of the metrics file (default: 10.0)
+        :param labels: (dict) labels added to all metrics, e.g. dict(worker=0) (default: None)
+        """
+        self._trace_path = trace_path
+        self._metrics_path = metrics_path
+        self._metrics_interval = metrics_interval
+        self._labels = labels or {}
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._cpu_origin = time.process_time()
+        self._trace = None
+        self._first_event = True
+        self._metrics_written = self._origin
+        # start of the current ionic step and start and name of the current interval of the vasp track
+        self._step_start = None
+        self._mark = self._origin
+        self._mark_name = 'setup'
+        self._ionic_step = None
+        self._steps = Histogram(STEP_BUCKETS)
+        self._scf = Histogram(SCF_BUCKETS)
+        self._phases = dict.fromkeys(('setup', 'scf', 'forces', 'wait_structure', 'read_positions'), 0.0)
+        self._driver = dict.fromkeys(('parse', 'callbacks', 'next_structure', 'forward'), 0.0)
+        self._cached_steps = 0
+        if trace_path is not None:
+            self._trace = open(trace_path, 'w')
+            self._trace.write('[\n')
+            self._metadata(VASP_TRACK, 'vasp')
+            self._metadata(DRIVER_TRACK, 'driver')
+
+    @property
+    def phases(self):
+        """
+        (dict) seconds spent by VASP per phase
+        """
+        return self._phases
+
+    @property
+    def driver(self):
+        """
+        (dict) seconds spent by the driver per activity, "parse" includes the callbacks fired by the parser
+        """
+        return self._driver
+
+    def _timestamp(self, t):
+        return (t - self._origin) * 1e6
+
+    def _write_event(self, event):
+        if self._trace is None:
+            return
+        if not self._first_event:
+            self._trace.write(',\n')
+        self._first_event = False
+        self._trace.write(json.dumps(event))
+
+    def _metadata(self, tid, name):
+        self._write_event(dict(name='thread_name', ph='M', pid=self._pid, tid=tid, args=dict(name=name)))
+
+    def span(self, name, start, end, cat='vasp', tid=VASP_TRACK, **args):
+        self._write_event(dict(name=name, cat=cat, ph='X', ts=self._timestamp(start), dur=(end - start) * 1e6, pid=self._pid, tid=tid, args=args))
+
+    def instant(self, name, t=None, cat='vasp', tid=VASP_TRACK, **args):
+        t = time.perf_counter() if t is None else t
+        self._write_event(dict(name=name, cat=cat, ph='i', s='t', ts=self._timestamp(t), pid=self._pid, tid=tid, args=args))
+
+    def accumulate(self, activity, seconds):
+        self._driver[activity] += seconds
+
+    @contextlib.contextmanager
+    def timed(self, activity, name=None, **args):
+        """
+        Accounts the time of the block to a driver activity, a span is added to the driver track if name is given
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._driver[activity] += end - start
+            if name is not None:
+                self.span(name, start, end, cat=activity, tid=DRIVER_TRACK, **args)
+
+    def _phase(self, now, next_name):
+        """
+        Closes the current interval of the vasp track and starts the next one
+        """
+        name, start = self._mark_name, self._mark
+        if name is not None:
+            phase = name if name in self._phases else 'scf'
+            self._phases[phase] += now - start
+            self.span(name, start, now)
+        self._mark, self._mark_name = now, next_name
+
+    def transition(self, cb, *args, **kwargs):
+        """
+        Called by VaspInteractiveProcess before the callbacks of cb are run
+        """
+        now = time.perf_counter()
+        if cb is Callback.MainLoopStarted:
+            self._phase(now, None)
+        elif cb is Callback.IonicStepStarted:
+            self._phase(now, 'scf 1')
+            self._step_start, self._ionic_step = now, args[0] if args else None
+        elif cb is Callback.ScfStepCompleted:
+            scf_step = args[1] if len(args) > 1 else 0
+            self._phase(now, f'scf {scf_step + 1}')
+        elif cb is Callback.ForcesRead:
+            # the interval after the last SCF row is spent on the forces
+            self._mark_name = 'forces'
+            self._phase(now, None)
+        elif cb is Callback.IonicStepFinished:
+            data = kwargs.get('data') or {}
+            if data.get('cached'):
+                self._cached_steps += 1
+                self.instant('cached step', now, ionic_step=args[0] if args else None)
+                return
+            self._phase(now, 'wait_structure')
+            if self._step_start is not None:
+                self._steps.observe(now - self._step_start)
+                self.span(f'ionic step {self._ionic_step}', self._step_start, now, cat='ionic_step', scf_steps=kwargs.get('scf_steps'))
+            if kwargs.get('scf_steps') is not None:
+                self._scf.observe(kwargs['scf_steps'])
+            self._step_start = None
+            self.maybe_write_metrics(now)
+        elif cb is Callback.FeedPositionsStarted:
+            self._phase(now, 'read_positions')
+        elif cb is Callback.FeedPositionsFinished:
+            self._phase(now, None)
+        elif cb is Callback.Exit:
+            self.instant('exit', now)
+
+    def callback(self, f, start, end):
+        self._driver['callbacks'] += end - start
+        self.span(getattr(f, '__qualname__', repr(f)), start, end, cat='callbacks', tid=DRIVER_TRACK)
+
+    def writer(self, writer):
+        return TimedWriter(writer, self)
+
+    def metrics(self):
+        """
+        :return: (str) the metrics in the Prometheus text format
+        """
+        labels = self._labels
+        lines = [
+            '# HELP vasp_interactive_ionic_step_seconds Wall time of the ionic steps computed by VASP',
+            '# TYPE vasp_interactive_ionic_step_seconds histogram',
+            *self._steps.lines('vasp_interactive_ionic_step_seconds', labels),
+            '# HELP vasp_interactive_scf_iterations SCF iterations per ionic step',
+            '# TYPE vasp_interactive_scf_iterations histogram',
+            *self._scf.lines('vasp_interactive_scf_iterations', labels),
+            '# HELP vasp_interactive_cached_steps_total Ionic steps answered from the result cache',
+            '# TYPE vasp_interactive_cached_steps_total counter',
+            f'vasp_interactive_cached_steps_total{format_labels(labels)} {self._cached_steps}',
+            '# HELP vasp_interactive_phase_seconds_total Wall time of VASP per phase',
+            '# TYPE vasp_interactive_phase_seconds_total counter',
+            *(f'vasp_interactive_phase_seconds_total{format_labels(labels, phase=k)} {v}' for k, v in self._phases.items()),
+            '# HELP vasp_interactive_driver_seconds_total Wall time of the Python driver per activity',
+            '# TYPE vasp_interactive_driver_seconds_total counter',
+            *(f'vasp_interactive_driver_seconds_total{format_labels(labels, activity=k)} {v}' for k, v in self._driver.items()),
+            '# HELP vasp_interactive_driver_cpu_seconds_total CPU time of the Python driver',
+            '# TYPE vasp_interactive_driver_cpu_seconds_total counter',
+            f'vasp_interactive_driver_cpu_seconds_total{format_labels(labels)} {time.process_time() - self._cpu_origin}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self):
+        if self._metrics_path is None:
+            return
+        # written to a temporary file first, a collector never sees a partial file
+        temporary = f'{self._metrics_path}.{self._pid}.tmp'
+        with open(temporary, 'w') as h:
+            h.write(self.metrics())
+        os.replace(temporary, self._metrics_path)
+        self._metrics_written = time.perf_counter()
+
+    def maybe_write_metrics(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if now - self._metrics_written >= self._metrics_interval:
+            self.write_metrics()
+            if self._trace is not None:
+                self._trace.flush()
+
+    def close(self):
+        self.write_metrics()
+        if self._trace is not None:
+            self._trace.write('\n]\n')
+            self._trace.close()
+            self._trace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,261 @@
+import enum
+import collections
+import collections.abc
+import numpy as np
+
+scf_table_dtype = np.dtype([
+    ('algo', 'U8'),
+    ('step', np.int32),
+    ('E', np.float64),
+    ('dE', np.float64),
+    ('deps', np.float64),
+    ('ncg', np.int64),
+    ('rms', np.float64),
+    ('rmsc', np.float64)
+])
+
+summary_columns = ('step', 'F', 'E0', 'dE')
+
+
+def scf_table(rows):
+    names = scf_table_dtype.names
+    return np.array([tuple(np.nan if row[name] is None else row[name] for name in names) for row in rows], dtype=scf_table_dtype)
+
+
+class Retention(enum.Enum):
+
+    All = 'all'
+    Summary = 'summary'
+    Last = 'last'
+    Downsample = 'downsample'
+
+
+class Column(object):
+    """
+    A growable NumPy array. If it is a ring it holds at most capacity items and overwrites the oldest one
+    """
+
+    def __init__(self, shape=(), dtype=np.float64, capacity=16, ring=False, fill=None):
+        self._shape = tuple(shape)
+        self._ring = ring
+        self._data = np.empty((capacity,) + self._shape, dtype=dtype)
+        self._fill = fill
+        self._size = 0
+        self._head = 0
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def _grow(self):
+        data = np.empty((2 * self.capacity,) + self._shape, dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def append(self, value):
+        if self._ring:
+            index = (self._head + self._size) % self.capacity
+            if self._size == self.capacity:
+                self._head = (self._head + 1) % self.capacity
+            else:
+                self._size += 1
+        else:
+            if self._size == self.capacity:
+                self._grow()
+            index = self._size
+            self._size += 1
+        self._data[index] = self._fill if value is None else value
+
+    def _index(self, i):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(i)
+        return (self._head + i) % self.capacity
+
+    def __getitem__(self, i):
+        # a copy, the slot of a ring is overwritten by later items
+        return self._data[self._index(i)].copy()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def array(self):
+        end = self._head + self._size
+        if end <= self.capacity:
+            data = self._data[self._head:end]
+            return data.copy() if self._ring else data
+        # the ring is wrapped around, hence we have to copy
+        return np.concatenate((self._data[self._head:], self._data[:end - self.capacity]))
+
+
+class Trajectory(collections.abc.Sequence):
+    """
+    Array backed store of the ionic steps of a calculation. Energies and SCF counts, positions and
+    forces are kept in NumPy columns, the SCF table of each step as a structured array.
+    Which steps are kept is decided by the retention policy:
+
+        - Retention.All: everything
+        - Retention.Summary: only energies and SCF counts, neither positions, forces nor SCF tables
+        - Retention.Last: the last maxlen steps in a ring buffer
+        - Retention.Downsample: every stride-th step
+    """
+
+    def __init__(self, retention=Retention.All, maxlen=None, stride=1):
+        """
+        :param retention: (Retention or str) the retention policy (default: Retention.All)
+        :param maxlen: (int) number of steps kept by Retention.Last (default: None)
+        :param stride: (int) keep every stride-th step if Retention.Downsample is used (default: 1)
+        """
+        retention = Retention(retention)
+        if retention == Retention.Last and not maxlen:
+            raise ValueError('Retention.Last requires maxlen')
+        if stride < 1:
+            raise ValueError('stride must be a positive integer')
+        self._retention = retention
+        self._maxlen = maxlen
+        self._stride = stride if retention == Retention.Downsample else 1
+        self._ring = retention == Retention.Last
+        self._count = 0
+        self._natoms = None
+        column = self._make_column
+        self._columns = dict(
+            step=column(dtype=np.int64),
+            F=column(),
+            E0=column(),
+            dE=column(),
+            nscf=column(dtype=np.int64)
+        )
+        self._scf = collections.deque(maxlen=maxlen) if self._ring else []
+        # the OUTCAR sections of the steps, kept like the SCF tables
+        self._outcar = collections.deque(maxlen=maxlen) if self._ring else []
+        self._kept = False
+        self._positions = None
+        self._forces = None
+
+    def _make_column(self, shape=(), dtype=np.float64, fill=None):
+        return Column(shape=shape, dtype=dtype, capacity=self._maxlen if self._ring else 16, ring=self._ring, fill=fill)
+
+    @property
+    def retention(self):
+        return self._retention
+
+    @property
+    def stores_arrays(self):
+        return self._retention != Retention.Summary
+
+    @property
+    def count(self):
+        """
+        Number of ionic steps appended, including the discarded ones
+        """
+        return self._count
+
+    @property
+    def natoms(self):
+        return self._natoms
+
+    def _init_arrays(self, natoms):
+        self._natoms = natoms
+        self._positions = self._make_column(shape=(natoms, 3), fill=np.nan)
+        self._forces = self._make_column(shape=(natoms, 3), fill=np.nan)
+
+    def _check_arrays(self, forces, positions):
+        if self._natoms is None and forces is None and positions is None:
+            raise ValueError('The first ionic step neither has forces nor positions')
+        shapes = {name: np.shape(array) for name, array in (('forces', forces), ('positions', positions)) if array is not None}
+        first = next(iter(shapes.values()))
+        natoms = self._natoms if self._natoms is not None else (first[0] if first else None)
+        for name, shape in shapes.items():
+            if shape != (natoms, 3):
+                raise ValueError(f'Expected {name} of shape ({natoms}, 3), got {shape}')
+
+    def append(self, record):
+        """
+        Appends an ionic step as built by VaspInteractiveProcess
+        :param record: (dict) with the keys "summary", "scf", "forces" and "positions", only "summary" is mandatory
+        """
+        self._kept = False
+        count, self._count = self._count, self._count + 1
+        if count % self._stride:
+            return
+        forces, positions = record.get('forces'), record.get('positions')
+        # checked before anything is stored, a rejected step leaves the columns aligned
+        if self.stores_arrays:
+            try:
+                self._check_arrays(forces, positions)
+            except ValueError:
+                self._count -= 1
+                raise
+        summary = record['summary']
+        for name in summary_columns:
+            self._columns[name].append(summary.get(name, np.nan))
+        scf = record.get('scf')
+        self._columns['nscf'].append(0 if scf is None else len(scf))
+        if not self.stores_arrays:
+            return
+        self._scf.append(scf_table(scf or ()))
+        if self._natoms is None:
+            self._init_arrays(len(forces if forces is not None else positions))
+        self._positions.append(positions)
+        self._forces.append(forces)
+        self._outcar.append(record.get('outcar'))
+        self._kept = True
+
+    def set_outcar(self, section):
+        """
+        Attaches the OUTCAR section of the step appended last, ignored if the step was not kept
+        :param section: (dict) as parsed by interactive.outcar, it may still be filled in place
+        """
+        if self._kept:
+            self._outcar[-1] = section
+
+    def record(self, i):
+        summary = {name: self._columns[name][i].item() for name in summary_columns}
+        record = dict(summary=summary, nscf=self._columns['nscf'][i].item())
+        if self.stores_arrays:
+            record.update(scf=self._scf[i], forces=self._forces[i], positions=self._positions[i])
+            if self._outcar[i] is not None:
+                record['outcar'] = self._outcar[i]
+        return record
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.record(j) for j in range(*i.indices(len(self)))]
+        return self.record(i)
+
+    def __len__(self):
+        return len(self._columns['step'])
+
+    @property
+    def step(self):
+        return self._columns['step'].array
+
+    @property
+    def F(self):
+        return self._columns['F'].array
+
+    @property
+    def E0(self):
+        return self._columns['E0'].array
+
+    @property
+    def dE(self):
+        return self._columns['dE'].array
+
+    @property
+    def nscf(self):
+        return self._columns['nscf'].array
+
+    @property
+    def scf(self):
+        return list(self._scf)
+
+    @property
+    def positions(self):
+        return None if self._positions is None else self._positions.array
+
+    @property
+    def forces(self):
+        return None if self._forces is None else self._forces.array
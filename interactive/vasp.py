@@ -1,11 +1,18 @@
-
 import re
 import os
+import time
 import sys
 import enum
 import functools
+import asyncio
+import traceback
+import collections
+import numpy as np
 from operator import attrgetter as attr
+from .aio import BatchProcessor, Deferred
 from .interactive import InteractiveProcess
+from .trajectory import Trajectory
+from .structures import StructureSource
 from .utils import ensure_iterable_of_type, transpose
 from .regex import chain, group, lpad, lrpad, regex_whitespace_maybe, regex_whitespace_sure, regex_float, regex_integer, any_of as regex_any_of
 
@@ -52,7 +59,7 @@ regex_feed_positions_begin = re.compile('POSITIONS:\sreading\sfrom\sstdin')
 regex_feed_positions_end = re.compile('POSITIONS:\sread\sfrom\sstdin')
 
 scf_table_converters = dict(
-    algo=lambda x: x,
+    algo=bytes.decode,
     E=float,
     dE=float,
     deps=float,
@@ -69,6 +76,20 @@ ionic_step_summary_converters = dict(
     dE=float
 )
 
+def convert_scf_row(data):
+    """
+    Converts the groups of a regex_scf_table_row match, rms(c) is missing in the first rows of a table
+    """
+    if data['rms'] is None:
+        data['rms'] = data['rmsc']
+        data['rmsc'] = None
+    return {k: scf_table_converters.get(k)(v) for k, v in data.items()}
+
+
+def convert_summary(data):
+    return {k: ionic_step_summary_converters.get(k)(v) for k, v in data.items()}
+
+
 ensure_tuple = functools.partial(ensure_iterable_of_type, tuple)
 
 
@@ -76,6 +97,84 @@ def add_line_processor(processor, procs=None):
     return (processor,) if procs is None else ensure_tuple(procs) + (processor,)
 
 
+def as_bytes(regex):
+    # stdout lines arrive as bytes, matching them directly saves a decode per line
+    return re.compile(regex.pattern.encode(), regex.flags & ~re.UNICODE)
+
+
+# a trigger is a compiled bytes regex fronted by a token which must be contained in the line, lines
+# without the token are rejected by a substring search without allocating anything
+Trigger = collections.namedtuple('Trigger', ('token', 'regex', 'action'))
+
+
+def trigger(regex, action, token=None):
+    return Trigger(token, as_bytes(regex), action)
+
+
+regex_ion_forces_bytes = as_bytes(regex_ion_forces)
+
+
+def parse_force_block(lines, natoms=None):
+    values = b''.join(lines).split()
+    try:
+        if natoms is not None and len(values) == 3 * natoms:
+            forces = np.empty((natoms, 3), dtype=np.float64)
+            forces.reshape(-1)[:] = values
+            return forces
+        elif len(values) % 3 == 0:
+            return np.array(values, dtype=np.float64).reshape(-1, 3)
+    except ValueError:
+        pass
+    # the block contains something else than forces, fall back to matching line by line
+    matches = filter(None, map(regex_ion_forces_bytes.match, lines))
+    return np.array([m.groups() for m in matches], dtype=np.float64).reshape(-1, 3)
+
+
+POSITION_LINE = ' '.join(('%18.16f',) * 3) + os.linesep
+
+
+def format_positions(positions):
+    """
+    Formats an (natoms, 3) array as the block of lines VASP reads from stdin, in a single formatting operation
+    """
+    positions = np.ascontiguousarray(positions, dtype=np.float64)
+    return ((POSITION_LINE * len(positions)) % tuple(positions.ravel().tolist())).encode()
+
+
+parser_states = dict(
+    main_loop=(trigger(regex_main_loop_active, '_main_loop_started', token=b'entering'),),
+    ionic_step=(trigger(regex_scf_table_header, '_ionic_step_started', token=b'rms(c)'),),
+    scf=(trigger(regex_scf_table_row, '_scf_step_completed', token=b':'),),
+    scf_or_forces=(
+        trigger(regex_scf_table_row, '_scf_step_completed', token=b':'),
+        trigger(regex_forces_begin, '_read_forces', token=b'FORCES:')
+    ),
+    forces=(trigger(regex_ion_forces, '_read_ion_force'),),
+    force_block=(
+        trigger(regex_ionic_step_complete, '_ionic_step_finished', token=b'F='),
+        # every other line is buffered and converted once the block is complete
+        Trigger(None, None, '_force_lines.append')
+    ),
+    forces_or_summary=(
+        trigger(regex_ion_forces, '_read_ion_force'),
+        trigger(regex_ionic_step_complete, '_ionic_step_finished', token=b'F=')
+    ),
+    feed_positions_begin=(trigger(regex_feed_positions_begin, '_start_feed_positions', token=b'POSITIONS:'),),
+    feed_positions_end=(trigger(regex_feed_positions_end, '_end_feed_positions', token=b'POSITIONS:'),),
+    ionic_step_or_summary=(
+        trigger(regex_scf_table_header, '_ionic_step_started', token=b'rms(c)'),
+        trigger(regex_ionic_step_complete, '_ionic_step_finished', token=b'F=')
+    ),
+)
+
+
+def bind_parser_states(obj, states=None):
+    return {
+        name: tuple(Trigger(t.token, t.regex, attr(t.action)(obj)) for t in triggers)
+        for name, triggers in (parser_states if states is None else states).items()
+    }
+
+
 class VaspInteractiveProcess(InteractiveProcess):
 
     class Callback(enum.Enum):
@@ -86,101 +185,270 @@ class VaspInteractiveProcess(InteractiveProcess):
         ScfStepCompleted = 'scf_step_callback'
         NextStructure = 'next_structure'
         IonForceRead = 'ion_force_read'
+        ForcesRead = 'forces_read'
         FeedPositionsStarted = 'feed_positions_started'
         FeedPositionsFinished = 'feed_positions_finished'
         Exit = 'exit'
 
 
-    def __init__(self, next_structure, command, directory=os.getcwd(), stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None):
-        super().__init__(command, directory=directory, stdout=stdout, stderr=stderr, stdin=stdin, stdin_proc=stdin_proc, stdout_proc=add_line_processor(self._main_processor, stdout_proc), stderr_proc=stderr_proc, loop=loop)
+    def __init__(self, next_structure, command, directory=os.getcwd(), stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin, stdin_proc=None, stdout_proc=None, stderr_proc=None, loop=None, per_atom_forces=False, trajectory=None, structure_executor=None, prefetch=False, chunk_size=None, high_water=None, cache=None, tracer=None, dispatcher=None, watchdog=None):
+        main_processor = BatchProcessor(self._main_processor, self._process_lines)
+        super().__init__(command, directory=directory, stdout=stdout, stderr=stderr, stdin=stdin, stdin_proc=stdin_proc, stdout_proc=add_line_processor(main_processor, stdout_proc), stderr_proc=stderr_proc, loop=loop, chunk_size=chunk_size, high_water=high_water, start_new_session=watchdog is not None)
         self._scf_step = None
         self._ionic_step = None
-        self._next_action = (regex_main_loop_active, self._main_loop_started)
         self._current_ionic_step = None
-        self._ionic_steps = []
+        self._ionic_steps = Trajectory() if trajectory is None else trajectory
         self._callbacks = {cb: [] for cb in VaspInteractiveProcess.Callback}
-        self._compute_next_positions = next_structure
+        # the bookkeeping of the library, run inline and in order even if the callbacks are dispatched
+        self._inline_callbacks = {cb: [] for cb in VaspInteractiveProcess.Callback}
+        self._structures = next_structure if isinstance(next_structure, StructureSource) else StructureSource(next_structure, executor=structure_executor, prefetch=prefetch)
+        self._feed_task = None
+        self._drain_pending = False
+        self._cached_steps = 0
         self._abort = False
         self._positions = None
         self._ion_index = None
+        self._natoms = None
+        self._force_lines = []
+        self._per_atom_forces = per_atom_forces
+        self._cache = cache
+        self._cache_inputs = None
+        self._tracer = tracer
+        self._dispatcher = dispatcher
+        self._watchdog = watchdog
+        self._states = bind_parser_states(self)
+        self._next_action = self._states['main_loop']
     
-    def register_callback(self, cb, f):
+    def register_callback(self, cb, f, inline=False):
+        """
+        :param inline: (bool) whether f runs in the parser before the other callbacks, also when a dispatcher is set (default: False)
+        """
         cb = cb if isinstance(cb, VaspInteractiveProcess.Callback) else VaspInteractiveProcess.Callback(cb)
-        self._callbacks[cb].append(f) 
+        (self._inline_callbacks if inline else self._callbacks)[cb].append(f)
 
     def _fire_callback(self, cb, *args, **kwargs):
-        for cb_ in self._callbacks[cb]:
-            cb_(*args, **kwargs)
+        if self._tracer is not None:
+            self._tracer.transition(cb, *args, **kwargs)
+        if self._watchdog is not None:
+            self._watchdog.transition(cb, *args, **kwargs)
+        if self._inline_callbacks[cb]:
+            self._run_callbacks(self._inline_callbacks[cb], args, kwargs)
+        if self._dispatcher is not None:
+            self._dispatcher.dispatch(cb, self._callbacks[cb], args, kwargs)
+        else:
+            self._run_callbacks(self._callbacks[cb], args, kwargs)
+
+    def _run_callbacks(self, callbacks, args, kwargs):
+        if self._tracer is not None:
+            self._fire_traced_callback(callbacks, args, kwargs)
+        else:
+            for cb_ in callbacks:
+                cb_(*args, **kwargs)
+
+    def _fire_traced_callback(self, callbacks, args, kwargs):
+        for cb_ in callbacks:
+            start = time.perf_counter()
+            try:
+                cb_(*args, **kwargs)
+            finally:
+                self._tracer.callback(cb_, start, time.perf_counter())
+
+    def create_pipes(self, proc_handle, stdin, stdout, stderr):
+        if self._tracer is not None:
+            stdout, stderr = tuple(map(self._tracer.writer, stdout)), tuple(map(self._tracer.writer, stderr))
+        return super().create_pipes(proc_handle, stdin, stdout, stderr)
+
+    def _next_structure_sync(self):
+        if self._tracer is None:
+            return self._structures.next_sync(self)
+        with self._tracer.timed('next_structure', 'next_structure'):
+            return self._structures.next_sync(self)
+
+    async def _next_structure_async(self):
+        if self._tracer is None:
+            return await self._structures.next_async(self)
+        with self._tracer.timed('next_structure', 'next_structure'):
+            return await self._structures.next_async(self)
 
     def _main_loop_started(self, *_):
         self._scf_step = 0
         self._ionic_step = 0
-        self._next_action = (regex_scf_table_header, self._ionic_step_started)
+        self._next_action = self._states['ionic_step']
         self._fire_callback(VaspInteractiveProcess.Callback.MainLoopStarted)
+        self._structures.prefetch(self)
 
     def _ionic_step_started(self, *_):
-        self._current_ionic_step = dict(scf=[])
+        self._current_ionic_step = dict(scf=[], positions=self._positions)
         self._scf_step = 0
         self._ionic_step += 1
-        self._next_action = (regex_scf_table_row, self._scf_step_completed)
+        self._next_action = self._states['scf']
         self._fire_callback(VaspInteractiveProcess.Callback.IonicStepStarted, self._ionic_step)
 
     def _scf_step_completed(self, m):
         self._scf_step += 1
         assert self._current_ionic_step is not None
-        data = m.groupdict()
-        if data['rms'] is None:
-            data['rms'] = data['rmsc']
-            data['rmsc'] = None
-
-        data = {k: scf_table_converters.get(k)(v) for k, v in data.items()}
+        data = convert_scf_row(m.groupdict())
         self._current_ionic_step['scf'].append(data)
-        self._next_action = ((regex_scf_table_row, regex_forces_begin), (self._scf_step_completed, self._read_forces))
+        self._next_action = self._states['scf_or_forces']
         self._fire_callback(VaspInteractiveProcess.Callback.ScfStepCompleted, self._ionic_step, self._scf_step, data=data)
 
     def _read_forces(self, *_):
         self._ion_index = 0
-        self._current_ionic_step['forces'] = []
-        self._next_action = (regex_ion_forces, self._read_ion_force)
+        if self._watchdog is not None:
+            self._watchdog.forces_started()
+        if self._per_atom_forces:
+            self._current_ionic_step['forces'] = []
+            self._next_action = self._states['forces']
+        else:
+            self._force_lines.clear()
+            self._next_action = self._states['force_block']
 
     def _read_ion_force(self, m):
         forces = list(map(float, m.groups()))
         self._current_ionic_step['forces'].append(forces)
-        self._next_action = ((regex_ion_forces, regex_ionic_step_complete), (self._read_ion_force, self._ionic_step_finished))
+        self._next_action = self._states['forces_or_summary']
         self._fire_callback(VaspInteractiveProcess.Callback.IonForceRead, forces, index=self._ion_index, ionic_step=self._ionic_step)
+        self._ion_index += 1
+
+    def _forces_read(self):
+        if self._per_atom_forces:
+            forces = np.array(self._current_ionic_step['forces'], dtype=np.float64).reshape(-1, 3)
+        else:
+            forces = parse_force_block(self._force_lines, natoms=self._natoms)
+            self._force_lines.clear()
+        self._natoms = len(forces)
+        self._current_ionic_step['forces'] = forces
+        self._fire_callback(VaspInteractiveProcess.Callback.ForcesRead, forces, ionic_step=self._ionic_step)
 
     def _ionic_step_finished(self, m):
-        data = {k: ionic_step_summary_converters.get(k)(v) for k, v in m.groupdict().items()}
-        self._ion_index = None
+        data = convert_summary(m.groupdict())
+        if self._cached_steps and data.get('step') is not None:
+            # VASP does not count the steps answered from the cache
+            data['step'] += self._cached_steps
         if not self._current_ionic_step:
             self._current_ionic_step = dict()
+        if self._ion_index is not None:
+            self._forces_read()
+        self._ion_index = None
         self._current_ionic_step['summary'] = data
-        self._ionic_steps.append(self._current_ionic_step)
-        self._next_action = (regex_feed_positions_begin, self._start_feed_positions)
+        # the parser moves on even if the step cannot be stored
+        self._next_action = self._states['feed_positions_begin']
+        try:
+            self._ionic_steps.append(self._current_ionic_step)
+        except ValueError:
+            traceback.print_exc()
+        self._store_result(self._current_ionic_step)
         self._fire_callback(VaspInteractiveProcess.Callback.IonicStepFinished, self._ionic_step, data=self._current_ionic_step, scf_steps=self._scf_step)
         self._current_ionic_step = None
 
     def _start_feed_positions(self, *_):
-        try:
-            self._positions = self._compute_next_positions(self)
-            abort = False
-        except (StopIteration,) as e:
-            abort = True
         # we set the expected actions before we feed the positions
-        if abort:
+        self._next_action = self._states['feed_positions_end']
+        if self._structures.synchronous:
+            positions, exhausted = self._next_structure_sync()
+            while not exhausted and self._structure_received(positions):
+                positions, exhausted = self._next_structure_sync()
+            self._feed_next_structure(positions, exhausted)
+            # the line processor cannot await, the pipe drains stdin before it reads on
+            self._drain_pending = True
+        else:
+            # the structure is produced off the line processor, stdout keeps flowing meanwhile
+            self._feed_task = asyncio.ensure_future(self._await_next_structure())
+
+    async def _await_next_structure(self):
+        try:
+            positions, exhausted = await self._next_structure_async()
+            while not exhausted and self._structure_received(positions):
+                positions, exhausted = await self._next_structure_async()
+        except Exception:
+            traceback.print_exc()
+            positions, exhausted = None, True
+        self._feed_next_structure(positions, exhausted)
+        await self._drain_stdin()
+
+    async def first_structure(self):
+        """
+        Produces the first structure, it is computed by VASP from the POSCAR
+        :return: the structure as produced by next_structure
+        """
+        structure = await self._structures.first(self)
+        self._positions = self._structures.transform(structure)
+        self._fire_callback(VaspInteractiveProcess.Callback.NextStructure, self._structures.index, self._positions)
+        return structure
+
+    def _structure_received(self, positions):
+        """
+        :return: (bool) whether the structure was completed without VASP
+        """
+        self._fire_callback(VaspInteractiveProcess.Callback.NextStructure, self._structures.index, positions)
+        return self._cached_step(positions)
+
+    def _store_result(self, data):
+        if self._cache is None or self._cache_inputs is None or data.get('positions') is None or 'forces' not in data:
+            return
+        self._cache.put(self._cache_inputs, data['positions'], data['summary'], forces=data['forces'], nscf=self._scf_step)
+
+    def _cached_step(self, positions):
+        """
+        Completes an ionic step from the cache without VASP
+        :return: (bool) whether the positions were found in the cache
+        """
+        if self._cache is None or self._cache_inputs is None:
+            return False
+        result = self._cache.get(self._cache_inputs, positions)
+        if result is None:
+            return False
+        try:
+            positions, forces = self._validate_positions(positions), self._validate_positions(result['forces'], name='forces')
+        except ValueError:
+            # an entry which does not fit this run is a miss, VASP computes the step
+            traceback.print_exc()
+            return False
+        self._ionic_step += 1
+        self._cached_steps += 1
+        # the step number of the run which computed the result is not the one of this run
+        data = dict(scf=[], positions=positions, forces=forces, summary=dict(result['summary'], step=self._ionic_step), cached=True)
+        self._ionic_steps.append(data)
+        self._fire_callback(VaspInteractiveProcess.Callback.IonicStepFinished, self._ionic_step, data=data, scf_steps=0)
+        return True
+
+    def _feed_next_structure(self, positions, exhausted):
+        if not exhausted:
+            try:
+                positions = self._validate_positions(positions)
+            except ValueError:
+                traceback.print_exc()
+                exhausted = True
+        if exhausted:
             self.abort()
-        self._next_action = (regex_feed_positions_end, self._end_feed_positions)
+        else:
+            self._positions = positions
         self._fire_callback(VaspInteractiveProcess.Callback.FeedPositionsStarted)
         self._feed_positions(self._positions)
+        if not exhausted:
+            self._structures.prefetch(self)
 
     def _end_feed_positions(self, *_):
         self._fire_callback(VaspInteractiveProcess.Callback.FeedPositionsFinished)
-        self._next_action = ((regex_scf_table_header, regex_ionic_step_complete), (self._ionic_step_started, self._ionic_step_finished))
+        self._next_action = self._states['ionic_step_or_summary']
+
+    def _validate_positions(self, positions, name='positions'):
+        positions = np.asarray(positions, dtype=np.float64)
+        natoms = self._natoms if self._natoms is not None else (None if self._positions is None else len(self._positions))
+        if positions.ndim != 2 or positions.shape[1] != 3 or (natoms is not None and len(positions) != natoms):
+            raise ValueError(f'Expected {name} of shape ({natoms if natoms is not None else "natoms"}, 3), got {positions.shape}')
+        return positions
 
     def _feed_positions(self, positions):
-        for coords in positions:
-            line = ' '.join(map(lambda x: f'{x:18.16f}', coords))
-            self._feed_line(line) 
+        # the whole block is formatted and written at once
+        self._handle.stdin.write(format_positions(positions))
+
+    async def _drain_stdin(self):
+        try:
+            await self._handle.stdin.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            # VASP exited, the return code tells what happened
+            pass
 
     def _feed_line(self, command, end=os.linesep):
         self._handle.stdin.write(f'{command}{end}'.encode())
@@ -193,6 +461,23 @@ class VaspInteractiveProcess(InteractiveProcess):
                 h.write('LSTOP = .TRUE.\n')
         self._abort = True
     
+    async def __aenter__(self):
+        await super().__aenter__()
+        if self._watchdog is not None:
+            self._watchdog.start(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._structures.cancel()
+        if self._watchdog is not None:
+            self._watchdog.stop()
+        if self._feed_task is not None:
+            self._feed_task.cancel()
+        await super().__aexit__(exc_type, exc_val, exc_tb)
+        if self._dispatcher is not None:
+            # the results are complete once the process handle is left
+            await self._dispatcher.join()
+
     def cancel_abort(self):
         stopcar_path = os.path.join(self._directory, 'STOPCAR')
         if os.path.exists(stopcar_path):
@@ -200,18 +485,45 @@ class VaspInteractiveProcess(InteractiveProcess):
         self._abort = False
 
     def _main_processor(self, line):
-        line = line.decode().rstrip()
-        triggers, actions = map(ensure_tuple, self._next_action)
-        for trigger, action in zip(triggers, actions):
-            m = trigger.match(line)
-            if m:
-                try:
-                    action(m)
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                
-                break
+        return self._process_lines((line,))
+
+    def _process_lines(self, lines):
+        if self._tracer is not None:
+            with self._tracer.timed('parse'):
+                matched = self._parse_lines(lines)
+        else:
+            matched = self._parse_lines(lines)
+        if matched and self._watchdog is not None:
+            self._watchdog.line_matched()
+        room = self._dispatcher.backpressure() if self._dispatcher is not None else None
+        if self._drain_pending:
+            self._drain_pending = False
+            return Deferred(self._drain_until_room, room)
+        return room
+
+    async def _drain_until_room(self, room):
+        await self._drain_stdin()
+        if room is not None:
+            await room
+
+    def _parse_lines(self, lines):
+        """
+        :return: (bool) whether any line matched a trigger
+        """
+        matched = False
+        for line in lines:
+            for token, trigger, action in self._next_action:
+                if token is not None and token not in line:
+                    continue
+                m = line if trigger is None else trigger.match(line)
+                if m:
+                    matched = True
+                    try:
+                        action(m)
+                    except Exception:
+                        traceback.print_exc()
+                    break
+        return matched
     
     @property
     def ionic_step(self):
@@ -225,10 +537,42 @@ class VaspInteractiveProcess(InteractiveProcess):
     def ionic_steps(self):
         return self._ionic_steps
 
+    @property
+    def structures(self):
+        return self._structures
+
+    @property
+    def natoms(self):
+        return self._natoms
+
     @property
     def positions(self):
         return self._positions
 
+    @positions.setter
+    def positions(self, positions):
+        self._positions = positions
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def dispatcher(self):
+        return self._dispatcher
+
+    @property
+    def watchdog(self):
+        return self._watchdog
+
+    @property
+    def cache_inputs(self):
+        return self._cache_inputs
+
+    @cache_inputs.setter
+    def cache_inputs(self, digest):
+        self._cache_inputs = digest
+
     @property
     def last_ionic_step(self):
         return next(reversed(self._ionic_steps), None)
\ No newline at end of file
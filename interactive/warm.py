@@ -0,0 +1,228 @@
+"""
+Keeps interactive VASP processes started ahead of demand. A started ComputeSession went through the launch, the
+setup and the SCF of its POSCAR and is parked at the positions prompt, a caller gets it without the cold start
+
+    pool = WarmPool(size=2, ttl=600, directory='warm')
+    pool.register('al-fcc', structure, incar, kpoints, potcar, executable='mpirun vasp_std')
+
+    async with pool.session('al-fcc') as session:
+        energy, forces = await session.compute(positions)
+
+Each input set is registered under a key. Taking a session starts a replacement in the background, a session
+handed back is parked again. A session parked for longer than ttl seconds is retired through the STOPCAR. A session
+which fails to start fails the callers waiting for one, the input set is refilled after a delay which doubles
+with each failure in a row
+"""
+import os
+import asyncio
+import logging
+import contextlib
+import collections
+from .compute import ComputeSession
+
+
+class InputSet(object):
+
+    def __init__(self, key, structure, inputs, size, kwargs):
+        self.key = key
+        self.structure = structure
+        self.inputs = inputs
+        self.size = size
+        self.kwargs = kwargs
+        # parked sessions with their retirement timers, callers waiting for a session and sessions starting
+        self.parked = collections.deque()
+        self.waiters = collections.deque()
+        self.starting = 0
+        self.count = 0
+        # failed starts in a row and the timer of the next attempt
+        self.failures = 0
+        self.retry = None
+
+
+class WarmPool(object):
+
+    def __init__(self, size=1, ttl=600.0, directory=os.getcwd(), retry_delay=1.0, max_retry_delay=60.0):
+        """
+        :param size: (int) sessions kept parked per input set (default: 1)
+        :param ttl: (float) seconds a session may stay parked before it is retired, never if None (default: 600.0)
+        :param directory: (str) the sessions run in directory/<key>/session-<n> (default: os.getcwd())
+        :param retry_delay: (float) seconds before an input set is refilled after a failed start (default: 1.0)
+        :param max_retry_delay: (float) the delay doubles with each failure in a row up to this limit (default: 60.0)
+        """
+        self._size = size
+        self._ttl = ttl
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._directory = directory
+        self._sets = {}
+        self._owner = {}
+        self._tasks = set()
+        self._closed = False
+        self._stats = collections.Counter()
+
+    @property
+    def stats(self):
+        """
+        (dict) sessions started, retired and failed, and acquisitions served from a parked session (hits) or
+        after waiting for one to start (misses)
+        """
+        return dict(self._stats)
+
+    def parked(self, key):
+        return len(self._sets[key].parked)
+
+    def register(self, key, structure, incar, kpoints, potcar, size=None, warm=True, **kwargs):
+        """
+        :param key: (str) the name of the input set
+        :param size: (int) sessions kept parked, the size of the pool if None (default: None)
+        :param warm: (bool) whether the sessions are started right away (default: True)
+        :param kwargs: passed on to ComputeSession and run_vasp_calculation
+        """
+        if key in self._sets:
+            raise KeyError(f'The input set {key!r} is already registered')
+        input_set = self._sets[key] = InputSet(key, structure, (incar, kpoints, potcar), self._size if size is None else size, kwargs)
+        if warm:
+            self._replenish(input_set)
+        return input_set
+
+    def _spawn_task(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _replenish(self, input_set):
+        if self._closed:
+            return
+        missing = input_set.size + len(input_set.waiters) - len(input_set.parked) - input_set.starting
+        for _ in range(max(0, missing)):
+            input_set.starting += 1
+            self._spawn_task(self._start(input_set))
+
+    async def _start(self, input_set):
+        input_set.count += 1
+        directory = os.path.join(self._directory, input_set.key, f'session-{input_set.count}')
+        session = ComputeSession(input_set.structure, *input_set.inputs, directory=directory, **input_set.kwargs)
+        try:
+            await session.start()
+        except Exception as e:
+            input_set.starting -= 1
+            self._stats['failed'] += 1
+            logging.exception(f'A session of {input_set.key} failed to start')
+            # the other starts would most likely fail as well, no waiter must wait for a session which never comes
+            while input_set.waiters:
+                waiter = input_set.waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(e)
+            self._schedule_retry(input_set)
+            return
+        input_set.starting -= 1
+        input_set.failures = 0
+        self._stats['started'] += 1
+        self._owner[session] = input_set
+        self._park(input_set, session)
+
+    def _schedule_retry(self, input_set):
+        # the starts failing together count as one failure
+        if self._closed or input_set.retry is not None:
+            return
+        input_set.failures += 1
+        delay = min(self._retry_delay * 2 ** (input_set.failures - 1), self._max_retry_delay)
+        logging.info(f'Starting sessions of {input_set.key} again in {delay:.1f}s')
+        input_set.retry = asyncio.get_running_loop().call_later(delay, self._retry, input_set)
+
+    def _retry(self, input_set):
+        input_set.retry = None
+        self._replenish(input_set)
+
+    def _park(self, input_set, session):
+        if self._closed:
+            self._spawn_task(session.close())
+            return
+        while input_set.waiters:
+            waiter = input_set.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(session)
+                return
+        # a session started for a waiter which got one handed back is not needed
+        if len(input_set.parked) >= input_set.size:
+            self._retire(input_set, session)
+            return
+        timer = None if self._ttl is None else asyncio.get_running_loop().call_later(self._ttl, self._retire, input_set, session)
+        input_set.parked.append((session, timer))
+
+    def _retire(self, input_set, session):
+        for entry in input_set.parked:
+            if entry[0] is session:
+                input_set.parked.remove(entry)
+                break
+        self._stats['retired'] += 1
+        self._owner.pop(session, None)
+        self._spawn_task(session.close())
+
+    async def acquire(self, key):
+        """
+        :return: (ComputeSession) a started session of the input set, parked or the next one to start
+        """
+        if self._closed:
+            raise RuntimeError('The pool is closed')
+        input_set = self._sets[key]
+        while input_set.parked:
+            session, timer = input_set.parked.popleft()
+            if timer is not None:
+                timer.cancel()
+            if session.running:
+                self._stats['hits'] += 1
+                self._replenish(input_set)
+                return session
+            self._owner.pop(session, None)
+        self._stats['misses'] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        input_set.waiters.append(waiter)
+        self._replenish(input_set)
+        return await waiter
+
+    async def release(self, session):
+        """
+        Parks a session again, unless it died or enough sessions are parked
+        """
+        input_set = self._owner.get(session)
+        if input_set is None or not session.running:
+            self._owner.pop(session, None)
+            await session.close()
+            return
+        self._park(input_set, session)
+
+    @contextlib.asynccontextmanager
+    async def session(self, key):
+        session = await self.acquire(key)
+        try:
+            yield session
+        finally:
+            await self.release(session)
+
+    async def close(self):
+        """
+        Stops all parked sessions, sessions still starting are stopped once they are started
+        """
+        self._closed = True
+        for input_set in self._sets.values():
+            if input_set.retry is not None:
+                input_set.retry.cancel()
+            while input_set.parked:
+                session, timer = input_set.parked.popleft()
+                if timer is not None:
+                    timer.cancel()
+                self._spawn_task(session.close())
+            while input_set.waiters:
+                waiter = input_set.waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(RuntimeError('The pool is closed'))
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -0,0 +1,268 @@
+"""
+Detects a VASP which stopped making progress, e.g. because an MPI rank hangs, and ends it instead of waiting
+forever. The Watchdog follows the parser of the process through the phases of an ionic step and applies a
+deadline to each of them
+
+    setup       from the launch until "entering main loop"
+    scf         from the positions read (or the main loop) until the FORCES block
+    forces      from the FORCES block until the summary line
+    positions   from writing the positions until VASP confirmed reading them
+
+Waiting for the driver to produce the next structure is not limited. In addition step limits the time from the
+start of the work on a step until its summary and silence the time since the last line matched by the parser
+while VASP computes. Once a limit is exceeded the process group of VASP is terminated, killed after grace seconds,
+and a Stall is passed to the on_stall callbacks
+
+    watchdog = Watchdog(scf=1800, forces=600, positions=60, silence=900)
+    await run_vasp_calculation(..., watchdog=watchdog)
+
+run_watched restarts VASP after a stall, the structure in flight becomes the POSCAR of the new process.
+A Watchdog watches one process at a time, VaspPool gives each of its workers a copy
+"""
+import enum
+import time
+import signal
+import asyncio
+import logging
+import collections
+from .vasp import VaspInteractiveProcess
+from .inputs import structure_arrays
+from .runner import run_vasp_calculation
+from .structures import StructureSource
+
+Callback = VaspInteractiveProcess.Callback
+
+
+class Phase(enum.Enum):
+
+    Setup = 'setup'
+    Scf = 'scf'
+    Forces = 'forces'
+    # VASP waits for the driver, this phase has no deadline
+    Structure = 'structure'
+    Positions = 'positions'
+
+
+# the phases in which VASP computes and is expected to print
+COMPUTING = (Phase.Scf, Phase.Forces)
+
+Stall = collections.namedtuple('Stall', ('limit', 'phase', 'elapsed', 'deadline', 'since_line', 'since_step', 'ionic_step', 'positions'))
+Stall.__doc__ = """
+A limit which was exceeded. limit is the name of the phase, "step" or "silence", positions are the positions of the
+structure in flight, None if VASP was told to stop
+"""
+
+
+class Watchdog(object):
+
+    def __init__(self, setup=None, scf=None, forces=None, positions=None, step=None, silence=None, interval=None, grace=10.0, on_stall=None):
+        """
+        :param setup, scf, forces, positions: (float) seconds a phase may last, unlimited if None (default: None)
+        :param step: (float) seconds from the start of the work on a step until its summary (default: None)
+        :param silence: (float) seconds without a line matched while VASP computes (default: None)
+        :param interval: (float) seconds between two checks, a tenth of the shortest limit if None (default: None)
+        :param grace: (float) seconds between terminating and killing the process group (default: 10.0)
+        :param on_stall: (callable or sequence of callables) called with the Stall (default: None)
+        """
+        self._deadlines = {Phase.Setup: setup, Phase.Scf: scf, Phase.Forces: forces, Phase.Positions: positions}
+        self._step_limit = step
+        self._silence = silence
+        limits = [limit for limit in (setup, scf, forces, positions, step, silence) if limit is not None]
+        self._interval = interval if interval is not None else (min(limits) / 10 if limits else None)
+        self._grace = grace
+        self._on_stall = tuple(on_stall) if isinstance(on_stall, (tuple, list)) else ((on_stall,) if on_stall is not None else ())
+        self._process = None
+        self._task = None
+        self._stall = None
+        self._stalls = []
+        self._reset(time.monotonic())
+
+    def copy(self):
+        """
+        :return: (Watchdog) a watchdog with the same limits and callbacks
+        """
+        return Watchdog(**{phase.value: deadline for phase, deadline in self._deadlines.items()}, step=self._step_limit, silence=self._silence,
+                        interval=self._interval, grace=self._grace, on_stall=self._on_stall)
+
+    def _reset(self, now):
+        self._phase = Phase.Setup
+        self._phase_start = now
+        self._step_start = None
+        self._last_line = now
+        self._last_step = now
+        self._ionic_step = None
+        self._exiting = False
+
+    @property
+    def phase(self):
+        return self._phase
+
+    @property
+    def since_line(self):
+        """
+        (float) seconds since the parser matched the last line
+        """
+        return time.monotonic() - self._last_line
+
+    @property
+    def since_step(self):
+        """
+        (float) seconds since the last ionic step was finished, or since the start
+        """
+        return time.monotonic() - self._last_step
+
+    @property
+    def stall(self):
+        """
+        (Stall) the stall of the process watched last, None if it did not stall
+        """
+        return self._stall
+
+    @property
+    def stalls(self):
+        """
+        (list of Stall) all stalls detected by this watchdog
+        """
+        return self._stalls
+
+    def _enter(self, phase, now):
+        if phase is not self._phase:
+            self._phase, self._phase_start = phase, now
+
+    def transition(self, cb, *args, **kwargs):
+        """
+        Called by VaspInteractiveProcess before the callbacks of cb are run
+        """
+        now = time.monotonic()
+        if cb is Callback.MainLoopStarted:
+            self._enter(Phase.Scf, now)
+            self._step_start = now
+        elif cb is Callback.IonicStepStarted:
+            self._enter(Phase.Scf, now)
+            self._ionic_step = args[0] if args else None
+        elif cb is Callback.IonForceRead:
+            self._enter(Phase.Forces, now)
+        elif cb is Callback.IonicStepFinished:
+            # a step answered from the result cache was not computed by VASP
+            if (kwargs.get('data') or {}).get('cached'):
+                return
+            self._enter(Phase.Structure, now)
+            self._step_start = None
+            self._last_step = now
+        elif cb is Callback.FeedPositionsStarted:
+            self._enter(Phase.Positions, now)
+            self._step_start = now
+        elif cb is Callback.FeedPositionsFinished:
+            self._enter(Phase.Scf, now)
+        elif cb is Callback.Exit:
+            self._exiting = True
+
+    def forces_started(self):
+        self._enter(Phase.Forces, time.monotonic())
+
+    def line_matched(self):
+        self._last_line = time.monotonic()
+
+    def check(self, now=None):
+        """
+        :return: (Stall) the limit exceeded, None if all limits are kept
+        """
+        now = time.monotonic() if now is None else now
+        phase, elapsed = self._phase, now - self._phase_start
+        limits = [(phase.value, elapsed, self._deadlines.get(phase))]
+        if self._step_start is not None:
+            limits.append(('step', now - self._step_start, self._step_limit))
+        if phase in COMPUTING:
+            limits.append(('silence', now - self._last_line, self._silence))
+        for limit, value, deadline in limits:
+            if deadline is not None and value > deadline:
+                positions = None if self._exiting or self._process is None else self._process.positions
+                return Stall(limit, phase, value, deadline, now - self._last_line, now - self._last_step, self._ionic_step, positions)
+        return None
+
+    def start(self, process):
+        """
+        Starts watching process, called by VaspInteractiveProcess once VASP was launched
+        """
+        self.stop()
+        self._process = process
+        self._stall = None
+        self._reset(time.monotonic())
+        if self._interval is not None:
+            self._task = asyncio.ensure_future(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            stall = self.check()
+            if stall is not None:
+                break
+        self._stall = stall
+        self._stalls.append(stall)
+        logging.error(f'VASP stalled in the {stall.phase.value} phase of ionic step {stall.ionic_step}: {stall.limit} took {stall.elapsed:.1f}s, '
+                      f'the limit is {stall.deadline}s, the last line was matched {stall.since_line:.1f}s ago')
+        for f in self._on_stall:
+            try:
+                f(stall)
+            except Exception:
+                logging.exception(f'Stall callback {f!r} failed')
+        process = self._process
+        process.signal_group(signal.SIGTERM)
+        await asyncio.sleep(self._grace)
+        if process.returncode is None:
+            logging.error(f'VASP did not terminate within {self._grace}s, killing it')
+            process.signal_group(signal.SIGKILL)
+
+
+def with_positions(structure, positions):
+    """
+    :return: (tuple) the lattice and the species of structure with positions, as accepted for the POSCAR
+    """
+    lattice, symbols, _ = structure_arrays(structure)
+    return lattice, symbols, positions
+
+
+async def run_watched(gen_structure, incar, kpoints, potcar, watchdog=None, restarts=1, structure_executor=None, **kwargs):
+    """
+    Runs run_vasp_calculation under a watchdog and restarts VASP at most restarts times after a stall. The structure
+    in flight is written as POSCAR of the restarted process, the stream of structures continues after it
+    :param watchdog: (Watchdog) the limits, watchdog=Watchdog() only follows the phases (default: None)
+    :return: (VaspInteractiveProcess) the last process
+    """
+    watchdog = Watchdog() if watchdog is None else watchdog
+    source = StructureSource(gen_structure, executor=structure_executor)
+    first, in_flight = None, None
+
+    async def next_structure(process):
+        nonlocal first, in_flight
+        if in_flight is not None:
+            structure, in_flight = in_flight, None
+            return structure
+        structure, exhausted = await source.next_async(process)
+        if exhausted:
+            raise StopAsyncIteration
+        if first is None:
+            # the lattice and the species of a restarted POSCAR
+            first = structure
+        return structure
+
+    try:
+        for attempt in range(restarts + 1):
+            process = await run_vasp_calculation(next_structure, incar, kpoints, potcar, watchdog=watchdog, **kwargs)
+            stall = watchdog.stall
+            if stall is None or stall.positions is None:
+                break
+            elif attempt == restarts:
+                logging.error(f'VASP stalled {attempt + 1} times, giving up')
+                break
+            logging.warning(f'Restarting VASP with the structure of ionic step {stall.ionic_step}')
+            in_flight = with_positions(first, stall.positions)
+    finally:
+        # the source outlives the single runs, its executor is shut down once all restarts are done
+        source.cancel()
+    return process
@@ -0,0 +1,42 @@
+"""
+Inputs shared by the tests, VASP is replaced by interactive/fake.py
+"""
+import os
+import asyncio
+import numpy as np
+from benchmarks.common import fake_vasp_command
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POTCAR = os.path.join(REPOSITORY, 'examples', 'mul-hpc', 'POTCAR')
+# complete, such that the runner does not warn about the tags it sets
+INCAR = dict(ENCUT=400, ISYM=0, IBRION=11, POTIM=0.0, NSW=1000000, INTERACTIVE=True)
+KPOINTS = (2, 2, 2)
+NATOMS = 4
+LATTICE = 4.05 * np.eye(3)
+REFERENCE = np.array([[0.0, 0.0, 0.0], [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]])
+
+
+def structure(i):
+    """
+    :return: (tuple) the i-th structure of a displaced fcc cell, as written to the POSCAR
+    """
+    return LATTICE, ['Al'] * NATOMS, REFERENCE + 0.01 * i
+
+
+def structures(n, start=0):
+    return iter([structure(i) for i in range(start, n)])
+
+
+def command(**options):
+    return fake_vasp_command(natoms=NATOMS, **options)
+
+
+def quiet(**kwargs):
+    """
+    :return: (dict) keyword arguments of run_vasp_calculation which keep the output of VASP off the terminal
+    """
+    return dict(dict(stdout=(), stderr=(), stdin=None), **kwargs)
+
+
+def run(coro, timeout=60):
+    return asyncio.run(asyncio.wait_for(coro, timeout))
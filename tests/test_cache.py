@@ -0,0 +1,99 @@
+import sqlite3
+import numpy as np
+from interactive.cache import ResultCache
+from interactive.runner import run_vasp_calculation
+from .common import INCAR, KPOINTS, POTCAR, NATOMS, structures, command, quiet, run
+
+
+def positions(i):
+    return np.full((NATOMS, 3), 0.01 * i)
+
+
+def stored_size(cache):
+    return sum(size for size, in cache._connection.execute('SELECT size FROM results'))
+
+
+def put(cache, i):
+    cache.put('inputs', positions(i), dict(step=i, F=float(i)), forces=np.zeros((NATOMS, 3)), nscf=1)
+
+
+def test_hit_and_miss(tmp_path):
+    with ResultCache(str(tmp_path / 'cache.db')) as cache:
+        assert cache.get('inputs', positions(0)) is None
+        put(cache, 0)
+        result = cache.get('inputs', positions(0) + 1e-9)
+        assert result['summary'] == dict(step=0, F=0.0)
+        np.testing.assert_array_equal(result['forces'], np.zeros((NATOMS, 3)))
+        # positions are compared within the unit cell, other inputs are another entry
+        assert cache.get('inputs', positions(0) + 1.0) is not None
+        assert cache.get('other inputs', positions(0)) is None
+        assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    with ResultCache(str(tmp_path / 'cache.db'), access_batch=1) as cache:
+        put(cache, 0)
+        entry = cache.size
+        cache._max_size = 3 * entry
+        put(cache, 1)
+        put(cache, 2)
+        # the first entry was used last, the second one goes
+        assert cache.get('inputs', positions(0)) is not None
+        put(cache, 3)
+        assert len(cache) == 3
+        assert cache.get('inputs', positions(1)) is None
+        assert all(cache.get('inputs', positions(i)) is not None for i in (0, 2, 3))
+        assert cache.size == stored_size(cache) <= 3 * entry
+
+
+def test_total_size_is_kept_up_to_date(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    # a database written before the total was kept
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE results (key TEXT PRIMARY KEY, summary TEXT, forces BLOB, nscf INTEGER, size INTEGER, accessed REAL)')
+    connection.execute("INSERT INTO results VALUES ('old', '{}', NULL, 1, 100, 0)")
+    connection.commit()
+    connection.close()
+    with ResultCache(path) as cache:
+        assert cache.size == 100
+        put(cache, 0)
+        put(cache, 1)
+        assert cache.size == stored_size(cache)
+        # replaced, not counted twice
+        cache.put('inputs', positions(0), dict(step=0, F=0.0, E0=0.0), forces=None)
+        assert len(cache) == 3
+        assert cache.size == stored_size(cache)
+        cache.clear()
+        assert cache.size == len(cache) == 0
+
+
+def test_access_times_are_written_in_batches(tmp_path):
+    with ResultCache(str(tmp_path / 'cache.db'), access_batch=3) as cache:
+        for i in range(3):
+            put(cache, i)
+
+        def accessed():
+            return dict(cache._connection.execute('SELECT key, accessed FROM results'))
+
+        before = accessed()
+        cache.get('inputs', positions(0))
+        cache.get('inputs', positions(1))
+        assert accessed() == before
+        cache.get('inputs', positions(2))
+        assert all(accessed()[key] >= before[key] for key in before)
+        assert accessed() != before
+
+
+def test_cached_steps_of_a_run(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.db'))
+    kwargs = quiet(directory=str(tmp_path / 'run'), executable=command(), cache=cache)
+    first = run(run_vasp_calculation(structures(6, start=3), INCAR, KPOINTS, POTCAR, **kwargs))
+    second = run(run_vasp_calculation(structures(6), INCAR, KPOINTS, POTCAR, **kwargs))
+    cache.close()
+    assert first.returncode == second.returncode == 0
+    assert cache.hits >= 2
+    steps = second.ionic_steps
+    # the cached steps are numbered like the computed ones
+    np.testing.assert_array_equal(steps.step, np.arange(1, len(steps) + 1))
+    np.testing.assert_allclose(steps.E0[3:5], first.ionic_steps.E0[:2])
+    np.testing.assert_allclose(steps.forces[3:5], first.ionic_steps.forces[:2])
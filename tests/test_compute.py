@@ -0,0 +1,65 @@
+import asyncio
+import numpy as np
+import pytest
+from interactive.compute import ComputeSession, SessionClosed
+from interactive.fake import FakeVasp
+from .common import INCAR, KPOINTS, POTCAR, NATOMS, REFERENCE, structure, command, quiet, run
+
+
+def session(tmp_path, **options):
+    return ComputeSession(structure(0), INCAR, KPOINTS, POTCAR, directory=str(tmp_path), executable=command(**options), **quiet())
+
+
+def test_concurrent_requests_are_answered_in_order(tmp_path):
+    requests = [REFERENCE + 0.002 * i for i in range(1, 11)]
+    order = []
+
+    async def compute(s, i):
+        data = await s.compute_step(requests[i])
+        order.append(i)
+        return data
+
+    async def main():
+        async with session(tmp_path) as s:
+            initial = await s.initial
+            results = await asyncio.gather(*(compute(s, i) for i in range(len(requests))))
+            assert s.pending == 0
+            return initial, results
+
+    initial, results = run(main())
+    assert initial['summary']['step'] == 1
+    assert order == sorted(order)
+    fake = FakeVasp(natoms=NATOMS)
+    for positions, data in zip(requests, results):
+        energy, forces = fake.evaluate(positions.tolist())
+        np.testing.assert_allclose(data['positions'], positions, atol=1e-6)
+        assert data['summary']['F'] == pytest.approx(energy, abs=1e-6)
+        np.testing.assert_allclose(data['forces'], forces, atol=1e-6)
+    np.testing.assert_array_equal([data['summary']['step'] for data in results], np.arange(2, 12))
+
+
+def test_invalid_positions_are_rejected(tmp_path):
+
+    async def main():
+        async with session(tmp_path) as s:
+            with pytest.raises(ValueError):
+                await s.compute(np.zeros((NATOMS + 1, 3)))
+            # the session is still usable
+            energy, forces = await s.compute(REFERENCE)
+            assert forces.shape == (NATOMS, 3)
+        with pytest.raises(SessionClosed):
+            await s.compute(REFERENCE)
+
+    run(main())
+
+
+def test_crash_fails_the_pending_requests(tmp_path):
+
+    async def main():
+        s = session(tmp_path, crash_after=3)
+        await s.start()
+        return await asyncio.gather(*(s.compute(REFERENCE + 0.01 * i) for i in range(4)), return_exceptions=True)
+
+    results = run(main())
+    assert not isinstance(results[0], Exception)
+    assert all(isinstance(result, SessionClosed) for result in results[2:])
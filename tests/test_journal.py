@@ -0,0 +1,73 @@
+import os
+import numpy as np
+from interactive.cache import ResultCache
+from interactive.inputs import read_incar
+from interactive.journal import StepJournal
+from interactive.runner import run_vasp_calculation
+from .common import INCAR, KPOINTS, POTCAR, structures, command, quiet, run
+
+
+def run_journaled(directory, executable, resume, **kwargs):
+    seen = []
+    callbacks = dict(next_structure=lambda index, positions: seen.append(index))
+    process = run(run_vasp_calculation(structures(6), INCAR, KPOINTS, POTCAR, directory=directory, executable=executable, journal_file='journal.jsonl', resume=resume, callbacks=callbacks, **quiet(**kwargs)))
+    return process, seen
+
+
+def test_resume_skips_completed_structures(tmp_path):
+    directory = str(tmp_path)
+    crashed, seen = run_journaled(directory, command(crash_after=3), resume=False)
+    assert crashed.returncode != 0
+    assert seen == [0, 1, 2]
+    journal = StepJournal(os.path.join(directory, 'journal.jsonl'), resume=True)
+    assert sorted(journal.completed) == [0, 1]
+    assert journal.resume_index == 2
+    journal.close()
+
+    # VASP left its wavefunctions behind
+    with open(os.path.join(directory, 'WAVECAR'), 'w') as h:
+        h.write('wavefunctions')
+    resumed, seen = run_journaled(directory, command(), resume=True)
+    assert resumed.returncode == 0
+    assert seen == [2, 3, 4, 5]
+    assert read_incar(os.path.join(directory, 'INCAR')).get('ISTART') == 1
+    journal = StepJournal(os.path.join(directory, 'journal.jsonl'), resume=True)
+    assert sorted(journal.completed) == list(range(6))
+    journal.close()
+
+    # nothing is left to do, VASP is not started
+    finished, seen = run_journaled(directory, command(), resume=True)
+    assert finished.returncode is None
+    assert seen == []
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with StepJournal(path) as journal:
+        for index in range(3):
+            journal.structure(index)
+            journal.step(index + 1, data=dict(summary=dict(step=index + 1)), scf_steps=5)
+    with open(path, 'a') as h:
+        h.write('{"event": "step", "ind')
+    with StepJournal(path, resume=True) as journal:
+        assert journal.resume_index == 3
+        assert journal.completed[2]['ionic_step'] == 3
+
+
+def test_resumed_run_uses_the_cache(tmp_path):
+    directory = str(tmp_path / 'run')
+    path = str(tmp_path / 'cache.db')
+    with ResultCache(path) as cache:
+        first, _ = run_journaled(directory, command(), resume=False, cache=cache)
+    assert first.returncode == 0
+    with open(os.path.join(directory, 'WAVECAR'), 'w') as h:
+        h.write('wavefunctions')
+    # the journal is lost, the cache still knows the results of the first run despite the restart tags
+    os.remove(os.path.join(directory, 'journal.jsonl'))
+    with ResultCache(path) as cache:
+        resumed, seen = run_journaled(directory, command(), resume=True, cache=cache)
+        hits = cache.hits
+    assert resumed.returncode == 0
+    assert seen == list(range(6))
+    assert hits >= 5
+    np.testing.assert_allclose(resumed.ionic_steps.E0[:6], first.ionic_steps.E0[:6])
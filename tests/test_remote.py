@@ -0,0 +1,93 @@
+import os
+import sys
+import shlex
+import signal
+import asyncio
+import numpy as np
+import pytest
+from interactive.remote import VaspServer
+from interactive.runner import run_vasp_calculation
+from .common import REPOSITORY, INCAR, KPOINTS, POTCAR, structures, command, quiet, run
+
+
+async def start_worker(server, directory, vasp_command, token=None):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (REPOSITORY, os.environ.get('PYTHONPATH')))))
+    env.pop('INTERACTIVE_VASP_TOKEN', None)
+    if token is not None:
+        env['INTERACTIVE_VASP_TOKEN'] = token
+    return await asyncio.create_subprocess_exec(sys.executable, '-m', 'interactive.remote', '--connect', server.address, '--directory', directory,
+                                                '--', *shlex.split(vasp_command), env=env)
+
+
+async def run_remote(directory, address='127.0.0.1:0', steps=6, vasp_command=None, **kwargs):
+    async with VaspServer(address, token='secret') as server:
+        worker = await start_worker(server, os.path.join(directory, 'worker'), vasp_command or command(), token='secret')
+        connection = await server.accept()
+        process = await run_vasp_calculation(structures(steps), INCAR, KPOINTS, POTCAR, directory=os.path.join(directory, 'driver'), worker=connection, **quiet(**kwargs))
+        await connection.close()
+    await asyncio.wait_for(worker.wait(), 10)
+    return process, connection
+
+
+@pytest.mark.parametrize('address', ['127.0.0.1:0', 'unix'])
+def test_round_trip_matches_local_run(tmp_path, address):
+    if address == 'unix':
+        address = f'unix:{tmp_path / "server.sock"}'
+    local = run(run_vasp_calculation(structures(6), INCAR, KPOINTS, POTCAR, directory=str(tmp_path / 'local'), executable=command(), **quiet()))
+    remote, connection = run(run_remote(str(tmp_path), address=address))
+    assert remote.returncode == local.returncode == 0
+    assert len(remote.ionic_steps) == len(local.ionic_steps)
+    np.testing.assert_allclose(remote.ionic_steps.E0, local.ionic_steps.E0)
+    np.testing.assert_allclose(remote.ionic_steps.forces, local.ionic_steps.forces)
+    # the worker announced the command it runs
+    assert connection.info['command'] == command()
+
+
+def test_pid_of_the_remote_vasp(tmp_path):
+    pids = []
+
+    async def main():
+        async with VaspServer(token='secret') as server:
+            worker = await start_worker(server, str(tmp_path / 'worker'), command(), token='secret')
+            connection = await server.accept()
+            handle = await connection.start()
+            pids.append(handle.pid)
+            handle.terminate()
+            pids.append(await handle.wait())
+            await connection.close()
+        await asyncio.wait_for(worker.wait(), 10)
+
+    run(main())
+    pid, returncode = pids
+    assert isinstance(pid, int) and pid > 0
+    assert returncode == -signal.SIGTERM
+
+
+def test_signal_reaches_the_remote_process_group(tmp_path):
+    stalled = []
+
+    async def main():
+        async with VaspServer(token='secret') as server:
+            worker = await start_worker(server, str(tmp_path / 'worker'), command(hang_after=2), token='secret')
+            connection = await server.accept()
+            task = asyncio.ensure_future(run_vasp_calculation(structures(6), INCAR, KPOINTS, POTCAR, directory=str(tmp_path / 'driver'), worker=connection, **quiet()))
+            await asyncio.sleep(1.0)
+            connection._handle.send_signal(signal.SIGKILL)
+            stalled.append(await task)
+            await connection.close()
+        await asyncio.wait_for(worker.wait(), 10)
+
+    run(main())
+    assert stalled[0].returncode == -signal.SIGKILL
+
+
+def test_worker_with_a_wrong_token_is_rejected(tmp_path):
+
+    async def main():
+        async with VaspServer(token='secret') as server:
+            worker = await start_worker(server, str(tmp_path / 'worker'), command(), token='wrong')
+            await asyncio.wait_for(worker.wait(), 10)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(server.accept(), 0.5)
+
+    run(main())
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from interactive.trajectory import Trajectory, Retention
+from interactive.runner import run_vasp_calculation
+from .common import INCAR, KPOINTS, POTCAR, NATOMS, structures, command, quiet, run
+
+
+def record(i, natoms=NATOMS):
+    return dict(
+        summary=dict(step=i + 1, F=-float(i), E0=-float(i), dE=0.0),
+        scf=[dict(algo='DAV', step=1, E=-float(i), dE=0.0, deps=0.0, ncg=8, rms=0.1, rmsc=None)],
+        positions=np.full((natoms, 3), float(i)),
+        forces=np.full((natoms, 3), -float(i))
+    )
+
+
+def fill(trajectory, n):
+    for i in range(n):
+        trajectory.append(record(i))
+    return trajectory
+
+
+def test_all_keeps_every_step():
+    trajectory = fill(Trajectory(), 40)
+    assert len(trajectory) == trajectory.count == 40
+    np.testing.assert_array_equal(trajectory.step, np.arange(1, 41))
+    assert trajectory.forces.shape == (40, NATOMS, 3)
+    assert len(trajectory.scf) == 40
+
+
+def test_last_keeps_a_ring():
+    trajectory = fill(Trajectory(Retention.Last, maxlen=5), 12)
+    assert len(trajectory) == 5
+    assert trajectory.count == 12
+    np.testing.assert_array_equal(trajectory.step, np.arange(8, 13))
+    np.testing.assert_array_equal(trajectory.positions[:, 0, 0], np.arange(7, 12))
+    assert trajectory[0]['summary']['step'] == 8
+    assert trajectory[-1]['summary']['step'] == 12
+
+
+def test_downsample_keeps_every_stride_th_step():
+    trajectory = fill(Trajectory('downsample', stride=3), 10)
+    assert trajectory.count == 10
+    np.testing.assert_array_equal(trajectory.step, [1, 4, 7, 10])
+    assert len(trajectory.forces) == 4
+
+
+def test_summary_keeps_no_arrays():
+    trajectory = fill(Trajectory(Retention.Summary), 5)
+    assert len(trajectory) == 5
+    assert trajectory.positions is None and trajectory.forces is None
+    assert 'forces' not in trajectory[0]
+    np.testing.assert_array_equal(trajectory.nscf, np.ones(5))
+
+
+def test_last_requires_maxlen():
+    with pytest.raises(ValueError):
+        Trajectory(Retention.Last)
+
+
+def test_ring_items_are_copies():
+    trajectory = fill(Trajectory(Retention.Last, maxlen=3), 3)
+    forces, column = trajectory[0]['forces'], trajectory.forces
+    fill(trajectory, 3)
+    # the slots were overwritten since, what was handed out before must not change
+    np.testing.assert_array_equal(forces, np.zeros((NATOMS, 3)))
+    np.testing.assert_array_equal(column[:, 0, 0], [0.0, -1.0, -2.0])
+
+
+@pytest.mark.parametrize('name', ['forces', 'positions'])
+def test_misaligned_step_is_rejected(name):
+    trajectory = fill(Trajectory(), 3)
+    bad = record(3)
+    bad[name] = np.zeros((NATOMS + 1, 3))
+    with pytest.raises(ValueError):
+        trajectory.append(bad)
+    # nothing of the rejected step was stored, the columns stay aligned
+    assert len(trajectory) == trajectory.count == 3
+    assert len(trajectory.forces) == len(trajectory.positions) == len(trajectory.scf) == 3
+    trajectory.append(record(3))
+    assert len(trajectory) == 4
+    np.testing.assert_array_equal(trajectory.step, [1, 2, 3, 4])
+
+
+def test_first_step_needs_arrays():
+    trajectory = Trajectory()
+    with pytest.raises(ValueError):
+        trajectory.append(dict(summary=dict(step=1, F=0.0, E0=0.0, dE=0.0)))
+    assert len(trajectory) == trajectory.count == 0
+
+
+def test_retention_of_a_run(tmp_path):
+    process = run(run_vasp_calculation(structures(8), INCAR, KPOINTS, POTCAR, directory=str(tmp_path), executable=command(), trajectory=Trajectory(Retention.Last, maxlen=3), **quiet()))
+    assert process.returncode == 0
+    trajectory = process.ionic_steps
+    # VASP finishes one more step once the STOPCAR is written
+    assert trajectory.count == 9
+    assert len(trajectory) == 3
+    np.testing.assert_array_equal(trajectory.step, [7, 8, 9])
+    assert trajectory.forces.shape == (3, NATOMS, 3)
+    assert np.isfinite(trajectory.E0).all()
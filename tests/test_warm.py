@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import pytest
+from interactive.warm import WarmPool
+from .common import INCAR, KPOINTS, POTCAR, REFERENCE, structure, command, quiet, run
+
+
+def register(pool, key='al', **kwargs):
+    options = quiet(executable=command())
+    options.update(kwargs)
+    return pool.register(key, structure(0), INCAR, KPOINTS, POTCAR, **options)
+
+
+async def until(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.02)
+
+
+def test_parked_session_is_handed_out(tmp_path):
+
+    async def main():
+        async with WarmPool(size=1, directory=str(tmp_path)) as pool:
+            register(pool)
+            await until(lambda: pool.parked('al') == 1)
+            async with pool.session('al') as session:
+                energy, forces = await session.compute(REFERENCE + 0.01)
+                # a replacement is started in the background
+                await until(lambda: pool.parked('al') == 1)
+            # the session handed back is one too many
+            return pool.stats, pool.parked('al')
+
+    stats, parked = run(main())
+    assert stats['hits'] == 1 and stats.get('misses', 0) == 0
+    assert stats['started'] == 2 and stats['retired'] == 1
+    assert parked == 1
+
+
+def test_parked_sessions_are_retired_after_the_ttl(tmp_path):
+
+    async def main():
+        async with WarmPool(size=2, ttl=0.5, directory=str(tmp_path)) as pool:
+            register(pool)
+            await until(lambda: pool.parked('al') == 2)
+            await until(lambda: pool.parked('al') == 0)
+            retired = pool.stats['retired']
+            # the next caller waits for a cold start
+            async with pool.session('al') as session:
+                await session.compute(REFERENCE)
+            return retired, pool.stats
+
+    retired, stats = run(main())
+    assert retired == 2
+    assert stats['misses'] == 1
+
+
+def test_failed_start_fails_all_waiters_and_is_retried(tmp_path, caplog):
+    caplog.set_level(logging.CRITICAL)
+
+    async def main():
+        async with WarmPool(size=1, directory=str(tmp_path), retry_delay=0.2) as pool:
+            input_set = register(pool, warm=False, executable=str(tmp_path / 'missing' / 'vasp'))
+            results = await asyncio.wait_for(asyncio.gather(*(pool.acquire('al') for _ in range(3)), return_exceptions=True), 10)
+            failures = input_set.failures
+            # the retry starts the input set again, once it can be started
+            input_set.kwargs['executable'] = command()
+            await until(lambda: pool.parked('al') == 1)
+            return results, failures, input_set.failures, pool.stats
+
+    results, failures, after, stats = run(main())
+    assert all(isinstance(result, Exception) for result in results)
+    # the starts failing together count as one failure
+    assert failures == 1
+    assert after == 0
+    assert stats['failed'] >= 1 and stats['started'] == 1
+
+
+def test_closed_pool_rejects_callers(tmp_path):
+
+    async def main():
+        pool = WarmPool(size=1, directory=str(tmp_path))
+        register(pool, warm=False)
+        await pool.close()
+        with pytest.raises(RuntimeError):
+            await pool.acquire('al')
+
+    run(main())